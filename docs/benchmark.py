@@ -0,0 +1,644 @@
+"""
+API 路由离线压测脚本
+
+在进程内挂载 routes.router（httpx ASGITransport，不经过网络），并以可配置延迟的
+假实现替换 LlamaAgentsRoutingAgent / VectorStoreService / ChatStoreService /
+IngestionHandler，因此无需模型、向量库或 MinerU 即可重复运行。
+
+场景：
+- chat_storm: 并发多轮 /chat
+- bulk_upload: 并发上传 Markdown 与 PDF（PDF 经过预处理进程池）并轮询 /upload/status、/tasks
+- sidebar_refresh: 并发读取会话列表、历史与会话信息
+- document_tree: 大量文档下分页读取 /documents
+
+每个场景输出各路由的 p50/p95/p99 延迟、错误数、整体 RPS 与场景期间的峰值 RSS
+（采样当前进程及预处理子进程的常驻内存之和），结果写入 JSON；
+指定 --baseline 时与历史结果比较，p95 上升或 RPS 下降超过 --threshold 视为回归，
+脚本以退出码 1 结束。
+
+用法：
+    python docs/benchmark.py --output bench/latest.json
+    python docs/benchmark.py --scenarios chat_storm --concurrency 64 --baseline bench/main.json
+
+依赖：fastapi、httpx、llama-index-core、werkzeug（与后端相同的运行环境）。
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import types
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import subprocess
+import multiprocessing
+from datetime import datetime
+from typing import Optional
+
+
+SCENARIOS = ('chat_storm', 'bulk_upload', 'sidebar_refresh', 'document_tree')
+
+
+# ========== 假服务 ==========
+
+class FakeLatency:
+    """各假服务的调用延迟（秒）"""
+
+    agent = 0.05
+    tool = 0.02
+    chat_store = 0.002
+    vector_store = 0.005
+    preprocess = 0.2
+    index = 0.05
+
+
+class FakeAgent:
+    """模拟路由代理：按延迟推送 router.decision / tool_call / tool_result 事件后返回回答"""
+
+    async def aquery_with_context(self, query, ctx, chat_memory=None, on_event=None):
+        async def emit(event_type, content='', extra=None):
+            if on_event is not None:
+                await on_event(event_type, content, extra)
+
+        await asyncio.sleep(FakeLatency.agent * 0.2)
+        await emit('router.decision', 'knowledge', {'query_type': 'knowledge'})
+        await emit('tool_call', 'retrieve', {'tool_name': 'knowledge_search'})
+        await asyncio.sleep(FakeLatency.tool)
+        await emit('tool_result', 'ok', {'tool_name': 'knowledge_search'})
+        await asyncio.sleep(FakeLatency.agent * 0.8)
+        history = len(chat_memory.get_all()) if chat_memory is not None else 0
+        return {
+            'answer': f'answer to {query} (history={history})',
+            'raw_response': 'fake',
+            'query_type': 'knowledge',
+            'engines_used': ['knowledge'],
+            'enhancement_applied': False,
+            'matched_entries': 0
+        }, ctx
+
+
+class FakeChatStore:
+    """内存 ChatStore，每次调用阻塞 FakeLatency.chat_store 秒"""
+
+    _instance = None
+    session_ttl = 7 * 24 * 3600
+
+    def __init__(self):
+        self.sessions: dict = {}
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def _session(self, session_id):
+        now = time.time()
+        return self.sessions.setdefault(session_id, {
+            'created_at': now, 'last_accessed': now, 'messages': []
+        })
+
+    def add_turn(self, session_id, messages):
+        time.sleep(FakeLatency.chat_store)
+        session = self._session(session_id)
+        session['messages'].extend(messages)
+        session['last_accessed'] = time.time()
+
+    def add_turns(self, batch):
+        time.sleep(FakeLatency.chat_store)
+        for session_id, messages in batch:
+            session = self._session(session_id)
+            session['messages'].extend(messages)
+            session['last_accessed'] = time.time()
+
+    def get_messages(self, session_id, limit=None, before=None, after=None):
+        time.sleep(FakeLatency.chat_store)
+        messages = self.sessions.get(session_id, {}).get('messages', [])
+        if after is not None:
+            return messages[after + 1:after + 1 + limit] if limit else messages[after + 1:]
+        end = before if before is not None else len(messages)
+        return messages[max(0, end - limit):end] if limit else messages[:end]
+
+    def get_session_info(self, session_id):
+        time.sleep(FakeLatency.chat_store)
+        session = self.sessions.get(session_id)
+        if session is None:
+            return None
+        return {
+            'session_id': session_id,
+            'created_at': session['created_at'],
+            'last_accessed': session['last_accessed'],
+            'message_count': len(session['messages'])
+        }
+
+    def delete_session(self, session_id):
+        time.sleep(FakeLatency.chat_store)
+        return self.sessions.pop(session_id, None) is not None
+
+    def clear_session(self, session_id):
+        time.sleep(FakeLatency.chat_store)
+        if session_id in self.sessions:
+            self.sessions[session_id]['messages'] = []
+        return True
+
+    def archive_session(self, session_id, force=False):
+        return session_id in self.sessions
+
+    def get_all_sessions(self):
+        time.sleep(FakeLatency.chat_store)
+        return [
+            {
+                'session_id': session_id,
+                'created_at': session['created_at'],
+                'last_accessed': session['last_accessed'],
+                'message_count': len(session['messages'])
+            }
+            for session_id, session in list(self.sessions.items())
+        ]
+
+    def cleanup_expired_sessions(self):
+        return 0
+
+
+class FakeVectorStore:
+    _instance = None
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def get_collection_stats(self):
+        time.sleep(FakeLatency.vector_store)
+        return {'collection_name': 'benchmark', 'document_count': 0}
+
+    def update_index(self, documents):
+        time.sleep(FakeLatency.index)
+        return {'success': True, 'mode': 'incremental', 'documents_processed': len(documents)}
+
+    def delete_documents_by_path(self, paths):
+        time.sleep(FakeLatency.vector_store)
+        return len(paths)
+
+
+class FakeIngestion:
+    _instance = None
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def preprocess_single_file(self, input_file, output_dir):
+        time.sleep(FakeLatency.preprocess)
+        markdown_path = os.path.join(output_dir, os.path.splitext(os.path.basename(input_file))[0] + '.md')
+        with open(markdown_path, 'w', encoding='utf-8') as f:
+            f.write('# preprocessed\n')
+        return {'status': 'success', 'markdown_path': markdown_path, 'page_count': 1}
+
+    def build_index(self, directory, input_files, rebuild=False, check_duplicates=True):
+        time.sleep(FakeLatency.index)
+        return {
+            'success': True,
+            'documents_processed': len(input_files),
+            'total_document_count': len(input_files),
+            'mode': 'incremental'
+        }
+
+    def load_documents(self, directory=None, input_files=None, use_processed=True):
+        time.sleep(FakeLatency.vector_store)
+        return list(input_files or [])
+
+    def enrich_metadata(self, documents, root):
+        return documents
+
+
+def install_fakes(config: dict, config_path: str) -> None:
+    """以假实现注册 routes 依赖的 src.* 模块（必须在导入 routes 之前调用）"""
+    def module(name: str, **attrs) -> None:
+        mod = types.ModuleType(name)
+        mod.__dict__.update(attrs)
+        sys.modules[name] = mod
+
+    for package in ('src', 'src.utils', 'src.agent', 'src.services'):
+        module(package)
+    module('src.utils.config', load_config=lambda: config, get_config_path=lambda: config_path)
+    module('src.agent.react_agent', LlamaAgentsRoutingAgent=FakeAgent)
+    module('src.services.vector_store', VectorStoreService=FakeVectorStore)
+    module('src.services.chat_store_service', ChatStoreService=FakeChatStore)
+    module('src.utils.ingestion_handler', IngestionHandler=FakeIngestion)
+
+
+def build_config(workdir: str) -> dict:
+    data = os.path.join(workdir, 'data')
+    return {
+        'vector_store': {
+            'documents': os.path.join(data, 'documents'),
+            'processed_docs': os.path.join(data, 'processed_docs'),
+            'catalog_path': os.path.join(data, 'document_catalog.db'),
+            'catalog_reconcile_interval': 3600
+        },
+        'task_store': {'backend': 'sqlite', 'path': os.path.join(data, 'tasks.db')},
+        'chat_store': {
+            'session_index_path': os.path.join(data, 'session_index.db'),
+            'sweep_interval': 3600
+        },
+        # fork 让预处理子进程继承假模块
+        'ingestion': {'mp_context': 'fork', 'max_queue_size': 10000, 'index_batch_window': 0.2},
+        'answer_cache': {'enabled': False, 'version_path': os.path.join(data, 'index_version')},
+        'warmup': {'run_query': False},
+        'loop_monitor': {'enabled': True}
+    }
+
+
+# ========== 测量 ==========
+
+class Recorder:
+    """记录每个路由的请求延迟与错误"""
+
+    def __init__(self):
+        self.latencies: dict = {}
+        self.errors: dict = {}
+
+    async def request(self, client, method: str, url: str, route: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            failed = response.status_code >= 400
+        except Exception:
+            response, failed = None, True
+        self.latencies.setdefault(route, []).append(time.perf_counter() - started)
+        if failed:
+            self.errors[route] = self.errors.get(route, 0) + 1
+        return response
+
+    def summary(self, elapsed: float) -> dict:
+        routes_summary = {}
+        total = 0
+        for route, values in self.latencies.items():
+            values = sorted(values)
+            total += len(values)
+            routes_summary[route] = {
+                'count': len(values),
+                'errors': self.errors.get(route, 0),
+                'p50_ms': percentile(values, 0.50),
+                'p95_ms': percentile(values, 0.95),
+                'p99_ms': percentile(values, 0.99),
+                'max_ms': round(values[-1] * 1000, 2)
+            }
+        return {
+            'requests': total,
+            'errors': sum(self.errors.values()),
+            'elapsed_s': round(elapsed, 3),
+            'rps': round(total / elapsed, 2) if elapsed > 0 else 0.0,
+            'routes': routes_summary
+        }
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    return round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 2)
+
+
+def current_rss_bytes(pid: int) -> Optional[int]:
+    """读取进程当前常驻内存（Linux /proc）；不可用时返回 None"""
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class RssSampler:
+    """
+    场景期间的峰值 RSS
+
+    后台线程按 interval 采样当前进程与预处理子进程的常驻内存之和，取最大值；
+    ru_maxrss 是整个进程生命周期的峰值，无法区分场景。没有 /proc 时（macOS 等）
+    退回 ru_maxrss，并在结果中标记 rss_source。
+    """
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='rss-sampler', daemon=True)
+        self.source = 'proc' if current_rss_bytes(os.getpid()) is not None else 'ru_maxrss'
+
+    def _sample(self) -> None:
+        pids = [os.getpid()] + [child.pid for child in multiprocessing.active_children()]
+        total = sum(current_rss_bytes(pid) or 0 for pid in pids)
+        self.peak = max(self.peak, total)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._sample()
+            self._stop.wait(self.interval)
+
+    def start(self) -> 'RssSampler':
+        if self.source == 'proc':
+            self._thread.start()
+        return self
+
+    def stop(self) -> float:
+        """停止采样并返回峰值（MB）"""
+        if self.source == 'proc':
+            self._stop.set()
+            self._thread.join()
+            self._sample()
+            return round(self.peak / (1024 * 1024), 1)
+        # ru_maxrss：Linux 上单位为 KB，macOS 为字节
+        divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        return round(max(peak, children) / divisor, 1)
+
+
+async def run_clients(concurrency: int, client_func) -> float:
+    started = time.perf_counter()
+    await asyncio.gather(*(client_func(index) for index in range(concurrency)))
+    return time.perf_counter() - started
+
+
+# ========== 场景 ==========
+
+async def chat_storm(client, args) -> dict:
+    recorder = Recorder()
+
+    async def client_loop(index: int) -> None:
+        # 每个客户端的首轮问题不同，避免相同问题合并执行使 Agent 并发失真
+        response = await recorder.request(
+            client, 'POST', '/api/chat', '/chat', json={'query': f'hello from client {index}', 'reset': True}
+        )
+        session_id = response.json().get('session_id') if response is not None and response.status_code == 200 else None
+        for turn in range(args.requests - 1):
+            await recorder.request(
+                client, 'POST', '/api/chat', '/chat',
+                json={'query': f'client {index} question {turn}', 'session_id': session_id}
+            )
+
+    return recorder.summary(await run_clients(args.concurrency, client_loop))
+
+
+async def bulk_upload(client, args) -> dict:
+    recorder = Recorder()
+    task_ids: list = []
+    body = 'lorem ipsum dolor sit amet\n' * (args.upload_kb * 40)
+    markdown = ('# benchmark\n' + body).encode('utf-8')
+    # 假 PDF 只需扩展名正确：FakeIngestion.preprocess_single_file 不解析内容，
+    # 但会经过预处理进程池与 Markdown 落盘，覆盖 PDF 上传路径
+    pdf = b'%PDF-1.4\n' + body.encode('utf-8') + b'%%EOF\n'
+
+    async def client_loop(index: int) -> None:
+        for number in range(args.requests):
+            if (index + number) % 2:
+                upload = (f'bench-{index}-{number}.pdf', pdf, 'application/pdf')
+            else:
+                upload = (f'bench-{index}-{number}.md', markdown, 'text/markdown')
+            response = await recorder.request(
+                client, 'POST', '/api/upload', '/upload',
+                files={'file': upload},
+                data={'label': 'bench'}
+            )
+            if response is not None and response.status_code == 200:
+                task_ids.append(response.json()['task_id'])
+
+    elapsed = await run_clients(args.concurrency, client_loop)
+
+    async def poll_loop(index: int) -> None:
+        for task_id in task_ids[index::args.concurrency]:
+            await recorder.request(client, 'GET', f'/api/upload/status/{task_id}', '/upload/status/{task_id}')
+        await recorder.request(client, 'GET', '/api/tasks', '/tasks', params={'kind': 'upload', 'limit': 50})
+
+    elapsed += await run_clients(args.concurrency, poll_loop)
+    return recorder.summary(elapsed)
+
+
+async def sidebar_refresh(client, args) -> dict:
+    from llama_index.core.llms import ChatMessage
+    from qa_backend.session_index import get_session_index
+
+    # 预置会话与历史
+    store = FakeChatStore.get_instance()
+    index = get_session_index()
+    session_ids = []
+    for number in range(args.sessions):
+        session_id = str(uuid.uuid4())
+        session_ids.append(session_id)
+        messages = []
+        for turn in range(args.history):
+            messages.append(ChatMessage(role='user', content=f'question {turn}'))
+            messages.append(ChatMessage(role='assistant', content=f'answer {turn}'))
+        store._session(session_id)['messages'] = messages
+        index.touch(session_id, len(messages), f'session {number}')
+
+    recorder = Recorder()
+
+    async def client_loop(client_index: int) -> None:
+        for number in range(args.requests):
+            session_id = session_ids[(client_index * args.requests + number) % len(session_ids)]
+            await recorder.request(
+                client, 'GET', '/api/chat/sessions/list', '/chat/sessions/list', params={'limit': 50}
+            )
+            response = await recorder.request(
+                client, 'GET', f'/api/chat/{session_id}/history', '/chat/{session_id}/history', params={'limit': 50}
+            )
+            etag = response.headers.get('etag') if response is not None else None
+            if etag:
+                await recorder.request(
+                    client, 'GET', f'/api/chat/{session_id}/history', '/chat/{session_id}/history (304)',
+                    params={'limit': 50}, headers={'If-None-Match': etag}
+                )
+            await recorder.request(client, 'GET', f'/api/chat/{session_id}/info', '/chat/{session_id}/info')
+
+    return recorder.summary(await run_clients(args.concurrency, client_loop))
+
+
+async def document_tree(client, args) -> dict:
+    from qa_backend.documents import get_document_catalog, get_document_roots
+
+    roots = get_document_roots()
+    for number in range(args.documents):
+        label_dir = os.path.join(roots['processed_docs'], f'label{number % 20}')
+        os.makedirs(label_dir, exist_ok=True)
+        with open(os.path.join(label_dir, f'doc{number}.md'), 'w', encoding='utf-8') as f:
+            f.write('# doc\n')
+    reconcile_started = time.perf_counter()
+    get_document_catalog().reconcile(roots)
+    reconcile_elapsed = time.perf_counter() - reconcile_started
+
+    recorder = Recorder()
+
+    async def client_loop(client_index: int) -> None:
+        for number in range(args.requests):
+            cursor = None
+            for _ in range(3):
+                params = {'limit': 100}
+                if number % 2:
+                    params['label'] = f'label{(client_index + number) % 20}'
+                if cursor:
+                    params['cursor'] = cursor
+                response = await recorder.request(client, 'GET', '/api/documents', '/documents', params=params)
+                if response is None or response.status_code != 200:
+                    break
+                cursor = response.json().get('next_cursor')
+                if not cursor:
+                    break
+
+    summary = recorder.summary(await run_clients(args.concurrency, client_loop))
+    summary['catalog_reconcile_s'] = round(reconcile_elapsed, 3)
+    return summary
+
+
+SCENARIO_FUNCS = {
+    'chat_storm': chat_storm,
+    'bulk_upload': bulk_upload,
+    'sidebar_refresh': sidebar_refresh,
+    'document_tree': document_tree
+}
+
+
+# ========== 结果比较 ==========
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """返回回归项列表（p95 上升或 RPS 下降超过 threshold 比例）"""
+    regressions = []
+    for name, result in current['scenarios'].items():
+        base = baseline.get('scenarios', {}).get(name)
+        if not base:
+            continue
+        if base['rps'] > 0 and result['rps'] < base['rps'] * (1 - threshold):
+            regressions.append(f"{name}: rps {base['rps']} -> {result['rps']}")
+        for route, stats in result['routes'].items():
+            base_stats = base['routes'].get(route)
+            if base_stats and base_stats['p95_ms'] > 0 and stats['p95_ms'] > base_stats['p95_ms'] * (1 + threshold):
+                regressions.append(f"{name} {route}: p95 {base_stats['p95_ms']}ms -> {stats['p95_ms']}ms")
+    return regressions
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return None
+
+
+# ========== 入口 ==========
+
+async def run(args) -> dict:
+    import httpx
+    from fastapi import FastAPI
+
+    workdir = tempfile.mkdtemp(prefix='qa-bench-')
+    config = build_config(workdir)
+    config_path = os.path.join(workdir, 'config.yaml')
+    open(config_path, 'w').close()
+    install_fakes(config, config_path)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import routes
+    from qa_backend.executors import loop_monitor_stats
+
+    app = FastAPI()
+    app.include_router(routes.router, prefix='/api')
+
+    results = {}
+    # 通过 lifespan 上下文执行启动 / 关闭钩子（新版本 Starlette 已移除 router.startup()）
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=300) as client:
+            for name in args.scenarios:
+                print(f'运行场景 {name} ...', file=sys.stderr)
+                sampler = RssSampler().start()
+                try:
+                    results[name] = await SCENARIO_FUNCS[name](client, args)
+                finally:
+                    peak_rss = sampler.stop()
+                results[name]['peak_rss_mb'] = peak_rss
+                results[name]['rss_source'] = sampler.source
+                print(
+                    f"  {results[name]['requests']} 请求，{results[name]['rps']} rps，"
+                    f"错误 {results[name]['errors']}，峰值 RSS {results[name]['peak_rss_mb']} MB",
+                    file=sys.stderr
+                )
+        event_loop = loop_monitor_stats()
+
+    return {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'args': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+            'event_loop': event_loop
+        },
+        'scenarios': results
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='API 路由离线压测')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--concurrency', type=int, default=32, help='并发客户端数')
+    parser.add_argument('--requests', type=int, default=10, help='每个客户端的请求轮数')
+    parser.add_argument('--sessions', type=int, default=2000, help='sidebar_refresh 预置会话数')
+    parser.add_argument('--history', type=int, default=50, help='每个预置会话的轮次数')
+    parser.add_argument('--documents', type=int, default=20000, help='document_tree 文档数')
+    parser.add_argument('--upload-kb', type=int, default=64, help='bulk_upload 单个文件大小（约 KB）')
+    parser.add_argument('--agent-latency', type=float, default=FakeLatency.agent)
+    parser.add_argument('--tool-latency', type=float, default=FakeLatency.tool)
+    parser.add_argument('--store-latency', type=float, default=FakeLatency.chat_store)
+    parser.add_argument('--vector-latency', type=float, default=FakeLatency.vector_store)
+    parser.add_argument('--preprocess-latency', type=float, default=FakeLatency.preprocess)
+    parser.add_argument('--index-latency', type=float, default=FakeLatency.index)
+    parser.add_argument('--output', help='结果 JSON 路径（默认输出到标准输出）')
+    parser.add_argument('--baseline', help='用于比较的历史结果 JSON')
+    parser.add_argument('--threshold', type=float, default=0.2, help='回归判定阈值（比例，默认 0.2）')
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    FakeLatency.agent = args.agent_latency
+    FakeLatency.tool = args.tool_latency
+    FakeLatency.chat_store = args.store_latency
+    FakeLatency.vector_store = args.vector_latency
+    FakeLatency.preprocess = args.preprocess_latency
+    FakeLatency.index = args.index_latency
+
+    report = asyncio.run(run(args))
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        report['regressions'] = regressions
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+        print(f'结果已写入 {args.output}', file=sys.stderr)
+    else:
+        print(output)
+
+    if report.get('regressions'):
+        print('发现性能回归:', file=sys.stderr)
+        for item in report['regressions']:
+            print(f'  - {item}', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
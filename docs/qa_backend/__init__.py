@@ -0,0 +1,7 @@
+"""
+API 后台组件
+
+routes.py 中的路由处理函数依赖的各子系统：指标、配置快照、阻塞调用线程池、
+任务存储、摄取调度、会话索引与清理、回答缓存、Agent 准入控制、文档目录、
+只读查询与上传处理等。
+"""
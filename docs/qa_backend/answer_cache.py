@@ -0,0 +1,246 @@
+"""
+回答缓存
+"""
+import os
+import json
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
+from datetime import datetime
+
+from qa_backend.config_snapshot import config_snapshot
+from qa_backend.metrics import answer_cache_lookups, answer_cache_stale_stores, register_cache_size
+
+
+_answer_cache: Optional['AnswerCache'] = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_index_version_path() -> str:
+    return config_snapshot.get('answer_cache.version_path', './data/index_version')
+
+
+def bump_index_version() -> None:
+    """
+    标记向量库已变更
+
+    写入版本文件（mtime 即版本号），所有 worker 进程的回答缓存据此失效。
+    """
+    path = get_index_version_path()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(datetime.now().isoformat())
+    if _answer_cache is not None:
+        _answer_cache.invalidate()
+
+
+def normalize_query(query: str) -> str:
+    """规范化问题文本：全角转半角、小写、合并空白、去除结尾标点"""
+    text = unicodedata.normalize('NFKC', query).lower()
+    text = ' '.join(text.split())
+    return text.rstrip('?？!！.。~～ ')
+
+
+class AnswerCache:
+    """
+    /chat 回答缓存
+
+    - 精确匹配：以规范化后的问题为键
+    - 语义匹配（可选）：问题向量余弦相似度 >= semantic_threshold 时命中，
+      只比对最近使用的 semantic_scan_limit 个条目
+    - 按条目数与字节数双重上限做 LRU 淘汰
+    - 每次读写前比对索引版本文件 mtime，向量库变更后整体失效
+    - lookup() 返回查询时的索引版本，store() 时版本已变化则放弃写入，
+      避免索引更新前开始生成的回答在失效后写回缓存
+    """
+
+    def __init__(
+        self,
+        version_path: str,
+        max_entries: int = 1000,
+        max_bytes: int = 32 * 1024 * 1024,
+        semantic_threshold: Optional[float] = None,
+        semantic_scan_limit: int = 256
+    ):
+        self.version_path = version_path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.semantic_threshold = semantic_threshold
+        self.semantic_scan_limit = semantic_scan_limit
+        # key -> {'result', 'embedding', 'size'}
+        self._entries: OrderedDict = OrderedDict()
+        self._bytes = 0
+        self._version = self._read_version()
+        self._lock = threading.Lock()
+        self.hits = {'exact': 0, 'semantic': 0}
+        self.misses = 0
+        self.invalidations = 0
+        self.stale_stores = 0
+
+    def _read_version(self) -> int:
+        try:
+            return os.stat(self.version_path).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def _check_version_locked(self) -> None:
+        version = self._read_version()
+        if version != self._version:
+            self._version = version
+            self._clear_locked()
+
+    def _clear_locked(self) -> None:
+        if self._entries:
+            self.invalidations += 1
+        self._entries.clear()
+        self._bytes = 0
+
+    @staticmethod
+    def _embed(text: str) -> list:
+        from llama_index.core import Settings
+        return Settings.embed_model.get_text_embedding(text)
+
+    def lookup(self, query: str) -> tuple:
+        """
+        查询缓存
+
+        Returns:
+            (result, match_type, embedding, version)；未命中时 result 为 None，
+            embedding 与 version 传给 store()，前者避免重复计算，后者用于
+            判断生成期间索引是否已更新
+        """
+        key = normalize_query(query)
+        with self._lock:
+            self._check_version_locked()
+            version = self._version
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits['exact'] += 1
+                answer_cache_lookups.inc(result='exact')
+                return entry['result'], 'exact', None, version
+
+        embedding = None
+        if self.semantic_threshold is not None:
+            import numpy as np
+
+            embedding = self._embed(key)
+            query_vec = np.asarray(embedding, dtype=np.float32)
+            query_vec /= (np.linalg.norm(query_vec) or 1.0)
+            # 锁内只复制最近使用的 semantic_scan_limit 个向量引用，相似度在锁外计算
+            with self._lock:
+                candidates = []
+                for cached_key in reversed(self._entries):
+                    if len(candidates) >= self.semantic_scan_limit:
+                        break
+                    vector = self._entries[cached_key]['embedding']
+                    if vector is not None:
+                        candidates.append((cached_key, vector))
+            if candidates:
+                scores = np.stack([vector for _, vector in candidates]) @ query_vec
+                best = int(np.argmax(scores))
+                if scores[best] >= self.semantic_threshold:
+                    best_key = candidates[best][0]
+                    with self._lock:
+                        # 计算期间条目可能已被淘汰或随索引更新失效
+                        entry = self._entries.get(best_key) if self._version == version else None
+                        if entry is not None:
+                            self._entries.move_to_end(best_key)
+                            self.hits['semantic'] += 1
+                            answer_cache_lookups.inc(result='semantic')
+                            return entry['result'], 'semantic', embedding, version
+
+        with self._lock:
+            self.misses += 1
+        answer_cache_lookups.inc(result='miss')
+        return None, None, embedding, version
+
+    def store(
+        self,
+        query: str,
+        result: dict,
+        embedding: Optional[list] = None,
+        version: Optional[int] = None
+    ) -> None:
+        """写入回答；version 为 lookup() 返回的索引版本，与当前版本不一致时放弃"""
+        key = normalize_query(query)
+        if self.semantic_threshold is not None and embedding is None:
+            embedding = self._embed(key)
+        vector = None
+        if embedding is not None:
+            import numpy as np
+
+            vector = np.asarray(embedding, dtype=np.float32)
+            vector /= (np.linalg.norm(vector) or 1.0)
+
+        size = (
+            len(key.encode('utf-8'))
+            + len(json.dumps(result, ensure_ascii=False, default=str).encode('utf-8'))
+            + (vector.nbytes if vector is not None else 0)
+        )
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            self._check_version_locked()
+            if version is not None and version != self._version:
+                self.stale_stores += 1
+                answer_cache_stale_stores.inc()
+                return
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous['size']
+            self._entries[key] = {'result': result, 'embedding': vector, 'size': size}
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted['size']
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._version = self._read_version()
+            self._clear_locked()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': dict(self.hits),
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'stale_stores': self.stale_stores,
+                'semantic': self.semantic_threshold is not None
+            }
+
+
+def get_answer_cache() -> Optional[AnswerCache]:
+    """
+    获取回答缓存实例（answer_cache.enabled 为 false 时返回 None）
+
+    配置项：
+    - answer_cache.max_entries: 最大条目数（默认 1000）
+    - answer_cache.max_bytes: 最大字节数（默认 32MB）
+    - answer_cache.semantic_threshold: 语义匹配阈值，未配置时仅精确匹配
+    - answer_cache.semantic_scan_limit: 语义匹配最多比对的最近条目数（默认 256）
+    - answer_cache.version_path: 索引版本文件路径
+    """
+    global _answer_cache
+    if not config_snapshot.get('answer_cache.enabled', True):
+        return None
+    if _answer_cache is None:
+        with _answer_cache_lock:
+            if _answer_cache is None:
+                threshold = config_snapshot.get('answer_cache.semantic_threshold', None)
+                _answer_cache = AnswerCache(
+                    version_path=get_index_version_path(),
+                    max_entries=int(config_snapshot.get('answer_cache.max_entries', 1000)),
+                    max_bytes=int(config_snapshot.get('answer_cache.max_bytes', 32 * 1024 * 1024)),
+                    semantic_threshold=float(threshold) if threshold is not None else None,
+                    semantic_scan_limit=int(config_snapshot.get('answer_cache.semantic_scan_limit', 256))
+                )
+    return _answer_cache
+
+
+register_cache_size('answer', lambda: _answer_cache.stats()['entries'] if _answer_cache else None)
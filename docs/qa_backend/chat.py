@@ -0,0 +1,487 @@
+"""
+聊天辅助：会话准备、写后缓冲、会话记忆缓存与思考流
+"""
+import time
+import uuid
+import asyncio
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from fastapi import HTTPException
+from llama_index.core.llms import ChatMessage
+from src.services.chat_store_service import ChatStoreService
+
+from qa_backend.config_snapshot import config_snapshot
+from qa_backend.executors import run_blocking
+from qa_backend.governor import AgentGovernor
+from qa_backend.metrics import Gauge, metrics, register_cache_size
+from qa_backend.models import ChatWithContextRequest
+from qa_backend.services import get_chat_store_service
+from qa_backend.session_index import SessionIndex, get_session_index, index_session
+
+
+logger = logging.getLogger(__name__)
+
+
+_turn_writer: Optional['ChatTurnWriter'] = None
+_turn_writer_lock = threading.Lock()
+_memory_cache: Optional['ChatMemoryCache'] = None
+_memory_cache_lock = threading.Lock()
+# 思考流默认参数（可通过 stream.heartbeat_interval / stream.buffer_size 配置覆盖）
+STREAM_HEARTBEAT_INTERVAL = 15.0
+STREAM_BUFFER_SIZE = 64
+
+
+def resolve_chat_session(request: ChatWithContextRequest) -> str:
+    """
+    校验 session_id 并返回本轮使用的会话ID（reset=true 时生成新的会话ID）
+
+    不访问存储；旧会话的归档清除与待写入轮次同步由 prepare_chat_session 在会话锁内完成。
+    """
+    if request.reset:
+        session_id = str(uuid.uuid4())
+        logger.info(f"创建新会话: {session_id}")
+        return session_id
+
+    if not request.session_id:
+        raise HTTPException(
+            status_code=400,
+            detail='需要 session_id 或 reset=true 创建新会话'
+        )
+    return request.session_id
+
+
+def prepare_chat_session(request: ChatWithContextRequest, chat_store_service: ChatStoreService) -> None:
+    """
+    reset=true 时归档并清除旧会话（如有）；否则同步该会话的待写入轮次
+
+    需持有 request.session_id 的会话锁，避免与该会话进行中的轮次交错。
+    """
+    if request.reset:
+        if request.session_id:
+            sync_pending_turns(request.session_id)
+            archived = chat_store_service.archive_session(request.session_id, force=True)
+            if not archived:
+                logger.warning(
+                    "历史会话归档失败或不存在: %s",
+                    request.session_id,
+                )
+            # 清除 ChatStore 历史
+            chat_store_service.clear_session(request.session_id)
+            get_memory_cache().invalidate(request.session_id)
+            index_session(SessionIndex.remove, [request.session_id])
+        return
+    sync_pending_turns(request.session_id)
+
+
+async def lock_chat_session(
+    request: ChatWithContextRequest,
+    chat_store_service: ChatStoreService,
+    governor: 'AgentGovernor',
+    session_id: str
+) -> Callable[[], None]:
+    """
+    获取本轮会话锁并在锁内执行 prepare_chat_session，返回释放函数
+
+    reset 时旧会话的归档清除在旧会话的锁内执行，完成后再获取新会话的锁。
+    """
+    if request.reset and request.session_id:
+        release_previous = await governor.acquire_session(request.session_id)
+        try:
+            await run_blocking('chat_store', prepare_chat_session, request, chat_store_service)
+        finally:
+            release_previous()
+        return await governor.acquire_session(session_id)
+
+    release = await governor.acquire_session(session_id)
+    try:
+        await run_blocking('chat_store', prepare_chat_session, request, chat_store_service)
+    except BaseException:
+        release()
+        raise
+    return release
+
+
+class ChatTurnWriter:
+    """
+    ChatStore 写后缓冲（write-behind）
+
+    各会话的问答轮次先进入内存队列，由后台线程每 flush_interval 秒
+    （即最大丢失窗口）或积累 max_batch 轮时调用 add_turns 批量写入。
+    读取某会话前调用 flush_session() 保证读到自己的写入；应用关闭时全部落盘。
+    """
+
+    def __init__(
+        self,
+        chat_store_service: ChatStoreService,
+        flush_interval: float = 1.0,
+        max_batch: int = 200
+    ):
+        self.chat_store_service = chat_store_service
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._pending: list = []
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._stopped = False
+        self.flushed_turns = 0
+        self.flush_count = 0
+        self._thread = threading.Thread(
+            target=self._run, name='chat-turn-writer', daemon=True
+        )
+        self._thread.start()
+
+    def enqueue(self, session_id: str, messages: list) -> None:
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError('ChatTurnWriter 已关闭')
+            self._pending.append((session_id, messages))
+            if len(self._pending) >= self.max_batch:
+                self._cond.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if not self._stopped and len(self._pending) < self.max_batch:
+                    self._cond.wait(self.flush_interval)
+                stopped = self._stopped
+            self.flush()
+            if stopped:
+                return
+
+    def flush(self, session_id: Optional[str] = None) -> int:
+        """写入缓冲中的轮次（指定 session_id 时只写该会话），返回写入轮数"""
+        with self._flush_lock:
+            with self._cond:
+                if session_id is None:
+                    batch, self._pending = self._pending, []
+                else:
+                    batch = [turn for turn in self._pending if turn[0] == session_id]
+                    self._pending = [turn for turn in self._pending if turn[0] != session_id]
+            if not batch:
+                return 0
+            try:
+                self.chat_store_service.add_turns(batch)
+            except Exception as e:
+                logger.error(f"ChatStore 批量写入失败，{len(batch)} 轮将重试: {e}", exc_info=True)
+                with self._cond:
+                    self._pending[:0] = batch
+                return 0
+            self.flushed_turns += len(batch)
+            self.flush_count += 1
+            return len(batch)
+
+    def flush_session(self, session_id: str) -> None:
+        with self._cond:
+            has_pending = any(turn[0] == session_id for turn in self._pending)
+        if has_pending:
+            self.flush(session_id)
+
+    def shutdown(self) -> None:
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._thread.join()
+        self.flush()
+
+    def stats(self) -> dict:
+        with self._cond:
+            pending = len(self._pending)
+        return {
+            'pending_turns': pending,
+            'flushed_turns': self.flushed_turns,
+            'flush_count': self.flush_count,
+            'flush_interval': self.flush_interval
+        }
+
+
+def get_turn_writer() -> Optional[ChatTurnWriter]:
+    """
+    获取 ChatStore 写后缓冲实例（未启用时返回 None）
+
+    配置项：
+    - chat_store.write_behind.enabled: 是否启用（默认 false，同步写入）
+    - chat_store.write_behind.flush_interval: 刷新间隔秒数，即最大丢失窗口（默认 1.0）
+    - chat_store.write_behind.max_batch: 单次批量写入的最大轮数（默认 200）
+    """
+    global _turn_writer
+    if not config_snapshot.get('chat_store.write_behind.enabled', False):
+        return None
+    if _turn_writer is None:
+        with _turn_writer_lock:
+            if _turn_writer is None:
+                _turn_writer = ChatTurnWriter(
+                    get_chat_store_service(),
+                    flush_interval=float(config_snapshot.get('chat_store.write_behind.flush_interval', 1.0)),
+                    max_batch=int(config_snapshot.get('chat_store.write_behind.max_batch', 200))
+                )
+    return _turn_writer
+
+
+def shutdown_turn_writer() -> None:
+    """应用关闭时写入所有缓冲中的对话轮次"""
+    if _turn_writer is not None:
+        _turn_writer.shutdown()
+
+
+def turn_writer_stats() -> Optional[dict]:
+    """写后缓冲统计（未创建时返回 None）"""
+    return _turn_writer.stats() if _turn_writer else None
+
+
+metrics.register(Gauge(
+    'qa_chat_pending_turns', '写后缓冲中待写入的轮次数',
+    collect=lambda: _turn_writer.stats()['pending_turns'] if _turn_writer else 0
+))
+
+
+def count_message_tokens(message: ChatMessage) -> int:
+    """计算消息 token 数（优先使用写入时保存的 token_count）"""
+    token_count = (message.additional_kwargs or {}).get('token_count')
+    if isinstance(token_count, int):
+        return token_count
+    from llama_index.core.utils import get_tokenizer
+    return len(get_tokenizer()(str(message.content or '')))
+
+
+# 会话索引不可用时的版本占位（与 None 区分：None 表示会话未登记）
+_NO_VERSION = object()
+
+
+def public_message_kwargs(message) -> dict:
+    """返回可对外展示的 additional_kwargs（去掉内部使用的 token_count）"""
+    return {
+        key: value for key, value in (message.additional_kwargs or {}).items()
+        if key != 'token_count'
+    }
+
+
+class ChatMemoryCache:
+    """
+    会话记忆缓存（进程内 LRU）
+
+    缓存每个会话的消息及其 token 数，构建 ChatMemoryBuffer 时直接按预计算的
+    token 数从最新消息向前截断，无需重新读取与分词整段历史。新增轮次时增量追加；
+    clear/archive 时失效。
+
+    每个条目记录加载时的会话版本（SessionIndex.version），命中前与会话索引
+    比对，其他 worker 写入过该会话时重新加载。索引不可用时退化为 ttl 过期。
+    """
+
+    def __init__(self, max_sessions: int = 1000, max_tokens: int = 16000, ttl: float = 60.0):
+        self.max_sessions = max_sessions
+        self.max_tokens = max_tokens
+        self.ttl = ttl
+        # session_id -> {'messages': [(message, tokens), ...], 'tokens': int, 'loaded_at': float}
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def _trim(self, entry: dict) -> None:
+        messages = entry['messages']
+        while len(messages) > 1 and entry['tokens'] > self.max_tokens:
+            _, tokens = messages.pop(0)
+            entry['tokens'] -= tokens
+
+    @staticmethod
+    def _current_version(session_id: str):
+        """返回会话索引中的版本；索引不可用时返回 _NO_VERSION"""
+        try:
+            return get_session_index().version(session_id)
+        except Exception as e:
+            logger.warning(f"读取会话版本失败: {e}")
+            return _NO_VERSION
+
+    def _load(self, chat_store_service: ChatStoreService, session_id: str, version) -> dict:
+        messages = [
+            (message, count_message_tokens(message))
+            for message in chat_store_service.get_messages(session_id)
+        ]
+        entry = {
+            'messages': messages,
+            'tokens': sum(tokens for _, tokens in messages),
+            'loaded_at': time.monotonic(),
+            'version': version
+        }
+        self._trim(entry)
+        return entry
+
+    def get_memory(self, chat_store_service: ChatStoreService, session_id: str, token_limit: int):
+        """返回截断到 token_limit 的 ChatMemoryBuffer（不包含当前问题）"""
+        from llama_index.core.memory import ChatMemoryBuffer
+
+        # 先读版本再读消息：加载期间发生的写入会让版本再次变化，下次重新加载
+        version = self._current_version(session_id)
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None and (
+                time.monotonic() - entry['loaded_at'] > self.ttl
+                or version is _NO_VERSION
+                or entry['version'] != version
+            ):
+                if version is not _NO_VERSION and entry['version'] != version:
+                    self.stale += 1
+                del self._entries[session_id]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(session_id)
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if entry is None:
+            entry = self._load(chat_store_service, session_id, version)
+            with self._lock:
+                self._entries[session_id] = entry
+                self._entries.move_to_end(session_id)
+                while len(self._entries) > self.max_sessions:
+                    self._entries.popitem(last=False)
+
+        with self._lock:
+            history, total = [], 0
+            for message, tokens in reversed(entry['messages']):
+                if total + tokens > token_limit:
+                    break
+                history.append(message)
+                total += tokens
+        history.reverse()
+        return ChatMemoryBuffer.from_defaults(chat_history=history, token_limit=token_limit)
+
+    def append(self, session_id: str, messages: list, versions: Optional[tuple] = None) -> None:
+        """
+        增量追加新轮次（仅更新已缓存的会话）
+
+        versions 为 SessionIndex.touch 返回的 (写入前版本, 写入后版本)：
+        缓存与写入前版本一致时追加并推进版本，否则说明期间有其他写入，直接失效。
+        """
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return
+            if versions is None or entry['version'] != versions[0]:
+                del self._entries[session_id]
+                return
+            entry['version'] = versions[1]
+            for message in messages:
+                tokens = count_message_tokens(message)
+                entry['messages'].append((message, tokens))
+                entry['tokens'] += tokens
+            self._trim(entry)
+
+    def invalidate(self, session_id: Optional[str] = None) -> None:
+        with self._lock:
+            if session_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(session_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'sessions': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale': self.stale
+            }
+
+
+def get_memory_cache() -> ChatMemoryCache:
+    """
+    获取会话记忆缓存实例
+
+    配置项：
+    - chat_store.memory_cache.max_sessions: 最大缓存会话数（默认 1000）
+    - chat_store.memory_cache.max_tokens: 每个会话保留的最大 token 数（默认 16000）
+    - chat_store.memory_cache.ttl: 条目最长保留秒数（默认 60）
+    """
+    global _memory_cache
+    if _memory_cache is None:
+        with _memory_cache_lock:
+            if _memory_cache is None:
+                _memory_cache = ChatMemoryCache(
+                    max_sessions=int(config_snapshot.get('chat_store.memory_cache.max_sessions', 1000)),
+                    max_tokens=int(config_snapshot.get('chat_store.memory_cache.max_tokens', 16000)),
+                    ttl=float(config_snapshot.get('chat_store.memory_cache.ttl', 60.0))
+                )
+    return _memory_cache
+
+
+register_cache_size('chat_memory', lambda: _memory_cache.stats()['sessions'] if _memory_cache else 0)
+
+
+def sync_pending_turns(session_id: str) -> None:
+    """读取会话前写入该会话缓冲中的轮次，保证读到自己的写入"""
+    if _turn_writer is not None:
+        _turn_writer.flush_session(session_id)
+
+
+def persist_chat_turn(
+    chat_store_service: ChatStoreService,
+    session_id: str,
+    query: str,
+    answer: str
+) -> None:
+    """
+    将一轮问答（用户消息 + 助手回答）写入 ChatStore
+
+    两条消息通过 add_turn 在同一事务中写入；启用写后缓冲时进入批量写入队列。
+    """
+    messages = [
+        ChatMessage(role="user", content=query),
+        ChatMessage(role="assistant", content=answer)
+    ]
+    # 写入时保存 token 数，后续构建记忆时无需重新分词
+    for message in messages:
+        message.additional_kwargs['token_count'] = count_message_tokens(message)
+
+    writer = get_turn_writer()
+    if writer is not None:
+        writer.enqueue(session_id, messages)
+    else:
+        chat_store_service.add_turn(session_id, messages)
+    versions = index_session(SessionIndex.touch, session_id, len(messages), query)
+    get_memory_cache().append(session_id, messages, versions)
+
+
+class ThinkingEventEmitter:
+    """
+    思考流事件发射器
+
+    Agent 通过 await emit(type, content, extra) 推送步骤事件，
+    事件进入有界队列；队列满时 emit 会等待，从而对 Agent 形成背压。
+    """
+
+    def __init__(self, trace_id: str, session_id: str, buffer_size: int = STREAM_BUFFER_SIZE):
+        self.trace_id = trace_id
+        self.session_id = session_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=buffer_size)
+        self._step = 0
+
+    def build(self, event_type: str, content: str = '', extra: Optional[dict] = None) -> dict:
+        self._step += 1
+        return {
+            'trace_id': self.trace_id,
+            'turn_id': self.session_id,
+            'session_id': self.session_id,
+            'step': self._step,
+            'ts': int(time.time() * 1000),
+            'type': event_type,
+            'content': content,
+            'extra': extra or {}
+        }
+
+    async def emit(self, event_type: str, content: str = '', extra: Optional[dict] = None) -> None:
+        await self.queue.put(self.build(event_type, content, extra))
+
+    @staticmethod
+    def format(event: dict) -> str:
+        return f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
+
+    @staticmethod
+    def heartbeat() -> str:
+        return "event: heartbeat\ndata: \n\n"
@@ -0,0 +1,104 @@
+"""
+配置快照
+"""
+import os
+import time
+import logging
+import threading
+from types import MappingProxyType
+from typing import Callable, Mapping, Optional
+
+from src.utils.config import get_config_path, load_config
+
+
+logger = logging.getLogger(__name__)
+
+
+class ConfigSnapshot:
+    """
+    配置快照
+
+    首次访问时解析一次配置，展开为 "a.b.c" 形式的扁平字典，查询为 O(1) 字典读取。
+    每隔 check_interval 秒检查一次配置文件 mtime，变化时重新加载；
+    也可通过 reload() 显式重载（/config/reload 接口）。
+
+    监视的文件路径由 path_resolver 提供（与 loader 读取的文件一致，每次检查时
+    重新解析）。快照为不可变的 (values, path, mtime, checked_at) 元组，整体原子替换；
+    读取只取一次引用，检查与重载在锁内进行。
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[], dict],
+        path_resolver: Callable[[], str],
+        check_interval: float = 1.0
+    ):
+        self.loader = loader
+        self.path_resolver = path_resolver
+        self.check_interval = check_interval
+        self.reload_count = 0
+        self._snapshot: Optional[tuple] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _flatten(data: dict, prefix: str = '', out: Optional[dict] = None) -> dict:
+        out = {} if out is None else out
+        for key, value in data.items():
+            full_key = f"{prefix}{key}"
+            out[full_key] = value
+            if isinstance(value, dict):
+                ConfigSnapshot._flatten(value, f"{full_key}.", out)
+        return out
+
+    @staticmethod
+    def _stat_mtime(path: str) -> Optional[float]:
+        try:
+            return os.stat(path).st_mtime
+        except OSError:
+            return None
+
+    def _reload_locked(self) -> Mapping:
+        path = str(self.path_resolver())
+        mtime = self._stat_mtime(path)
+        values = MappingProxyType(self._flatten(self.loader() or {}))
+        self._snapshot = (values, path, mtime, time.monotonic())
+        self.reload_count += 1
+        logger.info(f"配置已加载（第 {self.reload_count} 次）: {path}")
+        return values
+
+    def reload(self) -> Mapping:
+        """重新解析配置文件并原子替换快照"""
+        with self._lock:
+            return self._reload_locked()
+
+    def _current(self) -> Mapping:
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - snapshot[3] < self.check_interval:
+            return snapshot[0]
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None:
+                return self._reload_locked()
+            values, path, mtime, checked_at = snapshot
+            now = time.monotonic()
+            if now - checked_at < self.check_interval:
+                return values
+            current_path = str(self.path_resolver())
+            if current_path != path or self._stat_mtime(current_path) != mtime:
+                return self._reload_locked()
+            self._snapshot = (values, path, mtime, now)
+            return values
+
+    def get(self, key: str, default=None):
+        return self._current().get(key, default)
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            'path': snapshot[1] if snapshot else None,
+            'mtime': snapshot[2] if snapshot else None,
+            'reload_count': self.reload_count
+        }
+
+
+config_snapshot = ConfigSnapshot(load_config, get_config_path)
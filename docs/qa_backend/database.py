@@ -0,0 +1,374 @@
+"""
+数据库引擎与只读查询
+"""
+import re
+import time
+import asyncio
+import json
+import queue
+import base64
+import hashlib
+import logging
+import threading
+from typing import AsyncIterator, Callable, Optional
+
+from fastapi import HTTPException
+
+from qa_backend.config_snapshot import config_snapshot
+from qa_backend.executors import run_blocking
+from qa_backend.metrics import register_cache_size
+
+
+logger = logging.getLogger(__name__)
+
+
+_engine_registry: Optional['EngineRegistry'] = None
+# 只读查询校验（在去除字符串字面量、引号标识符与注释后的语句上匹配）
+SQL_LITERAL_PATTERN = re.compile(
+    r"'(?:[^'\\]|\\.|'')*'"               # 字符串字面量（'' 与反斜杠转义）
+    r'|"(?:[^"]|"")*"'                    # 双引号标识符
+    r'|`[^`]*`'                           # 反引号标识符（MySQL / ClickHouse）
+    r'|\$([A-Za-z_]\w*|)\$.*?\$\1\$'      # PostgreSQL 美元引号字符串
+    r'|--[^\n]*'                          # 行注释
+    r'|/\*.*?\*/',                        # 块注释
+    re.DOTALL
+)
+READONLY_SQL_PATTERN = re.compile(r'^\s*(select|with)\b', re.IGNORECASE)
+FORBIDDEN_SQL_PATTERN = re.compile(
+    r'\b(insert|update|delete|drop|alter|create|truncate|grant|revoke|attach|detach|'
+    r'rename|optimize|system|kill|call|exec|execute|into)\b',
+    re.IGNORECASE
+)
+# 有副作用的函数 / 访问外部资源的表函数
+FORBIDDEN_SQL_FUNCTIONS = re.compile(
+    r'\b(pg_terminate_backend|pg_cancel_backend|pg_reload_conf|pg_read_file|pg_read_binary_file|'
+    r'pg_ls_dir|lo_import|lo_export|setval|nextval|dblink\w*|url|file|remote|remotesecure|'
+    r's3|s3cluster|hdfs|mysql|postgresql|jdbc|odbc|executable)\s*\(',
+    re.IGNORECASE
+)
+# 只读事务由数据库强制执行，上面的校验只用于提前给出明确的错误信息
+READONLY_TRANSACTION_SQL = {
+    'postgresql': ('SET TRANSACTION READ ONLY',),
+    'mysql': ('SET TRANSACTION READ ONLY',),
+    'mariadb': ('SET TRANSACTION READ ONLY',),
+    'sqlite': ('PRAGMA query_only = ON',),
+}
+
+
+class EngineRegistry:
+    """
+    数据库引擎注册表
+
+    按 (db_source, db_name) 复用长生命周期的 SQLEngine / ClickHouseEngine 实例
+    （连接池由引擎自身维护）。表结构信息按 TTL 缓存，支持显式失效；
+    同一 key 的并发未命中共享一次结构查询（single-flight），查询在线程池中执行。
+    """
+
+    def __init__(self, schema_ttl: float = 300.0):
+        self.schema_ttl = schema_ttl
+        self._engines: dict = {}
+        self._engine_lock = threading.Lock()
+        # key -> (info, expires_at)
+        self._schemas: dict = {}
+        # key -> asyncio.Future（进行中的结构查询）
+        self._inflight: dict = {}
+        self.schema_hits = 0
+        self.schema_misses = 0
+
+    @staticmethod
+    def _create_engine(db_source: Optional[str], db_name: Optional[str]):
+        if db_source == 'clickhouse':
+            from src.engines.clickhouse_engine import ClickHouseEngine
+            return ClickHouseEngine(db_name)
+        from src.engines.sql_engine import SQLEngine
+        return SQLEngine(db_name)
+
+    def get_engine(self, db_source: Optional[str], db_name: Optional[str]):
+        """获取（必要时创建）引擎实例，线程安全"""
+        key = (db_source or 'sql', db_name)
+        engine = self._engines.get(key)
+        if engine is None:
+            with self._engine_lock:
+                engine = self._engines.get(key)
+                if engine is None:
+                    engine = self._engines[key] = self._create_engine(db_source, db_name)
+                    logger.info(f"数据库引擎已创建: {key}")
+        return engine
+
+    async def get_table_info(self, db_source: Optional[str], db_name: Optional[str]):
+        key = (db_source or 'sql', db_name)
+        cached = self._schemas.get(key)
+        if cached is not None and cached[1] > time.monotonic():
+            self.schema_hits += 1
+            return cached[0]
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.schema_hits += 1
+            return await asyncio.shield(inflight)
+
+        self.schema_misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            engine = await run_blocking('database', self.get_engine, db_source, db_name)
+            info = await run_blocking('database', engine.get_table_info)
+            self._schemas[key] = (info, time.monotonic() + self.schema_ttl)
+            future.set_result(info)
+            return info
+        except BaseException as e:
+            future.set_exception(e)
+            # 没有其他等待者时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def invalidate(self, db_source: Optional[str] = None, db_name: Optional[str] = None) -> int:
+        """失效表结构缓存；不指定参数时清空全部"""
+        if db_source is None and db_name is None:
+            count = len(self._schemas)
+            self._schemas.clear()
+            return count
+        return 1 if self._schemas.pop((db_source or 'sql', db_name), None) else 0
+
+    def stats(self) -> dict:
+        return {
+            'engines': len(self._engines),
+            'cached_schemas': len(self._schemas),
+            'schema_hits': self.schema_hits,
+            'schema_misses': self.schema_misses
+        }
+
+
+def get_engine_registry() -> EngineRegistry:
+    """
+    获取数据库引擎注册表
+
+    配置项：
+    - database.schema_cache_ttl: 表结构缓存秒数（默认 300）
+    """
+    global _engine_registry
+    if _engine_registry is None:
+        _engine_registry = EngineRegistry(
+            schema_ttl=float(config_snapshot.get('database.schema_cache_ttl', 300))
+        )
+    return _engine_registry
+
+
+register_cache_size('schema', lambda: _engine_registry.stats()['cached_schemas'] if _engine_registry else None)
+
+
+class ArrowChunkSink:
+    """Arrow IPC 写入目标：缓存写入的字节，take() 取出后清空，用于逐批流式发送"""
+
+    closed = False
+
+    def __init__(self):
+        self._chunks: list = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def mask_sql_literals(statement: str) -> str:
+    """把字符串字面量、引号标识符与注释替换为空格，只保留 SQL 关键字与普通标识符"""
+    masked = SQL_LITERAL_PATTERN.sub(' ', statement)
+    if any(quote in masked for quote in ("'", '"', '`')):
+        raise HTTPException(status_code=400, detail='SQL 中存在未闭合的引号')
+    return masked
+
+
+def validate_readonly_sql(sql: str) -> str:
+    """
+    校验并返回单条只读查询语句（去除结尾分号）
+
+    只读由数据库事务强制执行，这里只为常见误用提前给出明确的错误信息；
+    关键字匹配跳过字符串字面量、引号标识符与注释，不会误拒其中出现的 update / file 等词。
+    """
+    statement = sql.strip().rstrip(';').strip()
+    if not statement:
+        raise HTTPException(status_code=400, detail='SQL 不能为空')
+    code = mask_sql_literals(statement)
+    if ';' in code:
+        raise HTTPException(status_code=400, detail='仅支持单条查询语句')
+    if not READONLY_SQL_PATTERN.match(code) or FORBIDDEN_SQL_PATTERN.search(code):
+        raise HTTPException(status_code=400, detail='仅支持只读 SELECT / WITH 查询')
+    match = FORBIDDEN_SQL_FUNCTIONS.search(code)
+    if match:
+        raise HTTPException(status_code=400, detail=f'不允许调用函数 {match.group(1)}')
+    return statement
+
+
+def encode_query_cursor(statement: str, offset: int) -> str:
+    raw = json.dumps({'offset': offset, 'q': hashlib.sha256(statement.encode('utf-8')).hexdigest()[:16]})
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_query_cursor(statement: str, cursor: Optional[str]) -> int:
+    if not cursor:
+        return 0
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        offset = int(data['offset'])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail='无效的 cursor')
+    if data.get('q') != hashlib.sha256(statement.encode('utf-8')).hexdigest()[:16]:
+        raise HTTPException(status_code=400, detail='cursor 与查询语句不匹配')
+    return max(0, offset)
+
+
+class QueryRowProducer:
+    """
+    在工作线程中执行分页查询，并把行按批次放入有界队列
+
+    只读由数据库强制：SQL 引擎在只读事务中执行（PostgreSQL / MySQL 为
+    READ ONLY 事务，SQLite 为 query_only），不支持只读事务的方言拒绝执行；
+    ClickHouse 以 readonly=1 执行。
+
+    队列满时生产者阻塞，内存占用与结果集大小无关。超时从 run() 开始执行查询
+    时计算；cancel() 设置取消标志，并尽力取消数据库端的执行（SQL 驱动的
+    cancel/interrupt，ClickHouse 由 max_execution_time 在服务端终止）。
+
+    依赖引擎实例暴露 engine（SQLAlchemy Engine，SQLEngine）或
+    client（clickhouse_connect 客户端，ClickHouseEngine）。
+    """
+
+    def __init__(
+        self,
+        engine,
+        db_source: Optional[str],
+        statement: str,
+        offset: int,
+        limit: int,
+        batch_size: int,
+        timeout: float
+    ):
+        self.engine = engine
+        self.db_source = db_source
+        # 多取一行用于判断是否还有下一页
+        self.paged_sql = f'SELECT * FROM ({statement}) AS _q LIMIT {int(limit) + 1} OFFSET {int(offset)}'
+        self.limit = limit
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.queue: queue.Queue = queue.Queue(maxsize=4)
+        self.cancelled = threading.Event()
+        self.timed_out = False
+        # run() 开始执行时设置，batches() 据此计算查询超时
+        self.deadline: Optional[float] = None
+        self._cancel_db: Optional[Callable[[], None]] = None
+
+    def _put(self, item: tuple) -> bool:
+        while not self.cancelled.is_set():
+            try:
+                self.queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _emit_rows(self, rows: list, emitted: int) -> int:
+        rows = rows[:max(0, self.limit - emitted)]
+        if rows:
+            self._put(('rows', rows))
+        return emitted + len(rows)
+
+    def run(self) -> None:
+        self.deadline = time.monotonic() + self.timeout
+        try:
+            if self.db_source == 'clickhouse':
+                self._run_clickhouse()
+            else:
+                self._run_sql()
+        except Exception as e:
+            if not self.cancelled.is_set():
+                logger.error(f"查询执行失败: {e}", exc_info=True)
+                self._put(('error', str(e)))
+
+    def _run_sql(self) -> None:
+        with self.engine.engine.connect() as conn:
+            dbapi_conn = conn.connection.dbapi_connection
+            self._cancel_db = getattr(dbapi_conn, 'cancel', None) or getattr(dbapi_conn, 'interrupt', None)
+            readonly_sql = READONLY_TRANSACTION_SQL.get(conn.dialect.name)
+            if readonly_sql is None:
+                raise ValueError(f'数据库方言 {conn.dialect.name} 不支持只读事务，拒绝执行查询')
+            trans = conn.begin()
+            try:
+                for sql in readonly_sql:
+                    conn.exec_driver_sql(sql)
+                if conn.dialect.name == 'postgresql':
+                    conn.exec_driver_sql(f'SET LOCAL statement_timeout = {int(self.timeout * 1000)}')
+                result = conn.execution_options(
+                    stream_results=True, max_row_buffer=self.batch_size
+                ).exec_driver_sql(self.paged_sql)
+                if not self._put(('columns', list(result.keys()))):
+                    return
+                emitted, fetched = 0, 0
+                for partition in result.partitions(self.batch_size):
+                    if self.cancelled.is_set():
+                        return
+                    fetched += len(partition)
+                    emitted = self._emit_rows([list(row) for row in partition], emitted)
+                self._put(('end', fetched > self.limit))
+            finally:
+                trans.rollback()
+                if conn.dialect.name == 'sqlite':
+                    # query_only 是连接级设置，归还连接池前恢复
+                    conn.exec_driver_sql('PRAGMA query_only = OFF')
+
+    def _run_clickhouse(self) -> None:
+        client = self.engine.client
+        settings = {'readonly': 1, 'max_execution_time': max(1, int(self.timeout))}
+        with client.query_row_block_stream(self.paged_sql, settings=settings) as stream:
+            if not self._put(('columns', list(stream.source.column_names))):
+                return
+            emitted, fetched = 0, 0
+            for block in stream:
+                if self.cancelled.is_set():
+                    return
+                fetched += len(block)
+                emitted = self._emit_rows([list(row) for row in block], emitted)
+            self._put(('end', fetched > self.limit))
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+        if self._cancel_db is not None:
+            try:
+                self._cancel_db()
+            except Exception as e:
+                logger.warning(f"取消数据库查询失败: {e}")
+
+    async def batches(self) -> AsyncIterator[tuple]:
+        """
+        异步读取 (kind, payload)，超时后取消查询并产出 ('error', ...)
+
+        超时从查询开始执行（run()）算起；查询还在线程池中排队时只等待。
+        """
+        while True:
+            remaining = 1.0
+            if self.deadline is not None:
+                remaining = self.deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timed_out = True
+                    self.cancel()
+                    yield 'error', f'查询超时（{self.timeout}s），已取消'
+                    return
+            try:
+                kind, payload = await asyncio.to_thread(self.queue.get, True, min(remaining, 1.0))
+            except queue.Empty:
+                continue
+            yield kind, payload
+            if kind in ('end', 'error'):
+                return
@@ -0,0 +1,326 @@
+"""
+文档目录
+"""
+import os
+import time
+import asyncio
+import json
+import base64
+import sqlite3
+import logging
+import threading
+from typing import Callable, Optional
+from datetime import datetime
+from pathlib import Path
+
+from fastapi import HTTPException
+
+from qa_backend.config_snapshot import config_snapshot
+from qa_backend.executors import run_blocking, spawn_detached
+from qa_backend.storage import open_sqlite
+
+
+logger = logging.getLogger(__name__)
+
+
+_document_catalog: Optional['DocumentCatalog'] = None
+_document_catalog_lock = threading.Lock()
+# 文档目录支持的文件类型 / 默认分页大小 / 统计缓存条目上限
+DOCUMENT_EXTENSIONS = {'.pdf', '.md'}
+DOCUMENT_PAGE_SIZE = 100
+CATALOG_STATS_CACHE_SIZE = 256
+
+
+class DocumentCatalog:
+    """
+    文档目录（SQLite）
+
+    记录 documents / processed_docs 两个存储下的文件元数据，由上传、摄取任务
+    增量维护，并由定期对账扫描兜底。/documents 直接查询目录，不再遍历文件系统。
+
+    每次写入递增 catalog_meta.version（与写入同一事务，其他进程的写入同样可见）；
+    筛选计数与标签汇总按版本缓存，目录未变化时不重复执行 COUNT / GROUP BY。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS documents ('
+            ' storage TEXT NOT NULL,'
+            ' relative_path TEXT NOT NULL,'
+            ' filename TEXT NOT NULL,'
+            ' label TEXT NOT NULL,'
+            ' file_type TEXT NOT NULL,'
+            ' size INTEGER NOT NULL,'
+            ' modified REAL NOT NULL,'
+            ' PRIMARY KEY (storage, relative_path))'
+        )
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_documents_modified'
+            ' ON documents (modified, storage, relative_path)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_documents_label ON documents (label, modified)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_documents_type ON documents (file_type, modified)')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS catalog_meta ('
+            ' id INTEGER PRIMARY KEY CHECK (id = 1),'
+            ' version INTEGER NOT NULL)'
+        )
+        conn.execute('INSERT OR IGNORE INTO catalog_meta (id, version) VALUES (1, 0)')
+        conn.commit()
+        self.last_reconcile: Optional[dict] = None
+        # 缓存键 -> (目录版本, 结果)
+        self._stats_cache: dict = {}
+        self._stats_lock = threading.Lock()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = open_sqlite(self.path)
+        return conn
+
+    @staticmethod
+    def _bump_version(conn: sqlite3.Connection) -> None:
+        conn.execute('UPDATE catalog_meta SET version = version + 1 WHERE id = 1')
+
+    def _cached(self, key: tuple, compute: Callable[[sqlite3.Connection], object]):
+        """按目录版本缓存统计结果；版本变化后重新计算"""
+        conn = self._conn()
+        version = conn.execute('SELECT version FROM catalog_meta WHERE id = 1').fetchone()[0]
+        with self._stats_lock:
+            cached = self._stats_cache.get(key)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+        value = compute(conn)
+        with self._stats_lock:
+            if len(self._stats_cache) >= CATALOG_STATS_CACHE_SIZE:
+                self._stats_cache.clear()
+            self._stats_cache[key] = (version, value)
+        return value
+
+    @staticmethod
+    def _describe(root_dir: str, filepath: str, stat: os.stat_result) -> tuple:
+        rel_path = os.path.relpath(filepath, root_dir)
+        path_parts = rel_path.split(os.sep)
+        label = path_parts[0] if len(path_parts) > 1 else 'general'
+        filename = os.path.basename(filepath)
+        return (
+            rel_path, filename, label, Path(filename).suffix.lower(),
+            stat.st_size, stat.st_mtime
+        )
+
+    def upsert(self, storage: str, root_dir: str, filepath: str) -> None:
+        """登记（或更新）单个文件"""
+        if Path(filepath).suffix.lower() not in DOCUMENT_EXTENSIONS:
+            return
+        row = self._describe(root_dir, filepath, os.stat(filepath))
+        conn = self._conn()
+        conn.execute(
+            'INSERT OR REPLACE INTO documents'
+            ' (storage, relative_path, filename, label, file_type, size, modified)'
+            ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (storage, *row)
+        )
+        self._bump_version(conn)
+        conn.commit()
+
+    def remove(self, storage: str, relative_paths: list) -> None:
+        conn = self._conn()
+        conn.executemany(
+            'DELETE FROM documents WHERE storage = ? AND relative_path = ?',
+            [(storage, rel_path) for rel_path in relative_paths]
+        )
+        self._bump_version(conn)
+        conn.commit()
+
+    def reconcile(self, roots: dict) -> dict:
+        """
+        对账扫描：使目录与文件系统一致
+
+        Args:
+            roots: storage -> 根目录
+
+        Returns:
+            各存储新增/更新/删除数量
+        """
+        started = time.perf_counter()
+        conn = self._conn()
+        summary = {}
+        for storage, root_dir in roots.items():
+            known = {
+                rel_path: (size, modified)
+                for rel_path, size, modified in conn.execute(
+                    'SELECT relative_path, size, modified FROM documents WHERE storage = ?',
+                    (storage,)
+                )
+            }
+            upserts = []
+            seen = set()
+            if os.path.exists(root_dir):
+                for dirpath, _, filenames in os.walk(root_dir):
+                    for filename in filenames:
+                        if Path(filename).suffix.lower() not in DOCUMENT_EXTENSIONS:
+                            continue
+                        filepath = os.path.join(dirpath, filename)
+                        try:
+                            row = self._describe(root_dir, filepath, os.stat(filepath))
+                        except FileNotFoundError:
+                            continue
+                        seen.add(row[0])
+                        if known.get(row[0]) != (row[4], row[5]):
+                            upserts.append((storage, *row))
+            removed = [rel_path for rel_path in known if rel_path not in seen]
+
+            conn.executemany(
+                'INSERT OR REPLACE INTO documents'
+                ' (storage, relative_path, filename, label, file_type, size, modified)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+                upserts
+            )
+            conn.executemany(
+                'DELETE FROM documents WHERE storage = ? AND relative_path = ?',
+                [(storage, rel_path) for rel_path in removed]
+            )
+            if upserts or removed:
+                self._bump_version(conn)
+            conn.commit()
+            summary[storage] = {'upserted': len(upserts), 'removed': len(removed)}
+
+        self.last_reconcile = {
+            'at': datetime.now().isoformat(),
+            'duration': round(time.perf_counter() - started, 3),
+            'storages': summary
+        }
+        logger.info(f"文档目录对账完成: {self.last_reconcile}")
+        return summary
+
+    @staticmethod
+    def encode_cursor(row: dict) -> str:
+        raw = json.dumps([row['modified'], row['storage'], row['relative_path']])
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> tuple:
+        try:
+            modified, storage, rel_path = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            return float(modified), str(storage), str(rel_path)
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail='无效的 cursor')
+
+    def query(
+        self,
+        label: Optional[str] = None,
+        storage: Optional[str] = None,
+        file_type: Optional[str] = None,
+        order: str = 'desc',
+        cursor: Optional[str] = None,
+        limit: int = DOCUMENT_PAGE_SIZE
+    ) -> dict:
+        """
+        按修改时间排序分页查询（键集分页，cursor 为上一页最后一条的排序键）
+
+        Returns:
+            documents、count（筛选后总数，按目录版本缓存）、next_cursor
+        """
+        where, params = [], []
+        if label:
+            where.append('label = ?')
+            params.append(label)
+        if storage:
+            where.append('storage = ?')
+            params.append(storage)
+        if file_type:
+            where.append('file_type = ?')
+            params.append(file_type if file_type.startswith('.') else f'.{file_type}')
+
+        filter_sql = f" WHERE {' AND '.join(where)}" if where else ''
+        total = self._cached(
+            ('count', filter_sql, tuple(params)),
+            lambda conn: conn.execute(f'SELECT COUNT(*) FROM documents{filter_sql}', params).fetchone()[0]
+        )
+
+        conn = self._conn()
+
+        page_where, page_params = list(where), list(params)
+        direction = 'DESC' if order == 'desc' else 'ASC'
+        if cursor:
+            comparator = '<' if order == 'desc' else '>'
+            page_where.append(f'(modified, storage, relative_path) {comparator} (?, ?, ?)')
+            page_params.extend(self.decode_cursor(cursor))
+        sql = (
+            'SELECT filename, label, relative_path, storage, file_type, size, modified FROM documents'
+            + (f" WHERE {' AND '.join(page_where)}" if page_where else '')
+            + f' ORDER BY modified {direction}, storage {direction}, relative_path {direction}'
+            + ' LIMIT ?'
+        )
+        page_params.append(limit + 1)
+
+        columns = ('filename', 'label', 'relative_path', 'storage', 'file_type', 'size', 'modified')
+        documents = [dict(zip(columns, row)) for row in conn.execute(sql, page_params)]
+        next_cursor = None
+        if len(documents) > limit:
+            documents = documents[:limit]
+            next_cursor = self.encode_cursor(documents[-1])
+        return {'documents': documents, 'count': total, 'next_cursor': next_cursor}
+
+    def aggregates(self) -> list:
+        """按标签统计文档数量与总大小（按目录版本缓存）"""
+        def compute(conn: sqlite3.Connection) -> list:
+            rows = conn.execute(
+                'SELECT label, COUNT(*), SUM(size) FROM documents GROUP BY label ORDER BY label'
+            ).fetchall()
+            return [{'label': label, 'count': count, 'size': size or 0} for label, count, size in rows]
+
+        return self._cached(('labels',), compute)
+
+
+def get_document_roots() -> dict:
+    return {
+        'documents': config_snapshot.get('vector_store.documents', './data/documents'),
+        'processed_docs': config_snapshot.get('vector_store.processed_docs', './data/processed_docs')
+    }
+
+
+def get_document_catalog() -> DocumentCatalog:
+    """
+    获取文档目录实例
+
+    配置项：
+    - vector_store.catalog_path: 目录数据库路径（默认 ./data/document_catalog.db）
+    - vector_store.catalog_reconcile_interval: 对账扫描间隔秒数（默认 600）
+    """
+    global _document_catalog
+    if _document_catalog is None:
+        with _document_catalog_lock:
+            if _document_catalog is None:
+                _document_catalog = DocumentCatalog(
+                    config_snapshot.get('vector_store.catalog_path', './data/document_catalog.db')
+                )
+    return _document_catalog
+
+
+def catalog_file(storage: str, filepath: str) -> None:
+    """登记文件到文档目录（失败只记录日志，由对账扫描兜底）"""
+    try:
+        get_document_catalog().upsert(storage, get_document_roots()[storage], filepath)
+    except Exception as e:
+        logger.warning(f"文档目录登记失败 {filepath}: {e}")
+
+
+async def reconcile_catalog_periodically() -> None:
+    """定期对账扫描文档目录"""
+    while True:
+        try:
+            await run_blocking('filesystem', get_document_catalog().reconcile, get_document_roots())
+        except Exception as e:
+            logger.error(f"文档目录对账失败: {e}", exc_info=True)
+        interval = float(config_snapshot.get('vector_store.catalog_reconcile_interval', 600))
+        await asyncio.sleep(interval)
+
+
+async def start_catalog_reconcile() -> None:
+    """应用启动时开始定期对账（首次立即执行）"""
+    spawn_detached(reconcile_catalog_periodically())
@@ -0,0 +1,259 @@
+"""
+阻塞调用隔离与事件循环监控
+"""
+import sys
+import time
+import asyncio
+import logging
+import threading
+import functools
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Coroutine, Optional
+from datetime import datetime
+
+from qa_backend.config_snapshot import config_snapshot
+from qa_backend.metrics import Gauge, metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+# 脱离请求生命周期运行的异步任务（保持引用，避免被垃圾回收）
+_detached_tasks: set = set()
+_blocking_executors: Optional['BlockingExecutors'] = None
+_blocking_executors_lock = threading.Lock()
+_loop_monitor: Optional['LoopLagMonitor'] = None
+# 阻塞调用线程池及默认并发数（可通过 executors.<name>.max_workers 配置覆盖）
+BLOCKING_POOLS = {
+    'chat_store': 8,
+    'vector_store': 4,
+    'filesystem': 4,
+    'database': 8
+}
+
+
+class BlockingExecutors:
+    """
+    按服务划分的有界线程池
+
+    ChatStore、向量库、本地文件/SQLite、数据库的同步调用分别进入各自的线程池，
+    一个服务变慢只会占满自己的池，不会阻塞事件循环或拖慢其他服务。
+    超过 max_workers 的调用在事件循环中排队等待（不在线程池队列中堆积），
+    排队等待时间计入统计。
+    """
+
+    def __init__(self, sizes: dict):
+        self.sizes = dict(sizes)
+        self._executors: dict = {}
+        self._semaphores: dict = {}
+        self._stats: dict = {
+            name: {'inflight': 0, 'waiting': 0, 'completed': 0, 'errors': 0, 'max_wait': 0.0}
+            for name in self.sizes
+        }
+
+    def _executor(self, pool: str) -> ThreadPoolExecutor:
+        executor = self._executors.get(pool)
+        if executor is None:
+            executor = self._executors[pool] = ThreadPoolExecutor(
+                max_workers=self.sizes[pool], thread_name_prefix=f'blocking-{pool}'
+            )
+            self._semaphores[pool] = asyncio.Semaphore(self.sizes[pool])
+        return executor
+
+    async def run(self, pool: str, func: Callable, *args, **kwargs):
+        """在 pool 对应的线程池中执行 func(*args, **kwargs)"""
+        if pool not in self.sizes:
+            raise ValueError(f'未知的线程池: {pool}')
+        executor = self._executor(pool)
+        stats = self._stats[pool]
+        waited = time.perf_counter()
+        stats['waiting'] += 1
+        async with self._semaphores[pool]:
+            stats['waiting'] -= 1
+            stats['max_wait'] = max(stats['max_wait'], time.perf_counter() - waited)
+            stats['inflight'] += 1
+            try:
+                return await asyncio.get_running_loop().run_in_executor(
+                    executor, functools.partial(func, *args, **kwargs)
+                )
+            except Exception:
+                stats['errors'] += 1
+                raise
+            finally:
+                stats['inflight'] -= 1
+                stats['completed'] += 1
+
+    def shutdown(self) -> None:
+        for executor in self._executors.values():
+            executor.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        return {
+            name: {**stats, 'max_workers': self.sizes[name], 'max_wait': round(stats['max_wait'], 3)}
+            for name, stats in self._stats.items()
+        }
+
+
+def get_blocking_executors() -> BlockingExecutors:
+    """
+    获取阻塞调用线程池
+
+    配置项：
+    - executors.<name>.max_workers: 各线程池并发数（name 见 BLOCKING_POOLS）
+    """
+    global _blocking_executors
+    if _blocking_executors is None:
+        with _blocking_executors_lock:
+            if _blocking_executors is None:
+                _blocking_executors = BlockingExecutors({
+                    name: int(config_snapshot.get(f'executors.{name}.max_workers', default))
+                    for name, default in BLOCKING_POOLS.items()
+                })
+    return _blocking_executors
+
+
+async def run_blocking(pool: str, func: Callable, *args, **kwargs):
+    """在指定服务的线程池中执行同步调用"""
+    return await get_blocking_executors().run(pool, func, *args, **kwargs)
+
+
+def spawn_detached(coro: Coroutine) -> asyncio.Task:
+    """创建脱离请求生命周期运行的异步任务（保持引用直到完成）"""
+    task = asyncio.create_task(coro)
+    _detached_tasks.add(task)
+    task.add_done_callback(_detached_tasks.discard)
+    return task
+
+
+async def shutdown_blocking_executors() -> None:
+    if _blocking_executors is not None:
+        _blocking_executors.shutdown()
+
+
+def _collect_executor_stats(field: str) -> Callable[[], dict]:
+    def collect() -> dict:
+        if _blocking_executors is None:
+            return {}
+        return {(name,): stats[field] for name, stats in _blocking_executors.stats().items()}
+
+    return collect
+
+
+metrics.register(Gauge(
+    'qa_blocking_executor_inflight', '阻塞调用线程池中执行中的调用数', ('pool',),
+    collect=_collect_executor_stats('inflight')
+))
+metrics.register(Gauge(
+    'qa_blocking_executor_waiting', '等待阻塞调用线程池的调用数', ('pool',),
+    collect=_collect_executor_stats('waiting')
+))
+
+
+class LoopLagMonitor:
+    """
+    事件循环延迟监控
+
+    协程每 interval 秒醒来一次，实际睡眠时长超出 interval 的部分即为循环延迟，
+    记录最近样本、最大值与超过 stall_threshold 的卡顿次数。另有看门狗线程检查
+    心跳：循环卡住超过 stall_threshold 时抓取事件循环线程的当前调用栈并记录日志，
+    用于定位阻塞事件循环的慢回调（每次卡顿只记录一次）。
+    """
+
+    def __init__(self, interval: float = 0.5, stall_threshold: float = 0.2, samples: int = 600):
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.lags: deque = deque(maxlen=samples)
+        self.max_lag = 0.0
+        self.stall_count = 0
+        self.slow_callbacks = 0
+        self.last_stall: Optional[dict] = None
+        self._beat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._stopped = threading.Event()
+
+    async def run(self) -> None:
+        self._loop_thread_id = threading.get_ident()
+        threading.Thread(target=self._watchdog, name='loop-lag-watchdog', daemon=True).start()
+        try:
+            while True:
+                expected = time.monotonic() + self.interval
+                await asyncio.sleep(self.interval)
+                now = time.monotonic()
+                self._beat = now
+                lag = max(0.0, now - expected)
+                self.lags.append(lag)
+                self.max_lag = max(self.max_lag, lag)
+                if lag >= self.stall_threshold:
+                    self.stall_count += 1
+                    self.last_stall = {'at': datetime.now().isoformat(), 'lag': round(lag, 3)}
+                    logger.warning(f"事件循环卡顿 {lag:.3f}s")
+        finally:
+            self._stopped.set()
+
+    def _watchdog(self) -> None:
+        reported_beat = None
+        while not self._stopped.wait(self.stall_threshold / 2):
+            beat = self._beat
+            stalled = time.monotonic() - beat - self.interval
+            if stalled < self.stall_threshold or beat == reported_beat:
+                continue
+            reported_beat = beat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            self.slow_callbacks += 1
+            stack = ''.join(traceback.format_stack(frame, limit=15))
+            logger.warning(f"事件循环被阻塞超过 {stalled:.3f}s，当前调用栈:\n{stack}")
+
+    def stats(self) -> dict:
+        lags = sorted(self.lags)
+
+        def percentile(q: float) -> float:
+            return round(lags[min(len(lags) - 1, int(q * len(lags)))], 4) if lags else 0.0
+
+        return {
+            'interval': self.interval,
+            'stall_threshold': self.stall_threshold,
+            'lag_p50': percentile(0.5),
+            'lag_p99': percentile(0.99),
+            'lag_max': round(self.max_lag, 4),
+            'stall_count': self.stall_count,
+            'slow_callbacks': self.slow_callbacks,
+            'last_stall': self.last_stall
+        }
+
+
+async def start_loop_monitor() -> None:
+    """
+    启动事件循环延迟监控
+
+    配置项：
+    - loop_monitor.enabled: 是否启用（默认 true）
+    - loop_monitor.interval: 采样间隔秒数（默认 0.5）
+    - loop_monitor.stall_threshold: 卡顿阈值秒数（默认 0.2）
+    """
+    global _loop_monitor
+    if not config_snapshot.get('loop_monitor.enabled', True):
+        return
+    _loop_monitor = LoopLagMonitor(
+        interval=float(config_snapshot.get('loop_monitor.interval', 0.5)),
+        stall_threshold=float(config_snapshot.get('loop_monitor.stall_threshold', 0.2))
+    )
+    spawn_detached(_loop_monitor.run())
+
+
+def loop_monitor_stats() -> Optional[dict]:
+    """事件循环延迟统计（未启用监控时返回 None）"""
+    return _loop_monitor.stats() if _loop_monitor else None
+
+
+metrics.register(Gauge(
+    'qa_event_loop_lag_max_seconds', '事件循环最大延迟',
+    collect=lambda: round(_loop_monitor.max_lag, 6) if _loop_monitor else 0
+))
+metrics.register(Gauge(
+    'qa_event_loop_stalls', '事件循环卡顿次数（累计）',
+    collect=lambda: _loop_monitor.stall_count if _loop_monitor else 0
+))
@@ -0,0 +1,251 @@
+"""
+Agent 准入控制与相同问题合并
+"""
+import time
+import asyncio
+import threading
+import contextlib
+from typing import Callable, Optional
+
+from fastapi import HTTPException
+
+from qa_backend.answer_cache import normalize_query
+from qa_backend.config_snapshot import config_snapshot
+from qa_backend.metrics import (
+    Gauge, agent_admission_wait, agent_rejections, chat_coalesced, metrics, session_lock_wait
+)
+from qa_backend.models import ChatWithContextRequest
+
+
+_agent_governor: Optional['AgentGovernor'] = None
+_agent_governor_lock = threading.Lock()
+_query_coalescer: Optional['QueryCoalescer'] = None
+_query_coalescer_lock = threading.Lock()
+
+
+class AgentGovernor:
+    """
+    Agent 调用准入控制
+
+    - 全局并发上限：同时执行的 Agent 调用最多 max_inflight 个
+    - 有界等待队列：排队数达到 max_waiting 时立即返回 429，排队超过
+      queue_timeout 秒同样返回 429（均带 Retry-After）
+    - 会话锁：同一 session_id 的轮次按到达顺序串行执行（读记忆 → Agent → 写入），
+      锁在该会话没有等待者时自动回收
+    """
+
+    def __init__(
+        self,
+        max_inflight: int = 8,
+        max_waiting: int = 32,
+        queue_timeout: float = 30.0,
+        retry_after: int = 5
+    ):
+        self.max_inflight = max_inflight
+        self.max_waiting = max_waiting
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._semaphore = asyncio.Semaphore(max_inflight)
+        self.inflight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = {'queue_full': 0, 'timeout': 0}
+        # session_id -> [asyncio.Lock, 持有或等待该锁的请求数]
+        self._sessions: dict = {}
+
+    def _reject(self, reason: str, detail: str) -> None:
+        self.rejected[reason] += 1
+        agent_rejections.inc(reason=reason)
+        raise HTTPException(
+            status_code=429, detail=detail, headers={'Retry-After': str(self.retry_after)}
+        )
+
+    def check_capacity(self) -> None:
+        """等待队列已满时抛出 429（流式接口在开始响应前调用）"""
+        if self._semaphore.locked() and self.waiting >= self.max_waiting:
+            self._reject('queue_full', 'Agent 繁忙，请稍后重试')
+
+    @contextlib.asynccontextmanager
+    async def admit(self):
+        """获取一个 Agent 执行名额"""
+        self.check_capacity()
+        self.waiting += 1
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._reject('timeout', f'Agent 排队超过 {self.queue_timeout}s，请稍后重试')
+        finally:
+            self.waiting -= 1
+            agent_admission_wait.observe(time.perf_counter() - started)
+        self.inflight += 1
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self.inflight -= 1
+            self._semaphore.release()
+
+    async def acquire_session(self, session_id: str) -> Callable[[], None]:
+        """获取会话锁，返回释放函数（可在其他任务中调用，重复调用无副作用）"""
+        entry = self._sessions.setdefault(session_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        started = time.perf_counter()
+        try:
+            await entry[0].acquire()
+        except BaseException:
+            self._drop_session(session_id, entry)
+            raise
+        session_lock_wait.observe(time.perf_counter() - started)
+        released = False
+
+        def release() -> None:
+            nonlocal released
+            if not released:
+                released = True
+                entry[0].release()
+                self._drop_session(session_id, entry)
+
+        return release
+
+    def _drop_session(self, session_id: str, entry: list) -> None:
+        entry[1] -= 1
+        if entry[1] == 0 and self._sessions.get(session_id) is entry:
+            del self._sessions[session_id]
+
+    def stats(self) -> dict:
+        return {
+            'max_inflight': self.max_inflight,
+            'inflight': self.inflight,
+            'waiting': self.waiting,
+            'admitted': self.admitted,
+            'rejected': dict(self.rejected),
+            'locked_sessions': len(self._sessions)
+        }
+
+
+def get_agent_governor() -> AgentGovernor:
+    """
+    获取 Agent 准入控制器
+
+    配置项：
+    - agent.max_concurrency: 全局并发 Agent 调用上限（默认 8）
+    - agent.max_queue: 等待队列上限（默认 32）
+    - agent.queue_timeout: 最长排队秒数（默认 30）
+    - agent.retry_after: 429 响应的 Retry-After 秒数（默认 5）
+    """
+    global _agent_governor
+    if _agent_governor is None:
+        with _agent_governor_lock:
+            if _agent_governor is None:
+                _agent_governor = AgentGovernor(
+                    max_inflight=int(config_snapshot.get('agent.max_concurrency', 8)),
+                    max_waiting=int(config_snapshot.get('agent.max_queue', 32)),
+                    queue_timeout=float(config_snapshot.get('agent.queue_timeout', 30)),
+                    retry_after=int(config_snapshot.get('agent.retry_after', 5))
+                )
+    return _agent_governor
+
+
+def agent_governor_stats() -> Optional[dict]:
+    """准入控制统计（未创建时返回 None）"""
+    return _agent_governor.stats() if _agent_governor else None
+
+
+metrics.register(Gauge(
+    'qa_agent_waiting_calls', '等待 Agent 执行名额的调用数',
+    collect=lambda: _agent_governor.waiting if _agent_governor else 0
+))
+
+
+class _LeaderCancelled(Exception):
+    """合并执行的 leader 被取消，follower 需自行重新执行"""
+
+
+class QueryCoalescer:
+    """
+    相同问题合并执行（single-flight）
+
+    同一键的请求在已有执行进行中时不再调用 Agent，而是等待该次执行并复用结果。
+    只用于无会话历史的请求（键中不含记忆，调用方负责保证），各会话的
+    ChatStore 写入仍由各自请求完成。leader 失败时 follower 收到同一异常；
+    leader 被取消时 follower 改为自行执行。
+    """
+
+    def __init__(self):
+        self._inflight: dict = {}
+        self.leaders = 0
+        self.followers = 0
+        self.retries = 0
+
+    @staticmethod
+    def make_key(request: ChatWithContextRequest) -> str:
+        # Agent 只接收问题与会话记忆，无历史时答案只取决于规范化后的问题
+        return normalize_query(request.query)
+
+    async def run(self, key: str, factory: Callable) -> tuple:
+        """
+        执行或加入同键的执行
+
+        Returns:
+            (result, coalesced)；coalesced 为 True 表示复用了其他请求的结果
+        """
+        while True:
+            future = self._inflight.get(key)
+            if future is None:
+                break
+            self.followers += 1
+            chat_coalesced.inc(role='follower')
+            try:
+                return await asyncio.shield(future), True
+            except _LeaderCancelled:
+                self.retries += 1
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        self.leaders += 1
+        chat_coalesced.inc(role='leader')
+        try:
+            result = await factory()
+        except BaseException as e:
+            future.set_exception(
+                _LeaderCancelled() if isinstance(e, asyncio.CancelledError) else e
+            )
+            # 标记异常已读取，无 follower 时不产生 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        return {
+            'inflight_keys': len(self._inflight),
+            'leaders': self.leaders,
+            'followers': self.followers,
+            'retries': self.retries
+        }
+
+
+def get_query_coalescer() -> Optional[QueryCoalescer]:
+    """
+    获取相同问题合并器
+
+    配置项：
+    - coalesce.enabled: 是否合并相同的无历史问题（默认 True）
+    """
+    global _query_coalescer
+    if not config_snapshot.get('coalesce.enabled', True):
+        return None
+    if _query_coalescer is None:
+        with _query_coalescer_lock:
+            if _query_coalescer is None:
+                _query_coalescer = QueryCoalescer()
+    return _query_coalescer
+
+
+def query_coalescer_stats() -> Optional[dict]:
+    """问题合并统计（未创建时返回 None）"""
+    return _query_coalescer.stats() if _query_coalescer else None
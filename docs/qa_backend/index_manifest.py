@@ -0,0 +1,168 @@
+"""
+索引清单
+"""
+import os
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from qa_backend.config_snapshot import config_snapshot
+
+
+logger = logging.getLogger(__name__)
+
+
+class IndexManifest:
+    """
+    预处理文档清单（相对路径 -> size / mtime / sha256）
+
+    size 与 mtime 均未变化的文件视为未修改，不读取内容；
+    两者之一变化时再比较内容哈希，避免 touch 等操作触发重建。
+    上传索引成功的文件通过 record() 登记，/update_index 不会再次处理。
+    """
+
+    EXTENSIONS = {'.md'}
+    # 计算内容哈希时的读取块大小
+    HASH_CHUNK_SIZE = 1024 * 1024
+    # 进程内串行化清单的读-改-写
+    _write_lock = threading.Lock()
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = self._load()
+
+    def _load(self) -> dict:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f).get('files', {})
+        except (OSError, ValueError) as e:
+            logger.warning(f"索引清单读取失败，将全量比对: {e}")
+            return {}
+
+    @staticmethod
+    def _hash_file(filepath: str) -> str:
+        hasher = hashlib.sha256()
+        with open(filepath, 'rb') as f:
+            for chunk in iter(lambda: f.read(IndexManifest.HASH_CHUNK_SIZE), b''):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    def diff(self, root_dir: str) -> dict:
+        """
+        比对目录与清单
+
+        Returns:
+            包含 checked、added、modified、removed（相对路径列表）及
+            entries（比对后的新清单）的字典
+        """
+        entries = {}
+        added, modified = [], []
+
+        if os.path.exists(root_dir):
+            for dirpath, _, filenames in os.walk(root_dir):
+                for filename in filenames:
+                    if Path(filename).suffix.lower() not in self.EXTENSIONS:
+                        continue
+                    filepath = os.path.join(dirpath, filename)
+                    rel_path = os.path.relpath(filepath, root_dir)
+                    stat = os.stat(filepath)
+                    previous = self.entries.get(rel_path)
+
+                    if (
+                        previous
+                        and previous['size'] == stat.st_size
+                        and previous['mtime'] == stat.st_mtime
+                    ):
+                        entries[rel_path] = previous
+                        continue
+
+                    entry = {
+                        'size': stat.st_size,
+                        'mtime': stat.st_mtime,
+                        'sha256': self._hash_file(filepath)
+                    }
+                    entries[rel_path] = entry
+                    if previous is None:
+                        added.append(rel_path)
+                    elif previous['sha256'] != entry['sha256']:
+                        modified.append(rel_path)
+
+        removed = [rel_path for rel_path in self.entries if rel_path not in entries]
+        return {
+            'checked': len(entries),
+            'added': added,
+            'modified': modified,
+            'removed': removed,
+            'entries': entries
+        }
+
+    def _entry(self, filepath: str) -> dict:
+        stat = os.stat(filepath)
+        return {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': self._hash_file(filepath)}
+
+    def record(self, root_dir: str, filepaths: list) -> None:
+        """登记已写入向量库的文件（上传 / 批量上传索引成功后调用）"""
+        updates = {}
+        for filepath in filepaths:
+            if Path(filepath).suffix.lower() not in self.EXTENSIONS or not os.path.exists(filepath):
+                continue
+            updates[os.path.relpath(filepath, root_dir)] = self._entry(filepath)
+        if not updates:
+            return
+        with self._write_lock:
+            self.entries = self._load()
+            self.entries.update(updates)
+            self._write()
+
+    def commit(self, diff: dict) -> None:
+        """
+        原子写入比对后的清单
+
+        比对之后由 record() 登记的文件保留，不会被覆盖。
+        """
+        with self._write_lock:
+            current = self._load()
+            removed = set(diff['removed'])
+            entries = dict(diff['entries'])
+            for rel_path, entry in current.items():
+                if rel_path not in entries and rel_path not in removed:
+                    entries[rel_path] = entry
+            self.entries = entries
+            self._write()
+
+    def _write(self) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.manifest-', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(
+                    {'updated_at': datetime.now().isoformat(), 'files': self.entries},
+                    f,
+                    ensure_ascii=False
+                )
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+
+def load_index_manifest() -> IndexManifest:
+    """
+    读取索引清单
+
+    配置项：
+    - vector_store.manifest_path: 清单文件路径
+    """
+    return IndexManifest(config_snapshot.get(
+        'vector_store.manifest_path', './data/index_manifest.json'
+    ))
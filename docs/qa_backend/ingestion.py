@@ -0,0 +1,664 @@
+"""
+摄取调度与后台索引任务
+"""
+import os
+import time
+import uuid
+import asyncio
+import logging
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional
+from datetime import datetime
+from pathlib import Path
+
+from src.services.vector_store import VectorStoreService
+from src.utils.ingestion_handler import IngestionHandler
+
+from qa_backend.answer_cache import bump_index_version
+from qa_backend.config_snapshot import config_snapshot
+from qa_backend.documents import catalog_file, get_document_catalog
+from qa_backend.index_manifest import load_index_manifest
+from qa_backend.metrics import Gauge, ingestion_stage_duration, metrics, preprocess_page_duration
+from qa_backend.tasks import TASK_KIND_UPDATE, TASK_KIND_UPLOAD, get_task_store
+
+
+logger = logging.getLogger(__name__)
+
+
+# 自定义异常类
+class PreprocessingError(Exception):
+    """预处理阶段错误"""
+    pass
+
+
+class IndexingError(Exception):
+    """索引阶段错误"""
+    pass
+
+
+class IngestionQueueFullError(Exception):
+    """摄取队列已满"""
+    pass
+
+
+_ingestion_scheduler: Optional['IngestionScheduler'] = None
+_ingestion_scheduler_lock = threading.Lock()
+
+
+def _preprocess_in_worker(input_file: str, output_dir: str) -> dict:
+    """在预处理子进程中执行 MinerU 预处理（必须是模块级函数以便序列化）"""
+    ingestion_service = IngestionHandler.get_instance()
+    return ingestion_service.preprocess_single_file(
+        input_file=input_file,
+        output_dir=output_dir
+    )
+
+
+class IngestionScheduler:
+    """
+    文档摄取调度器
+
+    - 任务执行线程池（runner）：大小等于预处理并发数，按提交顺序执行摄取任务
+    - 预处理进程池：CPU 密集的 MinerU 预处理在独立进程中运行，不占用服务线程池
+    - 索引线程池：build_index / update_index 使用更小的独立线程池
+    - 索引提交按时间窗口 / 批次大小合并，一次 build_index 处理多个文件；
+      批次窗口由独立的计时线程等待，索引线程只执行实际的 build_index
+    - 等待队列有上限，超出时拒绝提交（IngestionQueueFullError）
+    """
+
+    def __init__(
+        self,
+        preprocess_workers: int = 2,
+        index_workers: int = 1,
+        max_queue_size: int = 100,
+        mp_context: str = 'spawn',
+        index_batch_size: int = 16,
+        index_batch_window: float = 2.0
+    ):
+        self.preprocess_workers = preprocess_workers
+        self.index_workers = index_workers
+        self.max_queue_size = max_queue_size
+        self.index_batch_size = index_batch_size
+        self.index_batch_window = index_batch_window
+        self._runner = ThreadPoolExecutor(
+            max_workers=preprocess_workers, thread_name_prefix='ingestion-runner'
+        )
+        self._preprocess_pool = ProcessPoolExecutor(
+            max_workers=preprocess_workers,
+            mp_context=multiprocessing.get_context(mp_context)
+        )
+        self._index_pool = ThreadPoolExecutor(
+            max_workers=index_workers, thread_name_prefix='ingestion-index'
+        )
+        # task_id -> 入队时间，按提交顺序排列
+        self._waiting: OrderedDict = OrderedDict()
+        self._running = 0
+        self._accepting = True
+        self._lock = threading.Lock()
+        # directory -> {'deadline': 提交截止时间, 'items': [(filepath, callback), ...]}
+        self._pending_commits: dict = {}
+        self._commit_cond = threading.Condition()
+        self._batcher: Optional[threading.Thread] = None
+        self._batcher_stopping = False
+
+    def submit(self, task_id: str, func: Callable, *args) -> int:
+        """
+        提交摄取任务
+
+        Returns:
+            排队位置（1 表示下一个执行，0 表示立即执行）
+        """
+        with self._lock:
+            if not self._accepting:
+                raise IngestionQueueFullError('摄取服务正在关闭，暂不接受新任务')
+            if len(self._waiting) >= self.max_queue_size:
+                raise IngestionQueueFullError(
+                    f'摄取队列已满（{self.max_queue_size}），请稍后重试'
+                )
+            self._waiting[task_id] = time.time()
+            position = max(0, len(self._waiting) + self._running - self.preprocess_workers)
+
+        self._runner.submit(self._run, task_id, func, *args)
+        return position
+
+    def has_capacity(self) -> bool:
+        with self._lock:
+            return self._accepting and len(self._waiting) < self.max_queue_size
+
+    def is_accepting(self) -> bool:
+        """是否仍接受新任务（shutdown 后返回 False）"""
+        with self._lock:
+            return self._accepting
+
+    def queue_position(self, task_id: str) -> Optional[int]:
+        """返回任务在等待队列中的位置（从 1 开始），不在队列中返回 None"""
+        with self._lock:
+            for position, waiting_id in enumerate(self._waiting, start=1):
+                if waiting_id == task_id:
+                    return position
+        return None
+
+    def queue_depth(self) -> int:
+        with self._lock:
+            return len(self._waiting)
+
+    def running_count(self) -> int:
+        with self._lock:
+            return self._running
+
+    def _run(self, task_id: str, func: Callable, *args) -> None:
+        with self._lock:
+            enqueued_at = self._waiting.pop(task_id, None)
+            self._running += 1
+        if enqueued_at is not None:
+            ingestion_stage_duration.observe(time.time() - enqueued_at, stage='queue_wait')
+        try:
+            func(task_id, *args)
+        except Exception as e:
+            logger.error(f"[{task_id}] 摄取任务异常: {e}", exc_info=True)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def preprocess(self, input_file: str, output_dir: str) -> dict:
+        """在预处理进程池中执行预处理（阻塞当前 runner 线程）"""
+        started = time.perf_counter()
+        result = self._preprocess_pool.submit(
+            _preprocess_in_worker, input_file, output_dir
+        ).result()
+        duration = time.perf_counter() - started
+        ingestion_stage_duration.observe(duration, stage='preprocess')
+        pages = result.get('page_count') or result.get('pages') if isinstance(result, dict) else None
+        if isinstance(pages, int) and pages > 0:
+            preprocess_page_duration.observe(duration / pages)
+        return result
+
+    def run_index(self, func: Callable, *args, **kwargs):
+        """在索引线程池中执行索引操作（阻塞当前 runner 线程）"""
+        started = time.perf_counter()
+        try:
+            return self._index_pool.submit(func, *args, **kwargs).result()
+        finally:
+            ingestion_stage_duration.observe(time.perf_counter() - started, stage='index')
+
+    def commit_index(
+        self,
+        directory: str,
+        filepath: str,
+        callback: Callable[[Optional[dict], Optional[BaseException]], None]
+    ) -> None:
+        """
+        提交文件到索引批次（不阻塞调用方）
+
+        同一 directory 的文件在 index_batch_window 秒内或达到 index_batch_size 时
+        合并为一次 build_index，完成后对每个文件调用 callback(result, error)。
+        """
+        with self._commit_cond:
+            if not self._batcher_stopping:
+                if self._batcher is None:
+                    self._batcher = threading.Thread(
+                        target=self._batch_loop, name='ingestion-batcher', daemon=True
+                    )
+                    self._batcher.start()
+                batch = self._pending_commits.get(directory)
+                if batch is None:
+                    batch = self._pending_commits[directory] = {
+                        'deadline': time.monotonic() + self.index_batch_window,
+                        'items': []
+                    }
+                batch['items'].append((filepath, callback))
+                self._commit_cond.notify_all()
+                return
+        # 计时线程已停止（关闭过程中）：不再等待窗口，直接单独提交
+        self._index_pool.submit(self._commit_batch, directory, [(filepath, callback)])
+
+    def _batch_loop(self) -> None:
+        """批次计时线程：窗口到期或攒满批次时把批次交给索引线程池"""
+        while True:
+            with self._commit_cond:
+                ready = self._take_ready_batches()
+                while not ready:
+                    if self._batcher_stopping:
+                        return
+                    deadlines = [pending['deadline'] for pending in self._pending_commits.values()]
+                    timeout = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+                    self._commit_cond.wait(timeout)
+                    ready = self._take_ready_batches()
+            for directory, batch in ready:
+                self._index_pool.submit(self._commit_batch, directory, batch)
+
+    def _take_ready_batches(self) -> list:
+        """取出可提交的批次（需持有 _commit_cond）；窗口未到期时只取攒满的整批"""
+        now = time.monotonic()
+        ready = []
+        for directory in list(self._pending_commits):
+            pending = self._pending_commits[directory]
+            items = pending['items']
+            due = pending['deadline'] <= now or self._batcher_stopping
+            cut = len(items) if due else len(items) - len(items) % self.index_batch_size
+            for start in range(0, cut, self.index_batch_size):
+                ready.append((directory, items[start:start + self.index_batch_size]))
+            if cut == len(items):
+                del self._pending_commits[directory]
+            else:
+                # 剩余文件沿用原截止时间，留给下一批
+                pending['items'] = items[cut:]
+        return ready
+
+    def _stop_batcher(self) -> None:
+        """停止计时线程，未到期的批次立即提交"""
+        with self._commit_cond:
+            self._batcher_stopping = True
+            self._commit_cond.notify_all()
+            batcher = self._batcher
+        if batcher is not None:
+            batcher.join()
+
+    def _commit_batch(self, directory: str, batch: list) -> None:
+        batch_id = uuid.uuid4().hex[:12]
+        files = [filepath for filepath, _ in batch]
+        logger.info(f"[batch {batch_id}] 合并索引 {len(files)} 个文件")
+        try:
+            result = self._build_index(directory, files)
+        except Exception as e:
+            result, error = None, e
+        else:
+            error = None if result.get('success') else IndexingError(
+                result.get('message', 'Unknown error')
+            )
+
+        # 批次失败时逐个文件重试，避免单个文件拖垮整批
+        if error is not None and len(batch) > 1:
+            logger.warning(f"[batch {batch_id}] 批量索引失败，逐个重试: {error}")
+            for filepath, callback in batch:
+                try:
+                    single = self._build_index(directory, [filepath])
+                    single['batch'] = {'id': batch_id, 'size': 1}
+                    callback(single, None)
+                except Exception as e:
+                    callback(None, e)
+            return
+
+        if result is not None:
+            result['batch'] = {
+                'id': batch_id,
+                'size': len(batch),
+                'documents_processed': result.get('documents_processed')
+            }
+        for _, callback in batch:
+            try:
+                callback(self._file_result(result, len(batch)), error)
+            except Exception as e:
+                logger.error(f"[batch {batch_id}] 索引回调异常: {e}", exc_info=True)
+
+    @staticmethod
+    def _file_result(result: Optional[dict], batch_size: int) -> Optional[dict]:
+        """
+        单个文件的批次结果
+
+        build_index 只返回整批的文档数：单文件批次即为该文件的文档数；多文件批次
+        无法得知各文件的文档数，documents_processed 置为 None，批次总数见 batch 字段。
+        """
+        if result is None or batch_size == 1:
+            return result
+        return {**result, 'documents_processed': None}
+
+    @staticmethod
+    def _build_index(directory: str, files: list) -> dict:
+        ingestion_service = IngestionHandler.get_instance()
+        started = time.perf_counter()
+        try:
+            result = ingestion_service.build_index(
+                directory=directory,
+                input_files=files,
+                rebuild=False,
+                check_duplicates=True
+            )
+        finally:
+            ingestion_stage_duration.observe(time.perf_counter() - started, stage='index')
+        if result.get('success'):
+            # 登记到索引清单，/update_index 不再把这些文件当作新增
+            try:
+                load_index_manifest().record(directory, files)
+            except Exception as e:
+                logger.warning(f"索引清单登记失败: {e}")
+            if result.get('documents_processed'):
+                bump_index_version()
+        return result
+
+    def shutdown(self, timeout: Optional[float] = None) -> None:
+        """停止接收新任务，并等待已提交任务执行完毕"""
+        with self._lock:
+            self._accepting = False
+            pending = len(self._waiting) + self._running
+        logger.info(f"摄取调度器开始排空，剩余任务: {pending}")
+
+        drain = threading.Thread(target=self._runner.shutdown, kwargs={'wait': True})
+        drain.start()
+        drain.join(timeout)
+        if drain.is_alive():
+            logger.warning("摄取调度器排空超时，未完成的任务将被中断")
+        self._stop_batcher()
+        self._index_pool.shutdown(wait=not drain.is_alive())
+        self._preprocess_pool.shutdown(wait=not drain.is_alive(), cancel_futures=True)
+        logger.info("摄取调度器已关闭")
+
+
+def get_ingestion_scheduler() -> IngestionScheduler:
+    """
+    获取摄取调度器实例
+
+    配置项：
+    - ingestion.preprocess_workers: 预处理进程数（默认 2）
+    - ingestion.index_workers: 索引线程数（默认 1）
+    - ingestion.max_queue_size: 等待队列上限（默认 100）
+    - ingestion.mp_context: 进程启动方式（默认 spawn）
+    - ingestion.index_batch_size: 单次 build_index 最多合并的文件数（默认 16）
+    - ingestion.index_batch_window: 索引批次等待窗口秒数（默认 2.0）
+    """
+    global _ingestion_scheduler
+    if _ingestion_scheduler is None:
+        with _ingestion_scheduler_lock:
+            if _ingestion_scheduler is None:
+                _ingestion_scheduler = IngestionScheduler(
+                    preprocess_workers=int(config_snapshot.get('ingestion.preprocess_workers', 2)),
+                    index_workers=int(config_snapshot.get('ingestion.index_workers', 1)),
+                    max_queue_size=int(config_snapshot.get('ingestion.max_queue_size', 100)),
+                    mp_context=config_snapshot.get('ingestion.mp_context', 'spawn'),
+                    index_batch_size=int(config_snapshot.get('ingestion.index_batch_size', 16)),
+                    index_batch_window=float(config_snapshot.get('ingestion.index_batch_window', 2.0))
+                )
+    return _ingestion_scheduler
+
+
+async def shutdown_ingestion_scheduler() -> None:
+    """应用关闭时排空摄取队列（在线程中等待，排空期间事件循环继续处理其他关闭钩子与连接）"""
+    if _ingestion_scheduler is not None:
+        timeout = float(config_snapshot.get('ingestion.shutdown_timeout', 300))
+        await asyncio.to_thread(_ingestion_scheduler.shutdown, timeout)
+
+
+metrics.register(Gauge(
+    'qa_ingestion_queue_depth', '摄取等待队列长度',
+    collect=lambda: _ingestion_scheduler.queue_depth() if _ingestion_scheduler else 0
+))
+metrics.register(Gauge(
+    'qa_ingestion_running_tasks', '正在执行的摄取任务数',
+    collect=lambda: _ingestion_scheduler.running_count() if _ingestion_scheduler else 0
+))
+
+
+def index_document_background(
+    task_id: str,
+    filepath: str,
+    filename: str,
+    label: str,
+    processed_docs_root: str
+):
+    """
+    后台索引任务（支持预处理）
+
+    Args:
+        task_id: 任务ID
+        filepath: 文件路径
+        filename: 文件名
+        label: 标签名（用于目录分组）
+        processed_docs_root: 预处理文档根目录
+    """
+    store = get_task_store()
+    task = store.get(TASK_KIND_UPLOAD, task_id)
+    if task is None:
+        logger.error(f"[{task_id}] 索引任务不存在，无法执行")
+        return
+
+    try:
+        file_ext = Path(filepath).suffix.lower()
+        processed_filepath = filepath
+        processed_docs_root = processed_docs_root or config_snapshot.get(
+            'vector_store.processed_docs', './data/processed_docs'
+        )
+
+        # === 阶段 1: 预处理（仅 PDF） ===
+        if file_ext == '.pdf':
+            task['status'] = 'preprocessing'
+            task['stage'] = '正在预处理 PDF 文档'
+            task['progress']['preprocessing'] = 'in_progress'
+            store.save(TASK_KIND_UPLOAD, task_id, task)
+            logger.info(f"[{task_id}] 开始预处理: {filename}")
+
+            try:
+                output_dir = os.path.join(processed_docs_root, label)
+                os.makedirs(output_dir, exist_ok=True)
+                preprocess_result = get_ingestion_scheduler().preprocess(filepath, output_dir)
+
+                if preprocess_result['status'] == 'success':
+                    task['progress']['preprocessing'] = 'completed'
+                    processed_filepath = preprocess_result['markdown_path']
+                    catalog_file('processed_docs', processed_filepath)
+                    logger.info(f"[{task_id}] 预处理成功: {processed_filepath}")
+                else:
+                    # 预处理失败 - 直接终止
+                    raise PreprocessingError(preprocess_result.get('message', 'Unknown error'))
+
+            except Exception as e:
+                task['status'] = 'failed'
+                task['stage'] = '预处理失败'
+                task['progress']['preprocessing'] = 'failed'
+                task['errors'].append({
+                    'stage': 'preprocessing',
+                    'message': str(e),
+                    'timestamp': datetime.now().isoformat()
+                })
+                store.save(TASK_KIND_UPLOAD, task_id, task)
+                logger.error(f"[{task_id}] 预处理失败: {e}", exc_info=True)
+                return  # 终止任务
+
+        elif file_ext == '.md':
+            task['progress']['preprocessing'] = 'skipped'
+            logger.info(f"[{task_id}] Markdown 文件，跳过预处理")
+
+        # === 阶段 2: 索引 ===
+        task['status'] = 'indexing'
+        task['stage'] = '正在构建索引'
+        task['progress']['indexing'] = 'in_progress'
+        store.save(TASK_KIND_UPLOAD, task_id, task)
+        logger.info(f"[{task_id}] 开始索引: {processed_filepath}")
+
+        # 索引提交由调度器合并为批次执行，完成后回调 finish_index_task
+        get_ingestion_scheduler().commit_index(
+            processed_docs_root,
+            processed_filepath,
+            callback=lambda result, error: finish_index_task(task_id, result, error)
+        )
+
+    except Exception as e:
+        # 捕获未预期的异常
+        task['status'] = 'failed'
+        task['stage'] = '任务执行异常'
+        task['errors'].append({
+            'stage': 'unknown',
+            'message': str(e),
+            'timestamp': datetime.now().isoformat()
+        })
+        store.save(TASK_KIND_UPLOAD, task_id, task)
+        logger.error(f"[{task_id}] 任务异常: {e}", exc_info=True)
+
+
+def finish_index_task(
+    task_id: str,
+    result: Optional[dict],
+    error: Optional[BaseException]
+) -> None:
+    """
+    索引批次完成回调：更新单个上传任务的状态
+
+    doc_count 为本文件的文档数，多文件批次中无法得知时为 None（见 IngestionScheduler._file_result），
+    total_count / mode 取自所在批次的 build_index 结果，
+    batch 字段记录批次 ID、批次内文件数与批次文档总数。
+
+    Args:
+        task_id: 任务ID
+        result: build_index 返回结果（失败时可能为 None）
+        error: 异常（成功时为 None）
+    """
+    store = get_task_store()
+    task = store.get(TASK_KIND_UPLOAD, task_id)
+    if task is None:
+        logger.error(f"[{task_id}] 索引任务不存在，无法更新状态")
+        return
+
+    if error is None and result and not result.get('success'):
+        error = IndexingError(result.get('message', 'Unknown error'))
+
+    if error is None:
+        task['status'] = 'completed'
+        task['stage'] = '索引构建完成'
+        task['progress']['indexing'] = 'completed'
+        task['doc_count'] = result['documents_processed']
+        task['total_count'] = result['total_document_count']
+        task['mode'] = result['mode']
+        task['batch'] = result.get('batch')
+        task['completed_at'] = datetime.now().isoformat()
+        store.save(TASK_KIND_UPLOAD, task_id, task)
+        logger.info(f"[{task_id}] 索引完成")
+    else:
+        task['status'] = 'failed'
+        task['stage'] = '索引失败'
+        task['progress']['indexing'] = 'failed'
+        task['errors'].append({
+            'stage': 'indexing',
+            'message': str(error),
+            'timestamp': datetime.now().isoformat()
+        })
+        store.save(TASK_KIND_UPLOAD, task_id, task)
+        logger.error(f"[{task_id}] 索引失败: {error}")
+
+
+def update_index_background(task_id: str, processed_docs_root: str) -> None:
+    """
+    后台更新索引任务（基于文档清单增量更新）
+
+    对比 processed_docs_root 与持久化清单，仅加载新增/修改的文件，
+    并删除已移除文件对应的向量；修改过的文件先删除旧向量再重新写入。
+
+    Args:
+        task_id: 任务ID
+        processed_docs_root: 预处理文档根目录
+    """
+    store = get_task_store()
+    task = store.get(TASK_KIND_UPDATE, task_id)
+    if task is None:
+        logger.error(f"[{task_id}] 更新任务不存在，无法执行")
+        return
+
+    try:
+        ingestion_service = IngestionHandler.get_instance()
+        vector_service = VectorStoreService.get_instance()
+
+        task['status'] = 'loading'
+        task['stage'] = '正在比对文档清单'
+        task['progress']['loading'] = 'in_progress'
+        store.save(TASK_KIND_UPDATE, task_id, task)
+        logger.info(f"[{task_id}] 开始比对文档清单: {processed_docs_root}")
+
+        manifest = load_index_manifest()
+        diff = manifest.diff(processed_docs_root)
+        changed_files = [
+            os.path.join(processed_docs_root, rel_path)
+            for rel_path in diff['added'] + diff['modified']
+        ]
+        counts = {
+            'documents_checked': diff['checked'],
+            'added': len(diff['added']),
+            'modified': len(diff['modified']),
+            'removed': len(diff['removed'])
+        }
+        task.update(counts)
+        logger.info(f"[{task_id}] 清单比对完成: {counts}")
+
+        # 同步文档目录中的 processed_docs 记录
+        catalog = get_document_catalog()
+        for rel_path in diff['added'] + diff['modified']:
+            catalog_file('processed_docs', os.path.join(processed_docs_root, rel_path))
+        if diff['removed']:
+            catalog.remove('processed_docs', diff['removed'])
+
+        documents = []
+        if changed_files:
+            task['stage'] = '正在加载变更文档'
+            store.save(TASK_KIND_UPDATE, task_id, task)
+            documents = ingestion_service.load_documents(
+                directory=processed_docs_root,
+                input_files=changed_files,
+                use_processed=True
+            )
+        task['documents_loaded'] = len(documents)
+        task['progress']['loading'] = 'completed'
+        store.save(TASK_KIND_UPDATE, task_id, task)
+
+        if not documents and not diff['removed'] and not diff['modified']:
+            manifest.commit(diff)
+            task['status'] = 'completed'
+            task['stage'] = '没有可更新的文档'
+            task['progress']['updating'] = 'skipped'
+            task['result'] = {
+                'success': True,
+                'mode': 'skipped',
+                **counts,
+                'documents_added': 0,
+                'message': '没有可更新的文档'
+            }
+            task['completed_at'] = datetime.now().isoformat()
+            store.save(TASK_KIND_UPDATE, task_id, task)
+            return
+
+        task['status'] = 'updating'
+        task['stage'] = '正在检查并更新索引'
+        task['progress']['updating'] = 'in_progress'
+        store.save(TASK_KIND_UPDATE, task_id, task)
+        logger.info(f"[{task_id}] 开始更新索引")
+
+        scheduler = get_ingestion_scheduler()
+        result = {'success': True, 'mode': 'incremental'}
+        # 已删除文件的向量直接移除；修改过的文件先删除旧向量再重新写入，避免重复
+        stale_paths = [
+            os.path.join(processed_docs_root, rel_path)
+            for rel_path in diff['removed'] + diff['modified']
+        ]
+        if stale_paths:
+            result['vectors_deleted'] = scheduler.run_index(
+                vector_service.delete_documents_by_path, stale_paths
+            )
+        if documents:
+            documents = ingestion_service.enrich_metadata(documents, processed_docs_root)
+            result.update(scheduler.run_index(vector_service.update_index, documents))
+        result.update(counts)
+
+        # 向量库更新成功后才落盘清单，失败时下次会重新处理这些文件
+        manifest.commit(diff)
+        bump_index_version()
+
+        task['status'] = 'completed'
+        task['stage'] = '更新完成'
+        task['progress']['updating'] = 'completed'
+        task['result'] = result
+        task['completed_at'] = datetime.now().isoformat()
+        store.save(TASK_KIND_UPDATE, task_id, task)
+        logger.info(f"[{task_id}] 更新完成")
+
+    except Exception as e:
+        task['status'] = 'failed'
+        task['stage'] = '更新失败'
+        if task.get('progress'):
+            task['progress']['loading'] = task['progress'].get('loading') or 'failed'
+            task['progress']['updating'] = task['progress'].get('updating') or 'failed'
+        task['errors'].append({
+            'stage': 'updating',
+            'message': str(e),
+            'timestamp': datetime.now().isoformat()
+        })
+        store.save(TASK_KIND_UPDATE, task_id, task)
+        logger.error(f"[{task_id}] 更新失败: {e}", exc_info=True)
@@ -0,0 +1,214 @@
+"""
+进程内指标（Prometheus 文本格式）
+"""
+import logging
+import threading
+from typing import Callable, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+# 延迟直方图默认分桶（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class Metric:
+    """进程内指标基类（按标签值元组分组，线程安全）"""
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def _format_labels(self, key: tuple, extra: Optional[dict] = None) -> str:
+        pairs = list(zip(self.labelnames, key)) + list((extra or {}).items())
+        if not pairs:
+            return ''
+        formatted = (
+            '{}="{}"'.format(
+                name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            )
+            for name, value in pairs
+        )
+        return '{' + ','.join(formatted) + '}'
+
+    def samples(self) -> list:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(f'{name}{labels} {value}' for name, labels, value in self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> list:
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, self._format_labels(key), value) for key, value in items]
+
+
+class Gauge(Metric):
+    """
+    仪表盘指标
+
+    可以直接 set/inc/dec，也可以传入 collect 回调在抓取时计算，
+    回调返回数值（无标签）或 {标签值元组: 数值}。
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), collect: Optional[Callable] = None):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def samples(self) -> list:
+        if self.collect is not None:
+            try:
+                values = self.collect()
+            except Exception as e:
+                logger.warning(f"指标 {self.name} 采集失败: {e}")
+                return []
+            items = values.items() if isinstance(values, dict) else [((), values)]
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return [(self.name, self._format_labels(key), value) for key, value in items]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][index] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self) -> list:
+        with self._lock:
+            items = [(key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items()]
+        samples = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                samples.append((f'{self.name}_bucket', self._format_labels(key, {'le': bound}), cumulative))
+            samples.append((f'{self.name}_bucket', self._format_labels(key, {'le': '+Inf'}), count))
+            samples.append((f'{self.name}_sum', self._format_labels(key), round(total, 6)))
+            samples.append((f'{self.name}_count', self._format_labels(key), count))
+        return samples
+
+
+class MetricsRegistry:
+    """指标注册表，render() 输出 Prometheus 文本格式"""
+
+    def __init__(self):
+        self._metrics: list = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return '\n'.join(metric.render() for metric in self._metrics) + '\n'
+
+
+metrics = MetricsRegistry()
+http_request_duration = metrics.register(Histogram(
+    'qa_http_request_duration_seconds', '按路由统计的请求处理耗时', ('route', 'method', 'status')
+))
+http_request_errors = metrics.register(Counter(
+    'qa_http_request_errors_total', '按路由统计的错误响应数（4xx/5xx）', ('route', 'method', 'status')
+))
+chat_stage_duration = metrics.register(Histogram(
+    'qa_chat_stage_duration_seconds', '聊天各阶段耗时', ('endpoint', 'stage')
+))
+ingestion_stage_duration = metrics.register(Histogram(
+    'qa_ingestion_stage_duration_seconds', '摄取各阶段耗时（queue_wait / preprocess / index）', ('stage',)
+))
+preprocess_page_duration = metrics.register(Histogram(
+    'qa_preprocess_seconds_per_page', 'PDF 预处理平均每页耗时',
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0)
+))
+agent_inflight = metrics.register(Gauge(
+    'qa_agent_inflight_calls', '正在执行的 Agent 调用数'
+))
+agent_admission_wait = metrics.register(Histogram(
+    'qa_agent_admission_wait_seconds', 'Agent 调用在准入队列中的等待时间'
+))
+agent_rejections = metrics.register(Counter(
+    'qa_agent_rejections_total', '被准入控制拒绝的 Agent 调用数', ('reason',)
+))
+session_lock_wait = metrics.register(Histogram(
+    'qa_session_lock_wait_seconds', '同一会话轮次排队等待时间'
+))
+answer_cache_lookups = metrics.register(Counter(
+    'qa_answer_cache_lookups_total', '回答缓存查询次数（result: exact / semantic / miss）', ('result',)
+))
+answer_cache_stale_stores = metrics.register(Counter(
+    'qa_answer_cache_stale_stores_total', '因索引版本在生成期间变化而放弃写入的回答数'
+))
+chat_coalesced = metrics.register(Counter(
+    'qa_chat_coalesced_total', '相同问题合并执行的请求数（leader 实际执行，follower 复用结果）', ('role',)
+))
+
+
+# 各缓存条目数：缓存所在模块通过 register_cache_size() 登记采集回调，回调返回 None 时不输出
+_cache_sizes: dict = {}
+
+
+def register_cache_size(cache: str, collect: Callable[[], Optional[int]]) -> None:
+    _cache_sizes[cache] = collect
+
+
+def _collect_cache_entries() -> dict:
+    values = {}
+    for cache, collect in _cache_sizes.items():
+        size = collect()
+        if size is not None:
+            values[(cache,)] = size
+    return values
+
+
+metrics.register(Gauge(
+    'qa_cache_entries', '各缓存条目数', ('cache',), collect=_collect_cache_entries
+))
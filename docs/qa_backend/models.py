@@ -0,0 +1,37 @@
+"""
+请求/响应模型
+"""
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class ChatRequest(BaseModel):
+    query: str
+    session_id: Optional[str] = None
+    query_type: Optional[str] = None
+    create_session: bool = True
+    db_name: Optional[str] = None
+    db_source: Optional[str] = None
+    api_name: Optional[str] = None
+
+
+class ReactQueryRequest(BaseModel):
+    query: str
+    reset: bool = False
+
+
+class ChatWithContextRequest(BaseModel):
+    query: str
+    session_id: Optional[str] = None
+    reset: bool = False
+
+
+class DatabaseQueryRequest(BaseModel):
+    sql: str
+    db_name: Optional[str] = None
+    db_source: Optional[str] = None
+    limit: Optional[int] = None
+    cursor: Optional[str] = None
+    format: str = 'ndjson'
+    timeout: Optional[float] = None
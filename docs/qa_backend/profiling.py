@@ -0,0 +1,297 @@
+"""
+聊天阶段计时与请求级采样分析
+"""
+import os
+import sys
+import time
+import uuid
+import json
+import logging
+import threading
+from typing import Callable, Optional
+from datetime import datetime
+
+from fastapi import Request
+
+from qa_backend.config_snapshot import config_snapshot
+from qa_backend.metrics import agent_inflight, chat_stage_duration
+
+
+logger = logging.getLogger(__name__)
+
+
+# 同一时间只运行一个采样分析器；1/N 采样计数
+_profiler_lock = threading.Lock()
+_profile_counter = 0
+
+
+class ChatStageRecorder:
+    """
+    聊天阶段计时
+
+    mark() 记录路由层可直接计时的阶段；on_event 作为 Agent 的事件回调，
+    由 router.decision 与 tool_call/tool_result 事件推算路由与检索耗时，
+    Agent 总耗时扣除二者即为 LLM 生成耗时。
+
+    传入 tracer 时（/chat/debug），每个阶段同时以显式起止时间创建 OpenTelemetry
+    子 Span（路由与工具调用挂在 chat.agent 下）；不传时不产生任何 Span。
+    timings 汇总各阶段耗时（秒），供调试响应返回。
+    """
+
+    def __init__(self, endpoint: str, tracer=None):
+        self.endpoint = endpoint
+        self.tracer = tracer
+        self.timings: dict = {}
+        self._agent_started: Optional[float] = None
+        self._agent_span = None
+        self._routing: Optional[float] = None
+        self._retrieval = 0.0
+        self._tool_started: Optional[float] = None
+        self._tool_name: Optional[str] = None
+
+    def _span(self, name: str, duration: float, parent=None, attributes: Optional[dict] = None) -> None:
+        from opentelemetry import trace
+
+        end_ns = time.time_ns()
+        context = trace.set_span_in_context(parent) if parent is not None else None
+        span = self.tracer.start_span(
+            name, context=context, start_time=end_ns - int(duration * 1e9), attributes=attributes
+        )
+        span.end(end_time=end_ns)
+
+    def _observe(self, stage: str, duration: float) -> None:
+        chat_stage_duration.observe(duration, endpoint=self.endpoint, stage=stage)
+        self.timings[stage] = round(self.timings.get(stage, 0.0) + duration, 4)
+
+    def mark(self, stage: str, started: float) -> None:
+        duration = time.perf_counter() - started
+        self._observe(stage, duration)
+        if self.tracer is not None:
+            self._span(f'chat.{stage}', duration)
+
+    def agent_started(self) -> None:
+        self._agent_started = time.perf_counter()
+        agent_inflight.inc()
+        if self.tracer is not None:
+            self._agent_span = self.tracer.start_span('chat.agent')
+
+    def agent_finished(self, succeeded: bool = True) -> None:
+        agent_inflight.dec()
+        total = time.perf_counter() - self._agent_started
+        routing = self._routing or 0.0
+        llm = max(0.0, total - routing - self._retrieval)
+        if self._agent_span is not None:
+            self._agent_span.set_attribute('chat.llm_seconds', round(llm, 4))
+            self._agent_span.set_attribute('chat.succeeded', succeeded)
+            self._agent_span.end()
+        if not succeeded:
+            return
+        for stage, value in (
+            ('agent', total),
+            ('routing', routing),
+            ('retrieval', self._retrieval),
+            ('llm', llm),
+        ):
+            self._observe(stage, value)
+
+    def record(self, event_type: str, extra: Optional[dict] = None) -> None:
+        now = time.perf_counter()
+        if event_type == 'router.decision' and self._routing is None and self._agent_started is not None:
+            self._routing = now - self._agent_started
+            if self._agent_span is not None:
+                self._span('chat.routing', self._routing, parent=self._agent_span)
+        elif event_type == 'tool_call':
+            self._tool_started = now
+            self._tool_name = (extra or {}).get('tool_name') if isinstance(extra, dict) else None
+        elif event_type == 'tool_result' and self._tool_started is not None:
+            duration = now - self._tool_started
+            self._retrieval += duration
+            if self._agent_span is not None:
+                self._span(
+                    'chat.tool_call', duration, parent=self._agent_span,
+                    attributes={'tool.name': self._tool_name or 'unknown'}
+                )
+            self._tool_started = None
+
+    def wrap(self, emit: Optional[Callable] = None) -> Callable:
+        """返回 Agent 的 on_event 回调：先计时，再转发给 emit（如有）"""
+        async def on_event(event_type: str, content: str = '', extra: Optional[dict] = None):
+            self.record(event_type, extra)
+            if emit is not None:
+                await emit(event_type, content, extra)
+
+        return on_event
+
+
+class SamplingProfiler:
+    """
+    纯 Python 采样分析器
+
+    后台线程每 interval 秒读取一次 sys._current_frames()，采样事件循环线程与
+    阻塞调用线程池线程（空闲等待中的池线程不计入），按调用栈累计样本数。
+    stop() 后可写出 collapsed-stack（flamegraph.pl / speedscope 均可导入）与
+    speedscope JSON 文件。采样覆盖整个进程，并发请求的调用栈也会被采到。
+    """
+
+    IDLE_FILES = ('threading.py', 'queue.py', 'thread.py')
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 64):
+        self.interval = interval
+        self.max_depth = max_depth
+        # (线程名, 帧1, 帧2, ...) -> 样本数，帧由外到内
+        self.stacks: dict = {}
+        self.sample_count = 0
+        self.duration = 0.0
+        self._loop_thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started = 0.0
+
+    def start(self) -> None:
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.perf_counter() - self._started
+
+    def _stack(self, frame) -> list:
+        stack = []
+        while frame is not None and len(stack) < self.max_depth:
+            code = frame.f_code
+            stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+            frame = frame.f_back
+        stack.reverse()
+        return stack
+
+    def _run(self) -> None:
+        names = {}
+        while not self._stop.wait(self.interval):
+            if len(names) != threading.active_count():
+                names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                name = names.get(thread_id, str(thread_id))
+                if thread_id == self._loop_thread_id:
+                    name = 'event-loop'
+                elif not name.startswith('blocking-'):
+                    continue
+                elif os.path.basename(frame.f_code.co_filename) in self.IDLE_FILES:
+                    continue
+                key = (name, *self._stack(frame))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+                self.sample_count += 1
+
+    def top_functions(self, limit: int = 10) -> list:
+        """按自身样本数（栈顶帧）排序的热点函数"""
+        leaf_counts: dict = {}
+        for key, count in self.stacks.items():
+            leaf_counts[key[-1]] = leaf_counts.get(key[-1], 0) + count
+        total = max(1, self.sample_count)
+        ranked = sorted(leaf_counts.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [
+            {'frame': frame, 'samples': count, 'percent': round(100.0 * count / total, 1)}
+            for frame, count in ranked
+        ]
+
+    def write(self, output_dir: str, name: str) -> dict:
+        """写出 <name>.folded 与 <name>.speedscope.json，返回文件路径"""
+        os.makedirs(output_dir, exist_ok=True)
+        folded_path = os.path.join(output_dir, f'{name}.folded')
+        with open(folded_path, 'w', encoding='utf-8') as f:
+            for key, count in sorted(self.stacks.items()):
+                f.write(';'.join(part.replace(';', ':') for part in key) + f' {count}\n')
+
+        frames: list = []
+        frame_index: dict = {}
+        profiles: dict = {}
+        for (thread_name, *stack), count in self.stacks.items():
+            indices = []
+            for frame in stack:
+                if frame not in frame_index:
+                    frame_index[frame] = len(frames)
+                    frames.append({'name': frame})
+                indices.append(frame_index[frame])
+            profile = profiles.setdefault(thread_name, {'samples': [], 'weights': []})
+            profile['samples'].append(indices)
+            profile['weights'].append(round(count * self.interval, 6))
+        speedscope = {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': name,
+            'exporter': 'qa-agent-profiler',
+            'shared': {'frames': frames},
+            'profiles': [
+                {
+                    'type': 'sampled',
+                    'name': thread_name,
+                    'unit': 'seconds',
+                    'startValue': 0,
+                    'endValue': round(sum(profile['weights']), 6),
+                    'samples': profile['samples'],
+                    'weights': profile['weights']
+                }
+                for thread_name, profile in profiles.items()
+            ]
+        }
+        speedscope_path = os.path.join(output_dir, f'{name}.speedscope.json')
+        with open(speedscope_path, 'w', encoding='utf-8') as f:
+            json.dump(speedscope, f, ensure_ascii=False)
+        return {'folded': folded_path, 'speedscope': speedscope_path}
+
+
+def should_profile(http_request: Request, requested: bool) -> bool:
+    """
+    判断本次请求是否开启采样分析（关闭时不产生任何额外开销）
+
+    配置项：
+    - profiling.sample_every: 每 N 个 /chat/debug 请求自动分析一次（默认 0，不自动采样）
+    """
+    global _profile_counter
+    if requested or http_request.headers.get('x-profile', '').lower() in ('1', 'true', 'yes'):
+        return True
+    every = int(config_snapshot.get('profiling.sample_every', 0))
+    if every <= 0:
+        return False
+    _profile_counter += 1
+    return _profile_counter % every == 0
+
+
+def start_profiler() -> Optional[SamplingProfiler]:
+    """
+    开始采样分析；已有分析在进行时返回 None
+
+    开始后须在 finish_profile() 之后调用 release_profiler()。
+
+    配置项：
+    - profiling.interval: 采样间隔秒数（默认 0.005）
+    """
+    if not _profiler_lock.acquire(blocking=False):
+        return None
+    profiler = SamplingProfiler(interval=float(config_snapshot.get('profiling.interval', 0.005)))
+    profiler.start()
+    return profiler
+
+
+def release_profiler() -> None:
+    _profiler_lock.release()
+
+
+def finish_profile(profiler: SamplingProfiler) -> dict:
+    """
+    写出采样分析文件并返回摘要
+
+    配置项：
+    - profiling.output_dir: 输出目录（默认 ./data/profiles）
+    """
+    name = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    files = profiler.write(config_snapshot.get('profiling.output_dir', './data/profiles'), name)
+    logger.info(f"采样分析完成: {profiler.sample_count} 个样本，写入 {files['speedscope']}")
+    return {
+        'samples': profiler.sample_count,
+        'interval': profiler.interval,
+        'duration': round(profiler.duration, 3),
+        'files': files,
+        'top': profiler.top_functions()
+    }
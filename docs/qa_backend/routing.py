@@ -0,0 +1,83 @@
+"""
+路由计时与请求体大小限制
+"""
+import time
+from typing import Callable, Optional
+
+from fastapi import HTTPException, Request
+from fastapi.routing import APIRoute
+
+from qa_backend.config_snapshot import config_snapshot
+from qa_backend.metrics import http_request_duration, http_request_errors
+from qa_backend.uploads import BULK_MAX_ARCHIVE_SIZE, UPLOAD_FORM_OVERHEAD, UPLOAD_MAX_FILE_SIZE
+
+
+def request_body_limit(route: str, method: str) -> Optional[int]:
+    """返回路由的请求体字节上限（含 multipart 开销），未限制时返回 None"""
+    if method != 'POST':
+        return None
+    if route == '/upload':
+        return int(config_snapshot.get('upload.max_file_size', UPLOAD_MAX_FILE_SIZE)) + UPLOAD_FORM_OVERHEAD
+    if route == '/upload/bulk':
+        return int(config_snapshot.get('upload.bulk_max_request_size', BULK_MAX_ARCHIVE_SIZE))
+    return None
+
+
+def limit_request_body(request: Request, max_bytes: int) -> Request:
+    """
+    在解析表单之前限制请求体大小
+
+    Content-Length 超限时直接返回 413，不读取请求体；未声明长度（chunked）时
+    包装 receive，累计超过 max_bytes 即中止，Starlette 的表单临时文件最多
+    写入 max_bytes 字节。
+    """
+    declared = request.headers.get('content-length')
+    if declared is not None and declared.isdigit() and int(declared) > max_bytes:
+        raise HTTPException(status_code=413, detail=f'请求体过大，最大允许 {max_bytes} 字节')
+
+    received = 0
+    receive = request.receive
+
+    async def limited_receive():
+        nonlocal received
+        message = await receive()
+        if message['type'] == 'http.request':
+            received += len(message.get('body', b''))
+            if received > max_bytes:
+                raise HTTPException(status_code=413, detail=f'请求体过大，最大允许 {max_bytes} 字节')
+        return message
+
+    return Request(request.scope, limited_receive)
+
+
+class TimedRoute(APIRoute):
+    """
+    记录每个路由的处理耗时与错误数（流式响应只计到响应头返回）
+
+    上传路由在解析表单之前按 request_body_limit() 限制请求体大小。
+    """
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        route = self.path
+
+        async def timed_handler(request: Request):
+            started = time.perf_counter()
+            status = 500
+            try:
+                max_bytes = request_body_limit(route, request.method)
+                if max_bytes is not None:
+                    request = limit_request_body(request, max_bytes)
+                response = await handler(request)
+                status = response.status_code
+                return response
+            except HTTPException as e:
+                status = e.status_code
+                raise
+            finally:
+                labels = {'route': route, 'method': request.method, 'status': status}
+                http_request_duration.observe(time.perf_counter() - started, **labels)
+                if status >= 400:
+                    http_request_errors.inc(**labels)
+
+        return timed_handler
@@ -0,0 +1,119 @@
+"""
+核心服务单例与启动预热
+"""
+import time
+import asyncio
+import logging
+import threading
+from typing import Callable, Optional
+from datetime import datetime
+
+from src.agent.react_agent import LlamaAgentsRoutingAgent
+from src.services.vector_store import VectorStoreService
+from src.services.chat_store_service import ChatStoreService
+
+from qa_backend.config_snapshot import config_snapshot
+from qa_backend.executors import spawn_detached
+from qa_backend.tasks import get_task_store
+
+
+logger = logging.getLogger(__name__)
+
+
+# 全局实例
+react_agent: Optional[LlamaAgentsRoutingAgent] = None
+_react_agent_lock = threading.Lock()
+# 启动预热状态（/ready 接口据此报告就绪）
+_warmup_state = {
+    'ready': False,
+    'started_at': None,
+    'completed_at': None,
+    'steps': {},
+    'errors': []
+}
+
+
+def get_react_agent() -> LlamaAgentsRoutingAgent:
+    """获取 LlamaAgents 路由代理实例（启动时预热，加锁保证只构建一次）"""
+    global react_agent
+    if react_agent is None:
+        with _react_agent_lock:
+            if react_agent is None:
+                react_agent = LlamaAgentsRoutingAgent()
+    return react_agent
+
+
+def get_chat_store_service() -> ChatStoreService:
+    """获取 ChatStore 服务实例"""
+    return ChatStoreService.get_instance()
+
+
+async def warm_up() -> None:
+    """
+    启动预热
+
+    依次构建 VectorStoreService、ChatStoreService 与路由代理单例，并执行一次
+    预热问答（warmup.query）以预热路由、检索与模型连接。每步耗时记录在
+    _warmup_state['steps'] 中；预热问答失败不阻止服务就绪。
+    """
+    _warmup_state['started_at'] = datetime.now().isoformat()
+    started = time.perf_counter()
+
+    async def step(name: str, func: Callable, *args, required: bool = True) -> None:
+        step_started = time.perf_counter()
+        try:
+            if asyncio.iscoroutinefunction(func):
+                await func(*args)
+            else:
+                await asyncio.to_thread(func, *args)
+        except Exception as e:
+            _warmup_state['errors'].append({'step': name, 'message': str(e)})
+            logger.error(f"预热步骤失败 [{name}]: {e}", exc_info=True)
+            if required:
+                raise
+        finally:
+            _warmup_state['steps'][name] = round(time.perf_counter() - step_started, 3)
+            logger.info(f"预热步骤 [{name}] 耗时 {_warmup_state['steps'][name]}s")
+
+    async def warmup_query() -> None:
+        from llama_index.core.memory import ChatMemoryBuffer
+
+        # 在主事件循环中执行，确保 Agent 内部的异步客户端绑定到服务所用的循环
+        query = config_snapshot.get('warmup.query', '你好')
+        timeout = float(config_snapshot.get('warmup.timeout', 120))
+        await asyncio.wait_for(
+            get_react_agent().aquery_with_context(
+                query,
+                None,
+                chat_memory=ChatMemoryBuffer.from_defaults(token_limit=1000)
+            ),
+            timeout=timeout
+        )
+
+    try:
+        await step('config', config_snapshot.reload)
+        await step('task_store', get_task_store)
+        await step('vector_store', VectorStoreService.get_instance)
+        await step('chat_store', get_chat_store_service)
+        await step('agent', get_react_agent)
+        if config_snapshot.get('warmup.run_query', True):
+            await step('routing_and_retrieval', warmup_query, required=False)
+        _warmup_state['ready'] = True
+    except Exception:
+        logger.error("启动预热失败，服务未就绪")
+    finally:
+        _warmup_state['completed_at'] = datetime.now().isoformat()
+        logger.info(
+            f"启动预热结束，总耗时 {time.perf_counter() - started:.3f}s，"
+            f"各步骤: {_warmup_state['steps']}"
+        )
+
+
+async def start_warm_up() -> None:
+    """应用启动时在后台执行预热，预热完成前 /ready 返回 503"""
+    spawn_detached(warm_up())
+
+
+def get_warmup_state() -> dict:
+    """启动预热状态（ready / started_at / completed_at / steps / errors）"""
+    return dict(_warmup_state)
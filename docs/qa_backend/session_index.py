@@ -0,0 +1,351 @@
+"""
+会话索引
+"""
+import os
+import time
+import json
+import base64
+import sqlite3
+import logging
+import threading
+from typing import Callable, Optional
+from datetime import datetime
+
+from fastapi import HTTPException
+
+from qa_backend.config_snapshot import config_snapshot
+from qa_backend.executors import run_blocking, spawn_detached
+from qa_backend.services import get_chat_store_service
+from qa_backend.storage import open_sqlite
+
+
+logger = logging.getLogger(__name__)
+
+
+_session_index: Optional['SessionIndex'] = None
+_session_index_lock = threading.Lock()
+# 会话列表排序字段 / 计数上限
+SESSION_SORT_FIELDS = ('last_accessed', 'created_at')
+SESSION_COUNT_CAP = 10000
+
+
+class SessionIndex:
+    """
+    会话索引（SQLite）
+
+    记录每个会话的创建时间、最后访问时间与消息数，并在这两个时间字段上
+    建立索引。聊天写入、清除、重置时增量维护，启动时按 get_all_sessions()
+    对账一次。/chat/sessions/list 使用键集分页，响应时间与会话总数无关。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS sessions ('
+            ' session_id TEXT PRIMARY KEY,'
+            ' title TEXT NOT NULL DEFAULT \'\','
+            ' created_at REAL NOT NULL,'
+            ' last_accessed REAL NOT NULL,'
+            ' message_count INTEGER NOT NULL DEFAULT 0)'
+        )
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_sessions_last_accessed'
+            ' ON sessions (last_accessed, session_id)'
+        )
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_sessions_created_at'
+            ' ON sessions (created_at, session_id)'
+        )
+        conn.commit()
+        self.last_reconcile: Optional[dict] = None
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = open_sqlite(self.path)
+        return conn
+
+    def touch(self, session_id: str, added_messages: int = 0, title: Optional[str] = None) -> tuple:
+        """
+        记录一次访问（新会话自动登记，title 仅在首次登记时生效）
+
+        Returns:
+            (写入前版本, 写入后版本)，版本见 version()；同一事务内读取，
+            不会混入其他 worker 的并发写入
+        """
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            before = self._version_locked(conn, session_id)
+            conn.execute(
+                'INSERT INTO sessions (session_id, title, created_at, last_accessed, message_count)'
+                ' VALUES (?, ?, ?, ?, ?)'
+                ' ON CONFLICT(session_id) DO UPDATE SET'
+                ' last_accessed = excluded.last_accessed,'
+                ' message_count = message_count + excluded.message_count',
+                (session_id, (title or '')[:50], now, now, added_messages)
+            )
+            after = self._version_locked(conn, session_id)
+        return before, after
+
+    def version(self, session_id: str) -> Optional[tuple]:
+        """
+        会话版本 (message_count, last_accessed)，未登记时为 None
+
+        只在写入、清空时变化，各 worker 据此判断本地缓存是否过期。
+        """
+        return self._version_locked(self._conn(), session_id)
+
+    @staticmethod
+    def _version_locked(conn: sqlite3.Connection, session_id: str) -> Optional[tuple]:
+        row = conn.execute(
+            'SELECT message_count, last_accessed FROM sessions WHERE session_id = ?',
+            (session_id,)
+        ).fetchone()
+        return tuple(row) if row else None
+
+    def reset_messages(self, session_id: str) -> None:
+        conn = self._conn()
+        conn.execute(
+            'UPDATE sessions SET message_count = 0, last_accessed = ? WHERE session_id = ?',
+            (time.time(), session_id)
+        )
+        conn.commit()
+
+    def remove(self, session_ids: list) -> None:
+        conn = self._conn()
+        conn.executemany('DELETE FROM sessions WHERE session_id = ?', [(sid,) for sid in session_ids])
+        conn.commit()
+
+    def reconcile(self, sessions: list, snapshot_at: Optional[float] = None) -> dict:
+        """
+        对账：以 ChatStore 的会话列表为准重建索引
+
+        Args:
+            sessions: get_all_sessions() 返回的会话元数据列表
+            snapshot_at: 获取列表的时间；此后被访问过的索引行不会被删除或回退
+        """
+        started = time.perf_counter()
+        now = time.time()
+        snapshot_at = snapshot_at or now
+        rows = []
+        for session in sessions:
+            session_id = session.get('session_id')
+            if not session_id:
+                continue
+            created_at = float(session.get('created_at') or now)
+            rows.append((
+                session_id,
+                str(session.get('title') or '')[:50],
+                created_at,
+                float(session.get('last_accessed') or created_at),
+                int(session.get('message_count') or 0)
+            ))
+        conn = self._conn()
+        with conn:
+            conn.execute('CREATE TEMP TABLE IF NOT EXISTS reconcile_ids (session_id TEXT PRIMARY KEY)')
+            conn.execute('DELETE FROM reconcile_ids')
+            conn.executemany('INSERT OR IGNORE INTO reconcile_ids VALUES (?)', [(row[0],) for row in rows])
+            removed = conn.execute(
+                'DELETE FROM sessions WHERE last_accessed < ?'
+                ' AND session_id NOT IN (SELECT session_id FROM reconcile_ids)',
+                (snapshot_at,)
+            ).rowcount
+            conn.executemany(
+                'INSERT INTO sessions'
+                ' (session_id, title, created_at, last_accessed, message_count)'
+                ' VALUES (?, ?, ?, ?, ?)'
+                ' ON CONFLICT(session_id) DO UPDATE SET'
+                ' title = excluded.title, created_at = excluded.created_at,'
+                ' last_accessed = excluded.last_accessed, message_count = excluded.message_count'
+                ' WHERE sessions.last_accessed < ?',
+                [row + (snapshot_at,) for row in rows]
+            )
+            conn.execute('DELETE FROM reconcile_ids')
+        self.last_reconcile = {
+            'at': datetime.now().isoformat(),
+            'duration': round(time.perf_counter() - started, 3),
+            'sessions': len(rows),
+            'removed': removed
+        }
+        logger.info(f"会话索引对账完成: {self.last_reconcile}")
+        return self.last_reconcile
+
+    @staticmethod
+    def encode_cursor(sort_value: float, session_id: str) -> str:
+        raw = json.dumps([sort_value, session_id])
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> tuple:
+        try:
+            sort_value, session_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            return float(sort_value), str(session_id)
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail='无效的 cursor')
+
+    def query(
+        self,
+        sort: str = 'last_accessed',
+        order: str = 'desc',
+        cursor: Optional[str] = None,
+        limit: int = 50,
+        created_after: Optional[float] = None,
+        created_before: Optional[float] = None,
+        accessed_after: Optional[float] = None,
+        accessed_before: Optional[float] = None
+    ) -> dict:
+        """
+        按 sort 字段键集分页查询
+
+        计数最多统计到 SESSION_COUNT_CAP 条（count_capped 表示实际更多），
+        因此计数开销同样有上界。
+
+        Returns:
+            sessions、count、count_capped、next_cursor
+        """
+        if sort not in SESSION_SORT_FIELDS:
+            raise HTTPException(status_code=400, detail=f'sort 仅支持 {SESSION_SORT_FIELDS}')
+        where, params = [], []
+        for column, op, value in (
+            ('created_at', '>=', created_after),
+            ('created_at', '<', created_before),
+            ('last_accessed', '>=', accessed_after),
+            ('last_accessed', '<', accessed_before),
+        ):
+            if value is not None:
+                where.append(f'{column} {op} ?')
+                params.append(value)
+
+        conn = self._conn()
+        filter_sql = f" WHERE {' AND '.join(where)}" if where else ''
+        count = conn.execute(
+            f'SELECT COUNT(*) FROM (SELECT 1 FROM sessions{filter_sql} LIMIT ?)',
+            params + [SESSION_COUNT_CAP + 1]
+        ).fetchone()[0]
+
+        page_where, page_params = list(where), list(params)
+        direction = 'DESC' if order == 'desc' else 'ASC'
+        if cursor:
+            comparator = '<' if order == 'desc' else '>'
+            page_where.append(f'({sort}, session_id) {comparator} (?, ?)')
+            page_params.extend(self.decode_cursor(cursor))
+        sql = (
+            'SELECT session_id, title, created_at, last_accessed, message_count FROM sessions'
+            + (f" WHERE {' AND '.join(page_where)}" if page_where else '')
+            + f' ORDER BY {sort} {direction}, session_id {direction} LIMIT ?'
+        )
+        page_params.append(limit + 1)
+
+        columns = ('session_id', 'title', 'created_at', 'last_accessed', 'message_count')
+        sessions = [dict(zip(columns, row)) for row in conn.execute(sql, page_params)]
+        next_cursor = None
+        if len(sessions) > limit:
+            sessions = sessions[:limit]
+            next_cursor = self.encode_cursor(sessions[-1][sort], sessions[-1]['session_id'])
+        return {
+            'sessions': sessions,
+            'count': min(count, SESSION_COUNT_CAP),
+            'count_capped': count > SESSION_COUNT_CAP,
+            'next_cursor': next_cursor
+        }
+
+    def expired(self, cutoff: float, limit: int, after: Optional[tuple] = None) -> list:
+        """
+        按 (last_accessed, session_id) 顺序取出最多 limit 个过期会话（只读）
+
+        after 为上一批最后一条的 (last_accessed, session_id)，用于跳过本轮
+        已处理但删除失败的会话。
+        """
+        sql = 'SELECT last_accessed, session_id FROM sessions WHERE last_accessed < ?'
+        params: list = [cutoff]
+        if after is not None:
+            sql += ' AND (last_accessed, session_id) > (?, ?)'
+            params.extend(after)
+        sql += ' ORDER BY last_accessed, session_id LIMIT ?'
+        params.append(limit)
+        return [tuple(row) for row in self._conn().execute(sql, params)]
+
+    def is_expired(self, session_id: str, cutoff: float) -> bool:
+        row = self._conn().execute(
+            'SELECT 1 FROM sessions WHERE session_id = ? AND last_accessed < ?',
+            (session_id, cutoff)
+        ).fetchone()
+        return row is not None
+
+    def remove_if_expired(self, session_id: str, cutoff: float) -> bool:
+        """删除仍处于过期状态的索引行（期间被访问过的会话保留）"""
+        conn = self._conn()
+        with conn:
+            return conn.execute(
+                'DELETE FROM sessions WHERE session_id = ? AND last_accessed < ?',
+                (session_id, cutoff)
+            ).rowcount > 0
+
+    def get(self, session_id: str) -> Optional[dict]:
+        row = self._conn().execute(
+            'SELECT session_id, title, created_at, last_accessed, message_count'
+            ' FROM sessions WHERE session_id = ?',
+            (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('session_id', 'title', 'created_at', 'last_accessed', 'message_count'), row))
+
+    @staticmethod
+    def etag(entry: dict) -> str:
+        """会话历史版本（写入或清除都会更新 last_accessed / message_count）"""
+        return f'W/"{entry["message_count"]}-{entry["last_accessed"]:.6f}"'
+
+    def stats(self) -> dict:
+        return {
+            'sessions': self._conn().execute('SELECT COUNT(*) FROM sessions').fetchone()[0],
+            'last_reconcile': self.last_reconcile
+        }
+
+
+def get_session_index() -> SessionIndex:
+    """
+    获取会话索引实例
+
+    配置项：
+    - chat_store.session_index_path: 索引数据库路径（默认 ./data/session_index.db）
+    """
+    global _session_index
+    if _session_index is None:
+        with _session_index_lock:
+            if _session_index is None:
+                _session_index = SessionIndex(
+                    config_snapshot.get('chat_store.session_index_path', './data/session_index.db')
+                )
+    return _session_index
+
+
+def session_index_stats() -> Optional[dict]:
+    """会话索引统计（未创建时返回 None）"""
+    return _session_index.stats() if _session_index else None
+
+
+def index_session(action: Callable, *args):
+    """维护会话索引（失败只记录日志并返回 None，由启动对账兜底）"""
+    try:
+        return action(get_session_index(), *args)
+    except Exception as e:
+        logger.warning(f"会话索引更新失败: {e}")
+        return None
+
+
+async def reconcile_session_index() -> None:
+    """应用启动时在后台按 ChatStore 重建会话索引"""
+    async def run() -> None:
+        try:
+            snapshot_at = time.time()
+            sessions = await run_blocking('chat_store', get_chat_store_service().get_all_sessions)
+            await run_blocking('filesystem', get_session_index().reconcile, sessions, snapshot_at)
+        except Exception as e:
+            logger.error(f"会话索引对账失败: {e}", exc_info=True)
+
+    spawn_detached(run())
@@ -0,0 +1,180 @@
+"""
+过期会话清理
+"""
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Optional
+from datetime import datetime
+
+from src.services.chat_store_service import ChatStoreService
+
+from qa_backend.chat import get_memory_cache
+from qa_backend.config_snapshot import config_snapshot
+from qa_backend.executors import run_blocking, spawn_detached
+from qa_backend.services import get_chat_store_service
+from qa_backend.session_index import get_session_index
+
+
+logger = logging.getLogger(__name__)
+
+
+_session_sweeper: Optional['SessionSweeper'] = None
+_session_sweeper_lock = threading.Lock()
+
+
+class SessionSweeper:
+    """
+    过期会话增量清理
+
+    借助会话索引的 last_accessed 索引按过期时间从早到晚取出会话，每批最多
+    batch_size 个，在线程中从 ChatStore 删除后暂停 batch_pause 秒再处理下一批，
+    直到没有过期会话。索引行只在 ChatStore 删除成功后移除；删除失败的会话
+    保留在索引中，下一轮重试。后台每 interval 秒执行一轮；手动接口可立即触发一轮。
+
+    过期时间与 ChatStore 一致，每轮从 ChatStoreService.session_ttl 读取；
+    ChatStore 未提供时跳过本轮，过期清理只能通过 ChatStore 自身的全量清理完成。
+    """
+
+    def __init__(
+        self,
+        interval: float = 300.0,
+        batch_size: int = 100,
+        batch_pause: float = 0.5
+    ):
+        self.ttl: Optional[float] = None
+        self.interval = interval
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self._lock = asyncio.Lock()
+        self.swept_total = 0
+        self.batch_count = 0
+        self.error_count = 0
+        self.last_run: Optional[dict] = None
+        # 最近若干批次的 (清理数量, 耗时秒)
+        self.recent_batches: deque = deque(maxlen=20)
+
+    def _sweep_batch(self, cutoff: float, after: Optional[tuple]) -> tuple:
+        """
+        处理一批过期会话
+
+        Returns:
+            (已删除的会话ID列表, 本批取出的会话数, 本批最后一条的游标)
+        """
+        chat_store_service = get_chat_store_service()
+        session_index = get_session_index()
+        candidates = session_index.expired(cutoff, self.batch_size, after)
+        deleted = []
+        for _, session_id in candidates:
+            # 取出后被访问过的会话不再删除
+            if not session_index.is_expired(session_id, cutoff):
+                continue
+            try:
+                chat_store_service.delete_session(session_id)
+            except Exception as e:
+                self.error_count += 1
+                logger.warning(f"删除过期会话失败 {session_id}: {e}")
+                continue
+            get_memory_cache().invalidate(session_id)
+            session_index.remove_if_expired(session_id, cutoff)
+            deleted.append(session_id)
+        return deleted, len(candidates), (candidates[-1] if candidates else after)
+
+    async def sweep(self) -> dict:
+        """执行一轮清理（与正在进行的一轮串行）"""
+        async with self._lock:
+            started = time.perf_counter()
+            self.ttl = chat_store_session_ttl(get_chat_store_service())
+            if self.ttl is None:
+                logger.warning("ChatStore 未提供 session_ttl，跳过按索引的过期会话清理")
+                self.last_run = {
+                    'at': datetime.now().isoformat(),
+                    'swept': 0,
+                    'batches': 0,
+                    'duration': 0.0,
+                    'skipped': 'ChatStore 未提供 session_ttl'
+                }
+                return self.last_run
+            cutoff = time.time() - self.ttl
+            swept, batches, after = 0, 0, None
+            while True:
+                batch_started = time.perf_counter()
+                deleted, fetched, after = await run_blocking(
+                    'chat_store', self._sweep_batch, cutoff, after
+                )
+                duration = time.perf_counter() - batch_started
+                if fetched:
+                    batches += 1
+                    swept += len(deleted)
+                    self.batch_count += 1
+                    self.swept_total += len(deleted)
+                    self.recent_batches.append((len(deleted), round(duration, 3)))
+                    logger.info(f"过期会话清理批次: 删除 {len(deleted)}/{fetched} 个，耗时 {duration:.3f}s")
+                if fetched < self.batch_size:
+                    break
+                await asyncio.sleep(self.batch_pause)
+            self.last_run = {
+                'at': datetime.now().isoformat(),
+                'swept': swept,
+                'batches': batches,
+                'duration': round(time.perf_counter() - started, 3)
+            }
+            return self.last_run
+
+    async def run_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                self.error_count += 1
+                logger.error(f"过期会话清理失败: {e}", exc_info=True)
+
+    def stats(self) -> dict:
+        return {
+            'ttl': self.ttl,
+            'swept_total': self.swept_total,
+            'batch_count': self.batch_count,
+            'error_count': self.error_count,
+            'last_run': self.last_run,
+            'recent_batches': list(self.recent_batches)
+        }
+
+
+def chat_store_session_ttl(chat_store_service: ChatStoreService) -> Optional[float]:
+    """ChatStore 判定会话过期所用的秒数（按最后访问时间）；未提供时返回 None"""
+    ttl = getattr(chat_store_service, 'session_ttl', None)
+    return float(ttl) if ttl else None
+
+
+def get_session_sweeper() -> SessionSweeper:
+    """
+    获取过期会话清理器实例（过期时间取自 ChatStore，见 chat_store_session_ttl）
+
+    配置项：
+    - chat_store.sweep_interval: 后台清理间隔秒数（默认 300）
+    - chat_store.sweep_batch_size: 每批清理会话数（默认 100）
+    - chat_store.sweep_batch_pause: 批次间暂停秒数（默认 0.5）
+    """
+    global _session_sweeper
+    if _session_sweeper is None:
+        with _session_sweeper_lock:
+            if _session_sweeper is None:
+                _session_sweeper = SessionSweeper(
+                    interval=float(config_snapshot.get('chat_store.sweep_interval', 300)),
+                    batch_size=int(config_snapshot.get('chat_store.sweep_batch_size', 100)),
+                    batch_pause=float(config_snapshot.get('chat_store.sweep_batch_pause', 0.5))
+                )
+    return _session_sweeper
+
+
+def session_sweeper_stats() -> Optional[dict]:
+    """过期会话清理统计（未创建时返回 None）"""
+    return _session_sweeper.stats() if _session_sweeper else None
+
+
+async def start_session_sweeper() -> None:
+    """应用启动时开始后台清理过期会话"""
+    spawn_detached(get_session_sweeper().run_forever())
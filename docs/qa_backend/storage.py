@@ -0,0 +1,12 @@
+"""
+SQLite 连接
+"""
+import sqlite3
+
+
+def open_sqlite(path: str) -> sqlite3.Connection:
+    """打开 WAL 模式的 SQLite 连接（多进程共享，每个线程一个连接）"""
+    conn = sqlite3.connect(path, timeout=5.0)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
@@ -0,0 +1,353 @@
+"""
+任务状态存储
+"""
+import os
+import time
+import asyncio
+import copy
+import json
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from qa_backend.config_snapshot import config_snapshot
+from qa_backend.storage import open_sqlite
+
+
+logger = logging.getLogger(__name__)
+
+
+# 任务类型（任务存储中的命名空间）
+TASK_KIND_UPLOAD = 'upload'
+TASK_KIND_UPDATE = 'update_index'
+TASK_KIND_BULK = 'bulk_upload'
+TASK_TERMINAL_STATUSES = {'completed', 'failed'}
+_task_store: Optional['TaskStore'] = None
+_task_store_lock = threading.Lock()
+
+
+class TaskStore:
+    """
+    任务状态存储基类
+
+    以 (kind, task_id) 为键保存任务字典。任务进入终态（completed/failed）后
+    记录 finished_at，超过 ttl 秒即被淘汰。后台任务修改任务字典后需调用
+    save() 才能对其他进程可见。
+    """
+
+    def __init__(self, ttl: float = 86400, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._listeners: list = []
+
+    def add_listener(self, listener: Callable[[str, str, dict], None]) -> None:
+        """注册任务变更监听器，每次 save() 后以 (kind, task_id, task) 调用"""
+        self._listeners.append(listener)
+
+    def _notify(self, kind: str, task_id: str, task: dict) -> None:
+        for listener in self._listeners:
+            try:
+                listener(kind, task_id, task)
+            except Exception as e:
+                logger.error(f"[{task_id}] 任务监听器异常: {e}", exc_info=True)
+
+    def create(self, kind: str, task_id: str, task: dict) -> None:
+        self.save(kind, task_id, task)
+
+    def get(self, kind: str, task_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def save(self, kind: str, task_id: str, task: dict) -> None:
+        raise NotImplementedError
+
+    def list(
+        self,
+        kind: str,
+        status: Optional[str] = None,
+        label: Optional[str] = None,
+        limit: int = 100
+    ) -> list:
+        raise NotImplementedError
+
+    def evict_expired(self) -> int:
+        raise NotImplementedError
+
+    @staticmethod
+    def _finished_at(task: dict) -> Optional[float]:
+        return time.time() if task.get('status') in TASK_TERMINAL_STATUSES else None
+
+
+class MemoryTaskStore(TaskStore):
+    """进程内 LRU + TTL 任务存储（单 worker 部署使用）"""
+
+    def __init__(self, ttl: float = 86400, max_entries: int = 10000):
+        super().__init__(ttl, max_entries)
+        # (kind, task_id) -> [task, finished_at]
+        self._tasks: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, kind: str, task_id: str) -> Optional[dict]:
+        key = (kind, task_id)
+        with self._lock:
+            entry = self._tasks.get(key)
+            if entry is None:
+                return None
+            if entry[1] is not None and time.time() - entry[1] > self.ttl:
+                del self._tasks[key]
+                return None
+            self._tasks.move_to_end(key)
+            return entry[0]
+
+    def save(self, kind: str, task_id: str, task: dict) -> None:
+        key = (kind, task_id)
+        with self._lock:
+            entry = self._tasks.get(key)
+            finished_at = entry[1] if entry and entry[1] is not None else self._finished_at(task)
+            self._tasks[key] = [task, finished_at]
+            self._tasks.move_to_end(key)
+            if len(self._tasks) > self.max_entries:
+                self._evict_locked()
+        self._notify(kind, task_id, task)
+
+    def list(
+        self,
+        kind: str,
+        status: Optional[str] = None,
+        label: Optional[str] = None,
+        limit: int = 100
+    ) -> list:
+        self.evict_expired()
+        result = []
+        with self._lock:
+            for (task_kind, task_id), (task, _) in reversed(self._tasks.items()):
+                if task_kind != kind:
+                    continue
+                if status and task.get('status') != status:
+                    continue
+                if label and task.get('label') != label:
+                    continue
+                result.append({'task_id': task_id, **task})
+                if len(result) >= limit:
+                    break
+        return result
+
+    def evict_expired(self) -> int:
+        with self._lock:
+            return self._evict_locked()
+
+    def _evict_locked(self) -> int:
+        now = time.time()
+        expired = [
+            key for key, (_, finished_at) in self._tasks.items()
+            if finished_at is not None and now - finished_at > self.ttl
+        ]
+        for key in expired:
+            del self._tasks[key]
+
+        # 超出容量时优先淘汰最久未访问的已结束任务
+        evicted = len(expired)
+        if len(self._tasks) > self.max_entries:
+            finished = [key for key, (_, finished_at) in self._tasks.items() if finished_at is not None]
+            for key in finished:
+                if len(self._tasks) <= self.max_entries:
+                    break
+                del self._tasks[key]
+                evicted += 1
+        while len(self._tasks) > self.max_entries:
+            self._tasks.popitem(last=False)
+            evicted += 1
+        return evicted
+
+
+class SqliteTaskStore(TaskStore):
+    """
+    本地 SQLite（WAL 模式）任务存储
+
+    多个 uvicorn/pm2 worker 进程共享同一个数据库文件，
+    任意 worker 都能查询其他 worker 创建的任务。
+    """
+
+    PURGE_INTERVAL = 60
+
+    def __init__(self, path: str, ttl: float = 86400, max_entries: int = 10000):
+        super().__init__(ttl, max_entries)
+        self.path = path
+        self._local = threading.local()
+        self._last_purge = 0.0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS tasks ('
+            ' kind TEXT NOT NULL,'
+            ' task_id TEXT NOT NULL,'
+            ' status TEXT,'
+            ' label TEXT,'
+            ' created_at TEXT,'
+            ' finished_at REAL,'
+            ' data TEXT NOT NULL,'
+            ' PRIMARY KEY (kind, task_id))'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (kind, status)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_tasks_label ON tasks (kind, label)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_tasks_finished ON tasks (finished_at)')
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = open_sqlite(self.path)
+        return conn
+
+    def get(self, kind: str, task_id: str) -> Optional[dict]:
+        row = self._conn().execute(
+            'SELECT data, finished_at FROM tasks WHERE kind = ? AND task_id = ?',
+            (kind, task_id)
+        ).fetchone()
+        if row is None:
+            return None
+        if row[1] is not None and time.time() - row[1] > self.ttl:
+            return None
+        return json.loads(row[0])
+
+    def save(self, kind: str, task_id: str, task: dict) -> None:
+        finished_at = self._finished_at(task)
+        conn = self._conn()
+        # 首次进入终态时记录结束时间，之后的保存沿用原值，不推迟 TTL 淘汰
+        conn.execute(
+            'INSERT INTO tasks'
+            ' (kind, task_id, status, label, created_at, finished_at, data)'
+            ' VALUES (?, ?, ?, ?, ?, ?, ?)'
+            ' ON CONFLICT (kind, task_id) DO UPDATE SET'
+            ' status = excluded.status, label = excluded.label, created_at = excluded.created_at,'
+            ' finished_at = COALESCE(tasks.finished_at, excluded.finished_at), data = excluded.data',
+            (
+                kind, task_id, task.get('status'), task.get('label'),
+                task.get('created_at'), finished_at,
+                json.dumps(task, ensure_ascii=False, default=str)
+            )
+        )
+        conn.commit()
+        self._notify(kind, task_id, task)
+        if time.time() - self._last_purge > self.PURGE_INTERVAL:
+            self.evict_expired()
+
+    def list(
+        self,
+        kind: str,
+        status: Optional[str] = None,
+        label: Optional[str] = None,
+        limit: int = 100
+    ) -> list:
+        sql = 'SELECT task_id, data FROM tasks WHERE kind = ?'
+        params: list = [kind]
+        if status:
+            sql += ' AND status = ?'
+            params.append(status)
+        if label:
+            sql += ' AND label = ?'
+            params.append(label)
+        sql += ' AND (finished_at IS NULL OR finished_at >= ?)'
+        params.append(time.time() - self.ttl)
+        sql += ' ORDER BY created_at DESC LIMIT ?'
+        params.append(limit)
+        rows = self._conn().execute(sql, params).fetchall()
+        return [{'task_id': task_id, **json.loads(data)} for task_id, data in rows]
+
+    def evict_expired(self) -> int:
+        self._last_purge = time.time()
+        conn = self._conn()
+        cursor = conn.execute(
+            'DELETE FROM tasks WHERE finished_at IS NOT NULL AND finished_at < ?',
+            (time.time() - self.ttl,)
+        )
+        evicted = cursor.rowcount
+        # 超出容量时删除最早结束的任务
+        cursor = conn.execute(
+            'DELETE FROM tasks WHERE rowid IN ('
+            ' SELECT rowid FROM tasks WHERE finished_at IS NOT NULL'
+            ' ORDER BY finished_at DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,)
+        )
+        evicted += cursor.rowcount
+        conn.commit()
+        return evicted
+
+
+class TaskEventBus:
+    """
+    进程内任务进度事件总线
+
+    TaskStore.save() 在任意线程中发布任务快照，订阅方（SSE 连接）在各自的
+    事件循环中通过有界队列接收。队列满时丢弃最旧的快照，只保留最新进度。
+    """
+
+    def __init__(self, buffer_size: int = 32):
+        self.buffer_size = buffer_size
+        # (kind, task_id) -> {(loop, subscriber), ...}
+        self._subscribers: dict = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, kind: str, task_ids: list) -> asyncio.Queue:
+        loop = asyncio.get_running_loop()
+        subscriber: asyncio.Queue = asyncio.Queue(maxsize=self.buffer_size)
+        with self._lock:
+            for task_id in task_ids:
+                self._subscribers.setdefault((kind, task_id), set()).add((loop, subscriber))
+        return subscriber
+
+    def unsubscribe(self, kind: str, task_ids: list, subscriber: asyncio.Queue) -> None:
+        with self._lock:
+            for task_id in task_ids:
+                subscribers = self._subscribers.get((kind, task_id))
+                if not subscribers:
+                    continue
+                subscribers.difference_update({sub for sub in subscribers if sub[1] is subscriber})
+                if not subscribers:
+                    del self._subscribers[(kind, task_id)]
+
+    def publish(self, kind: str, task_id: str, task: dict) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers.get((kind, task_id), ()))
+        if not subscribers:
+            return
+        snapshot = copy.deepcopy(task)
+        for loop, subscriber in subscribers:
+            loop.call_soon_threadsafe(self._put_latest, subscriber, (task_id, snapshot))
+
+    @staticmethod
+    def _put_latest(subscriber: asyncio.Queue, item: tuple) -> None:
+        if subscriber.full():
+            subscriber.get_nowait()
+        subscriber.put_nowait(item)
+
+
+task_event_bus = TaskEventBus()
+
+
+def get_task_store() -> TaskStore:
+    """
+    获取任务状态存储实例
+
+    配置项：
+    - task_store.backend: memory | sqlite（默认 memory）
+    - task_store.path: SQLite 文件路径
+    - task_store.ttl: 已结束任务保留秒数
+    - task_store.max_entries: 最大任务数
+    """
+    global _task_store
+    if _task_store is None:
+        with _task_store_lock:
+            if _task_store is None:
+                backend = config_snapshot.get('task_store.backend', 'memory')
+                ttl = float(config_snapshot.get('task_store.ttl', 86400))
+                max_entries = int(config_snapshot.get('task_store.max_entries', 10000))
+                if backend == 'sqlite':
+                    path = config_snapshot.get('task_store.path', './data/tasks.db')
+                    _task_store = SqliteTaskStore(path, ttl=ttl, max_entries=max_entries)
+                else:
+                    _task_store = MemoryTaskStore(ttl=ttl, max_entries=max_entries)
+                _task_store.add_listener(task_event_bus.publish)
+                logger.info(f"任务存储已初始化: {backend}")
+    return _task_store
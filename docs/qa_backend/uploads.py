@@ -0,0 +1,441 @@
+"""
+文档上传与批量上传
+"""
+import os
+import re
+import time
+import uuid
+import asyncio
+import hashlib
+import tarfile
+import zipfile
+import tempfile
+import threading
+import functools
+from typing import Optional
+from datetime import datetime
+from pathlib import Path
+
+from fastapi import HTTPException, UploadFile
+
+from qa_backend.documents import catalog_file
+from qa_backend.executors import run_blocking
+from qa_backend.ingestion import IngestionQueueFullError, get_ingestion_scheduler, index_document_background
+from qa_backend.tasks import TASK_KIND_BULK, TASK_KIND_UPLOAD, TASK_TERMINAL_STATUSES, get_task_store
+
+
+_bulk_coordinator: Optional['BulkUploadCoordinator'] = None
+_bulk_coordinator_lock = threading.Lock()
+LABEL_PATTERN = re.compile(r'^[A-Za-z0-9._-]+$')
+# 上传流式写入默认参数（可通过 upload.chunk_size / upload.max_file_size 配置覆盖）
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_MAX_FILE_SIZE = 500 * 1024 * 1024
+# multipart 边界与表单字段的余量（请求体上限 = 文件上限 + 余量）
+UPLOAD_FORM_OVERHEAD = 1024 * 1024
+UPLOAD_SUPPORTED_EXTENSIONS = {'.pdf', '.md'}
+# 批量上传默认参数（可通过 upload.bulk_* 配置覆盖）
+UPLOAD_ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
+BULK_MAX_FILES = 5000
+BULK_MAX_ARCHIVE_SIZE = 4 * 1024 * 1024 * 1024
+BULK_MAX_TOTAL_SIZE = 20 * 1024 * 1024 * 1024
+
+
+async def save_upload_stream(
+    file: UploadFile,
+    upload_dir: str,
+    filename: str,
+    max_size: int,
+    chunk_size: int = UPLOAD_CHUNK_SIZE
+) -> dict:
+    """
+    分块流式保存上传文件
+
+    按 chunk_size 读取上传内容，在线程池中写入 upload_dir 下的临时文件，
+    同时计算 sha256；写入完成后通过 os.replace 原子重命名为目标文件。
+    超过 max_size 时立即中止并删除临时文件。
+
+    Args:
+        file: 上传文件对象
+        upload_dir: 目标目录
+        filename: 目标文件名（已做安全处理）
+        max_size: 最大允许字节数
+        chunk_size: 单次读取字节数
+
+    Returns:
+        包含 filepath、size、sha256、elapsed 的字典
+    """
+    declared_size = getattr(file, 'size', None)
+    if declared_size is not None and declared_size > max_size:
+        raise HTTPException(
+            status_code=413,
+            detail=f'文件过大（{declared_size} 字节），最大允许 {max_size} 字节'
+        )
+
+    filepath = os.path.join(upload_dir, filename)
+    fd, tmp_path = await run_blocking(
+        'filesystem', tempfile.mkstemp, prefix='.upload-', suffix='.part', dir=upload_dir
+    )
+    hasher = hashlib.sha256()
+    total = 0
+    started = time.perf_counter()
+
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                total += len(chunk)
+                if total > max_size:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f'文件过大，最大允许 {max_size} 字节'
+                    )
+                hasher.update(chunk)
+                await run_blocking('filesystem', f.write, chunk)
+            await run_blocking('filesystem', os.fsync, f.fileno())
+        await run_blocking('filesystem', os.replace, tmp_path, filepath)
+    except BaseException:
+        try:
+            await run_blocking('filesystem', os.remove, tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+    return {
+        'filepath': filepath,
+        'size': total,
+        'sha256': hasher.hexdigest(),
+        'elapsed': time.perf_counter() - started
+    }
+
+
+def is_upload_archive(filename: str) -> bool:
+    return filename.lower().endswith(UPLOAD_ARCHIVE_SUFFIXES)
+
+
+def unique_upload_name(filename: str, used: set) -> str:
+    """同一批次内文件名重复时追加序号（name-1.pdf、name-2.pdf ...）"""
+    candidate, counter = filename, 0
+    stem, suffix = os.path.splitext(filename)
+    while candidate in used:
+        counter += 1
+        candidate = f'{stem}-{counter}{suffix}'
+    used.add(candidate)
+    return candidate
+
+
+def write_stream_atomic(
+    source,
+    upload_dir: str,
+    filename: str,
+    max_size: int,
+    chunk_size: int = UPLOAD_CHUNK_SIZE
+) -> dict:
+    """
+    将可读的二进制流分块写入 upload_dir（临时文件 + 原子重命名）
+
+    save_upload_stream 的同步版本，用于压缩包成员。超过 max_size 时
+    删除临时文件并抛出 ValueError。
+    """
+    filepath = os.path.join(upload_dir, filename)
+    fd, tmp_path = tempfile.mkstemp(prefix='.upload-', suffix='.part', dir=upload_dir)
+    hasher = hashlib.sha256()
+    total = 0
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            while True:
+                chunk = source.read(chunk_size)
+                if not chunk:
+                    break
+                total += len(chunk)
+                if total > max_size:
+                    raise ValueError(f'文件过大，最大允许 {max_size} 字节')
+                hasher.update(chunk)
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    return {'filepath': filepath, 'size': total, 'sha256': hasher.hexdigest()}
+
+
+def iter_archive_members(archive_path: str, archive_name: str):
+    """
+    逐个产出压缩包中的普通文件：(成员路径, 声明大小, 打开函数)
+
+    zip 通过中央目录随机访问，tar 顺序读取；目录、链接、设备文件被忽略。
+    """
+    if archive_name.lower().endswith('.zip'):
+        with zipfile.ZipFile(archive_path) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                yield info.filename, info.file_size, functools.partial(archive.open, info)
+    else:
+        with tarfile.open(archive_path, 'r:*') as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                yield member.name, member.size, functools.partial(archive.extractfile, member)
+
+
+def extract_upload_archive(
+    archive_path: str,
+    archive_name: str,
+    label: str,
+    documents_root: str,
+    processed_docs_root: str,
+    max_files: int,
+    max_file_size: int,
+    max_total_size: int,
+    chunk_size: int = UPLOAD_CHUNK_SIZE
+) -> tuple:
+    """
+    流式解包上传的压缩包
+
+    成员逐个分块写入目标目录（PDF 写入 documents/label，Markdown 写入
+    processed_docs/label），不在内存中展开整个压缩包。只保留文件名部分，
+    不支持的格式、隐藏文件、超限成员记入 skipped。
+
+    Returns:
+        (saved, skipped)：saved 为已写入文件列表，skipped 为 {name, reason} 列表
+    """
+    from werkzeug.utils import secure_filename
+
+    saved, skipped, used = [], [], set()
+    total_size = 0
+    for name, declared_size, open_member in iter_archive_members(archive_path, archive_name):
+        basename = os.path.basename(name.replace('\\', '/'))
+        file_ext = Path(basename).suffix.lower()
+        if not basename or basename.startswith('.') or '__MACOSX' in name:
+            continue
+        if file_ext not in UPLOAD_SUPPORTED_EXTENSIONS:
+            skipped.append({'name': name, 'reason': f'不支持的文件格式 {file_ext or "(无扩展名)"}'})
+            continue
+        if len(saved) >= max_files:
+            skipped.append({'name': name, 'reason': f'超过单次批量上传文件数上限 {max_files}'})
+            continue
+        if declared_size > max_file_size:
+            skipped.append({'name': name, 'reason': f'文件过大（{declared_size} 字节）'})
+            continue
+        if total_size + declared_size > max_total_size:
+            skipped.append({'name': name, 'reason': f'超过解压总大小上限 {max_total_size} 字节'})
+            continue
+        filename = secure_filename(basename)
+        if not filename:
+            skipped.append({'name': name, 'reason': '文件名无效'})
+            continue
+
+        filename = unique_upload_name(filename, used)
+        upload_root = processed_docs_root if file_ext == '.md' else documents_root
+        upload_dir = os.path.join(upload_root, label)
+        os.makedirs(upload_dir, exist_ok=True)
+        try:
+            with open_member() as source:
+                # 按实际读取字节数限制，防止声明大小与内容不符
+                limit = min(max_file_size, max_total_size - total_size)
+                result = write_stream_atomic(source, upload_dir, filename, limit, chunk_size)
+        except (ValueError, RuntimeError, OSError, zipfile.BadZipFile, tarfile.TarError) as e:
+            used.discard(filename)
+            skipped.append({'name': name, 'reason': str(e)})
+            continue
+        total_size += result['size']
+        catalog_file('processed_docs' if file_ext == '.md' else 'documents', result['filepath'])
+        saved.append({'filename': filename, 'file_type': file_ext, 'source': name, **result})
+    return saved, skipped
+
+
+def create_bulk_tasks(parent_id: str, parent: dict, label: str, saved: list) -> list:
+    """为每个文件创建上传子任务并创建父任务，返回子任务列表"""
+    store = get_task_store()
+    children = []
+    now = datetime.now().isoformat()
+    for item in saved:
+        task_id = str(uuid.uuid4())
+        store.create(TASK_KIND_UPLOAD, task_id, {
+            'status': 'pending',
+            'stage': None,
+            'filename': item['filename'],
+            'file_type': item['file_type'],
+            'label': label,
+            'size': item['size'],
+            'sha256': item['sha256'],
+            'needs_preprocessing': item['file_type'] == '.pdf',
+            'parent_id': parent_id,
+            'created_at': now,
+            'progress': {
+                'preprocessing': None,
+                'indexing': None
+            },
+            'errors': []
+        })
+        children.append({'task_id': task_id, **item})
+    parent['children'] = [
+        {'task_id': child['task_id'], 'filename': child['filename']} for child in children
+    ]
+    store.create(TASK_KIND_BULK, parent_id, parent)
+    return children
+
+
+class BulkUploadCoordinator:
+    """
+    批量上传协调器
+
+    - 每个批量上传对应一个父任务（bulk_upload）和若干上传子任务（upload，带 parent_id）
+    - 子任务按顺序提交到摄取调度器，同一父任务同时处于预处理阶段的文件数
+      不超过 parallelism；进入索引阶段后即让出名额，索引提交由调度器按
+      ingestion.index_batch_size / index_batch_window 合并为批次
+    - 作为任务存储监听器接收子任务终态，汇总到父任务（完成数、失败列表、索引批次数）
+    """
+
+    def __init__(self):
+        # parent_id -> 运行中的批量任务状态
+        self._jobs: dict = {}
+        self._lock = threading.Lock()
+
+    def on_task_saved(self, kind: str, task_id: str, task: dict) -> None:
+        """任务存储监听器（可能在任意线程中调用）"""
+        if kind != TASK_KIND_UPLOAD:
+            return
+        parent_id = task.get('parent_id')
+        if parent_id is None:
+            return
+        status = task.get('status')
+        with self._lock:
+            job = self._jobs.get(parent_id)
+            if job is None:
+                return
+            release_slot = status not in ('pending', 'preprocessing') and task_id in job['holding']
+            if release_slot:
+                job['holding'].discard(task_id)
+            finished = status in TASK_TERMINAL_STATUSES and task_id in job['unfinished']
+            if finished:
+                job['unfinished'].discard(task_id)
+                self._record_child_locked(parent_id, job, task_id, task)
+        if release_slot:
+            job['loop'].call_soon_threadsafe(job['slots'].release)
+
+    def _record_child_locked(self, parent_id: str, job: dict, task_id: str, task: dict) -> None:
+        parent = job['parent']
+        summary = parent['summary']
+        summary['in_progress'] -= 1
+        if task.get('status') == 'completed':
+            summary['completed'] += 1
+            # doc_count 只累加已知的单文件文档数；多文件批次只有批次总数，记为未归属文件数。
+            # 同一批次的子任务共享一次 build_index，提交次数按批次计
+            if task.get('doc_count') is None:
+                parent['doc_count_unattributed'] += 1
+            else:
+                parent['doc_count'] += task['doc_count']
+            batch = task.get('batch') or {}
+            job['batches'].add(batch.get('id') if batch.get('size', 1) > 1 else task_id)
+            parent['index_commits'] = len(job['batches'])
+        else:
+            summary['failed'] += 1
+            last_error = (task.get('errors') or [{}])[-1]
+            parent['failures'].append({
+                'task_id': task_id,
+                'filename': task.get('filename'),
+                'stage': last_error.get('stage'),
+                'message': last_error.get('message')
+            })
+
+        if job['unfinished']:
+            parent['stage'] = f"已完成 {summary['completed'] + summary['failed']}/{summary['total']}"
+        else:
+            parent['status'] = 'failed' if summary['completed'] == 0 else 'completed'
+            parent['stage'] = (
+                '批量上传完成' if not summary['failed']
+                else f"批量上传完成，{summary['failed']} 个文件失败"
+            )
+            parent['completed_at'] = datetime.now().isoformat()
+            del self._jobs[parent_id]
+        get_task_store().save(TASK_KIND_BULK, parent_id, parent)
+
+    async def run(
+        self,
+        parent_id: str,
+        parent: dict,
+        children: list,
+        processed_docs_root: str,
+        parallelism: int
+    ) -> None:
+        """依次提交子任务；调度器队列已满时等待后重试"""
+        store = get_task_store()
+        scheduler = get_ingestion_scheduler()
+        slots = asyncio.Semaphore(parallelism)
+        with self._lock:
+            self._jobs[parent_id] = {
+                'loop': asyncio.get_running_loop(),
+                'slots': slots,
+                'parent': parent,
+                'holding': set(),
+                'unfinished': {child['task_id'] for child in children},
+                'batches': set()
+            }
+            parent['status'] = 'processing'
+            parent['stage'] = f"已完成 0/{parent['summary']['total']}"
+        await run_blocking('filesystem', store.save, TASK_KIND_BULK, parent_id, parent)
+
+        for child in children:
+            await slots.acquire()
+            task_id = child['task_id']
+            with self._lock:
+                job = self._jobs.get(parent_id)
+                if job is not None:
+                    job['holding'].add(task_id)
+            while True:
+                try:
+                    scheduler.submit(
+                        task_id,
+                        index_document_background,
+                        child['filepath'],
+                        child['filename'],
+                        parent['label'],
+                        processed_docs_root
+                    )
+                    break
+                except IngestionQueueFullError as e:
+                    if scheduler.is_accepting():
+                        await asyncio.sleep(1.0)
+                        continue
+                    task = await run_blocking('filesystem', store.get, TASK_KIND_UPLOAD, task_id)
+                    task['status'] = 'failed'
+                    task['stage'] = '摄取服务正在关闭'
+                    task['errors'].append({
+                        'stage': 'queue',
+                        'message': str(e),
+                        'timestamp': datetime.now().isoformat()
+                    })
+                    await run_blocking('filesystem', store.save, TASK_KIND_UPLOAD, task_id, task)
+                    break
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'running_jobs': len(self._jobs),
+                'unfinished_files': sum(len(job['unfinished']) for job in self._jobs.values())
+            }
+
+
+def get_bulk_coordinator() -> BulkUploadCoordinator:
+    """获取批量上传协调器（首次调用时注册为任务存储监听器）"""
+    global _bulk_coordinator
+    if _bulk_coordinator is None:
+        with _bulk_coordinator_lock:
+            if _bulk_coordinator is None:
+                coordinator = BulkUploadCoordinator()
+                get_task_store().add_listener(coordinator.on_task_saved)
+                _bulk_coordinator = coordinator
+    return _bulk_coordinator
+
+
+def bulk_upload_stats() -> Optional[dict]:
+    """批量上传统计（未创建时返回 None）"""
+    return _bulk_coordinator.stats() if _bulk_coordinator else None
@@ -1,281 +1,102 @@
 """
 FastAPI 路由
+
+路由处理函数在此定义，各后台组件（任务存储、摄取调度、会话索引、缓存等）位于 qa_backend 包。
 """
 import os
-import re
+import time
 import uuid
+import asyncio
+import json
+import tarfile
+import zipfile
 import logging
-from typing import Optional
+import tempfile
+import contextlib
+from typing import AsyncIterator, List, Optional
 from datetime import datetime
 from pathlib import Path
 
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Query, BackgroundTasks
-from pydantic import BaseModel
-
-from llama_index.core.llms import ChatMessage
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Query, Request, Response
+from fastapi.responses import StreamingResponse
 
-from src.utils.config import get_config_value, load_config
-from src.agent.react_agent import LlamaAgentsRoutingAgent
 from src.services.vector_store import VectorStoreService
-from src.services.chat_store_service import ChatStoreService
-from src.utils.ingestion_handler import IngestionHandler
-
-
-logger = logging.getLogger(__name__)
-
-
-# 自定义异常类
-class PreprocessingError(Exception):
-    """预处理阶段错误"""
-    pass
-
-
-class IndexingError(Exception):
-    """索引阶段错误"""
-    pass
-
-
-router = APIRouter()
-
-# 全局实例
-react_agent: Optional[LlamaAgentsRoutingAgent] = None
-
-# 文档索引任务状态存储（简单实现，生产环境建议使用 Redis）
-indexing_tasks = {}
-# 向量索引更新任务状态存储（简单实现，生产环境建议使用 Redis）
-update_tasks = {}
-LABEL_PATTERN = re.compile(r'^[A-Za-z0-9._-]+$')
-
-
-def get_react_agent() -> LlamaAgentsRoutingAgent:
-    """获取 LlamaAgents 路由代理实例（懒加载）"""
-    global react_agent
-    if react_agent is None:
-        react_agent = LlamaAgentsRoutingAgent()
-    return react_agent
-
-
-def get_chat_store_service() -> ChatStoreService:
-    """获取 ChatStore 服务实例"""
-    return ChatStoreService.get_instance()
-
-
-def index_document_background(
-    task_id: str,
-    filepath: str,
-    filename: str,
-    label: str,
-    processed_docs_root: str
-):
-    """
-    后台索引任务（支持预处理）
 
-    Args:
-        task_id: 任务ID
-        filepath: 文件路径
-        filename: 文件名
-        label: 标签名（用于目录分组）
-        processed_docs_root: 预处理文档根目录
-    """
-    try:
-        file_ext = Path(filepath).suffix.lower()
-        task = indexing_tasks[task_id]
-        processed_filepath = filepath
-        processed_docs_root = processed_docs_root or get_config_value(
-            'vector_store.processed_docs', './data/processed_docs'
-        )
-
-        # === 阶段 1: 预处理（仅 PDF） ===
-        if file_ext == '.pdf':
-            task['status'] = 'preprocessing'
-            task['stage'] = '正在预处理 PDF 文档'
-            task['progress']['preprocessing'] = 'in_progress'
-            logger.info(f"[{task_id}] 开始预处理: {filename}")
-
-            try:
-                ingestion_service = IngestionHandler.get_instance()
-                output_dir = os.path.join(processed_docs_root, label)
-                os.makedirs(output_dir, exist_ok=True)
-                preprocess_result = ingestion_service.preprocess_single_file(
-                    input_file=filepath,
-                    output_dir=output_dir
-                )
-
-                if preprocess_result['status'] == 'success':
-                    task['progress']['preprocessing'] = 'completed'
-                    processed_filepath = preprocess_result['markdown_path']
-                    logger.info(f"[{task_id}] 预处理成功: {processed_filepath}")
-                else:
-                    # 预处理失败 - 直接终止
-                    raise PreprocessingError(preprocess_result.get('message', 'Unknown error'))
-
-            except Exception as e:
-                task['status'] = 'failed'
-                task['stage'] = '预处理失败'
-                task['progress']['preprocessing'] = 'failed'
-                task['errors'].append({
-                    'stage': 'preprocessing',
-                    'message': str(e),
-                    'timestamp': datetime.now().isoformat()
-                })
-                logger.error(f"[{task_id}] 预处理失败: {e}", exc_info=True)
-                return  # 终止任务
-
-        elif file_ext == '.md':
-            task['progress']['preprocessing'] = 'skipped'
-            logger.info(f"[{task_id}] Markdown 文件，跳过预处理")
-
-        # === 阶段 2: 索引 ===
-        task['status'] = 'indexing'
-        task['stage'] = '正在构建索引'
-        task['progress']['indexing'] = 'in_progress'
-        logger.info(f"[{task_id}] 开始索引: {processed_filepath}")
-
-        try:
-            ingestion_service = IngestionHandler.get_instance()
-            result = ingestion_service.build_index(
-                directory=processed_docs_root,
-                input_files=[processed_filepath],
-                rebuild=False,
-                check_duplicates=True
-            )
+from qa_backend.answer_cache import get_answer_cache
+from qa_backend.chat import (
+    STREAM_BUFFER_SIZE, STREAM_HEARTBEAT_INTERVAL, ThinkingEventEmitter, get_memory_cache, lock_chat_session,
+    persist_chat_turn, public_message_kwargs, resolve_chat_session, shutdown_turn_writer, sync_pending_turns,
+    turn_writer_stats
+)
+from qa_backend.config_snapshot import config_snapshot
+from qa_backend.database import (
+    ArrowChunkSink, QueryRowProducer, decode_query_cursor, encode_query_cursor, get_engine_registry,
+    validate_readonly_sql
+)
+from qa_backend.documents import DOCUMENT_PAGE_SIZE, catalog_file, get_document_catalog, start_catalog_reconcile
+from qa_backend.executors import (
+    get_blocking_executors, loop_monitor_stats, run_blocking, shutdown_blocking_executors, spawn_detached,
+    start_loop_monitor
+)
+from qa_backend.governor import agent_governor_stats, get_agent_governor, get_query_coalescer, query_coalescer_stats
+from qa_backend.ingestion import (
+    IngestionQueueFullError, get_ingestion_scheduler, index_document_background, shutdown_ingestion_scheduler,
+    update_index_background
+)
+from qa_backend.metrics import chat_stage_duration, metrics
+from qa_backend.models import ChatWithContextRequest, DatabaseQueryRequest
+from qa_backend.profiling import ChatStageRecorder, finish_profile, release_profiler, should_profile, start_profiler
+from qa_backend.routing import TimedRoute
+from qa_backend.services import get_chat_store_service, get_react_agent, get_warmup_state, start_warm_up
+from qa_backend.session_index import (
+    SessionIndex, get_session_index, index_session, reconcile_session_index, session_index_stats
+)
+from qa_backend.session_sweeper import get_session_sweeper, session_sweeper_stats, start_session_sweeper
+from qa_backend.tasks import (
+    TASK_KIND_BULK, TASK_KIND_UPDATE, TASK_KIND_UPLOAD, TASK_TERMINAL_STATUSES, get_task_store, task_event_bus
+)
+from qa_backend.uploads import (
+    BULK_MAX_ARCHIVE_SIZE, BULK_MAX_FILES, BULK_MAX_TOTAL_SIZE, LABEL_PATTERN, UPLOAD_ARCHIVE_SUFFIXES,
+    UPLOAD_CHUNK_SIZE, UPLOAD_MAX_FILE_SIZE, UPLOAD_SUPPORTED_EXTENSIONS, bulk_upload_stats, create_bulk_tasks,
+    extract_upload_archive, get_bulk_coordinator, is_upload_archive, save_upload_stream, unique_upload_name
+)
 
-            if result.get('success'):
-                task['status'] = 'completed'
-                task['stage'] = '索引构建完成'
-                task['progress']['indexing'] = 'completed'
-                task['doc_count'] = result['documents_processed']
-                task['total_count'] = result['total_document_count']
-                task['mode'] = result['mode']
-                task['completed_at'] = datetime.now().isoformat()
-                logger.info(f"[{task_id}] 索引完成")
-            else:
-                raise IndexingError(result.get('message', 'Unknown error'))
 
-        except Exception as e:
-            task['status'] = 'failed'
-            task['stage'] = '索引失败'
-            task['progress']['indexing'] = 'failed'
-            task['errors'].append({
-                'stage': 'indexing',
-                'message': str(e),
-                'timestamp': datetime.now().isoformat()
-            })
-            logger.error(f"[{task_id}] 索引失败: {e}", exc_info=True)
+logger = logging.getLogger(__name__)
 
-    except Exception as e:
-        # 捕获未预期的异常
-        task['status'] = 'failed'
-        task['stage'] = '任务执行异常'
-        task['errors'].append({
-            'stage': 'unknown',
-            'message': str(e),
-            'timestamp': datetime.now().isoformat()
-        })
-        logger.error(f"[{task_id}] 任务异常: {e}", exc_info=True)
 
+# ========== 生命周期 ==========
 
-def update_index_background(task_id: str, processed_docs_root: str) -> None:
+@contextlib.asynccontextmanager
+async def lifespan(app) -> AsyncIterator[None]:
     """
-    后台更新索引任务
+    应用生命周期：启动时开启各后台任务，关闭时排空队列并释放线程池
 
-    Args:
-        task_id: 任务ID
-        processed_docs_root: 预处理文档根目录
+    router 以 lifespan 参数创建，app.include_router(router) 时会合并到应用的生命周期；
+    也可直接 FastAPI(lifespan=lifespan) 挂载
     """
-    task = update_tasks.get(task_id)
-    if task is None:
-        logger.error(f"[{task_id}] 更新任务不存在，无法执行")
-        return
-
+    await start_loop_monitor()
+    await start_warm_up()
+    await reconcile_session_index()
+    await start_session_sweeper()
+    await start_catalog_reconcile()
     try:
-        ingestion_service = IngestionHandler.get_instance()
-        vector_service = VectorStoreService.get_instance()
-
-        task['status'] = 'loading'
-        task['stage'] = '正在加载文档'
-        task['progress']['loading'] = 'in_progress'
-        logger.info(f"[{task_id}] 开始加载文档: {processed_docs_root}")
-
-        documents = ingestion_service.load_documents(
-            directory=processed_docs_root,
-            use_processed=True
-        )
-        task['documents_loaded'] = len(documents)
-        task['progress']['loading'] = 'completed'
-
-        if not documents:
-            task['status'] = 'completed'
-            task['stage'] = '没有可更新的文档'
-            task['progress']['updating'] = 'skipped'
-            task['result'] = {
-                'success': True,
-                'mode': 'skipped',
-                'documents_checked': 0,
-                'documents_added': 0,
-                'message': '没有可更新的文档'
-            }
-            task['completed_at'] = datetime.now().isoformat()
-            return
-
-        task['status'] = 'updating'
-        task['stage'] = '正在检查并更新索引'
-        task['progress']['updating'] = 'in_progress'
-        logger.info(f"[{task_id}] 开始更新索引")
-
-        documents = ingestion_service.enrich_metadata(documents, processed_docs_root)
-        result = vector_service.update_index(documents)
-
-        task['status'] = 'completed'
-        task['stage'] = '更新完成'
-        task['progress']['updating'] = 'completed'
-        task['result'] = result
-        task['completed_at'] = datetime.now().isoformat()
-        logger.info(f"[{task_id}] 更新完成")
-
-    except Exception as e:
-        task['status'] = 'failed'
-        task['stage'] = '更新失败'
-        if task.get('progress'):
-            task['progress']['loading'] = task['progress'].get('loading') or 'failed'
-            task['progress']['updating'] = task['progress'].get('updating') or 'failed'
-        task['errors'].append({
-            'stage': 'updating',
-            'message': str(e),
-            'timestamp': datetime.now().isoformat()
-        })
-        logger.error(f"[{task_id}] 更新失败: {e}", exc_info=True)
-
-
-# ========== 请求/响应模型 ==========
-
-class ChatRequest(BaseModel):
-    query: str
-    session_id: Optional[str] = None
-    query_type: Optional[str] = None
-    create_session: bool = True
-    db_name: Optional[str] = None
-    db_source: Optional[str] = None
-    api_name: Optional[str] = None
-
-
-class ReactQueryRequest(BaseModel):
-    query: str
-    reset: bool = False
+        yield
+    finally:
+        # 先排空摄取队列、写入缓冲中的对话轮次，最后关闭阻塞线程池
+        await shutdown_ingestion_scheduler()
+        shutdown_turn_writer()
+        await shutdown_blocking_executors()
 
 
-class ChatWithContextRequest(BaseModel):
-    query: str
-    session_id: Optional[str] = None
-    reset: bool = False
+router = APIRouter(route_class=TimedRoute, lifespan=lifespan)
 
 
 # ========== 文档上传 ==========
 @router.post('/upload')
 async def upload_document(
     file: UploadFile = File(...),
-    label: str = Form('general'),
-    background_tasks: BackgroundTasks = None
+    label: str = Form('general')
 ):
     """
     上传文档到知识库（异步索引版本，支持预处理）
@@ -285,6 +106,10 @@ async def upload_document(
     - Markdown 文件跳过预处理，直接索引
     - 其他格式拒绝上传
     - 异步后台任务，分阶段报告进度
+    - 分块流式写入磁盘，超过 upload.max_file_size 返回 413：Content-Length 超限时
+      在解析表单前直接拒绝；chunked 请求在累计读取超限时中止（此前已读取的
+      部分仍会写入 Starlette 的表单临时文件）
+    - 由摄取调度器限流执行，队列已满时返回 429
 
     返回:
     - task_id: 索引任务ID
@@ -295,7 +120,6 @@ async def upload_document(
             raise HTTPException(status_code=400, detail='文件名为空')
 
         # 文件类型验证
-        SUPPORTED_EXTENSIONS = {'.pdf', '.md'}
         REJECTED_EXTENSIONS = {'.docx', '.txt', '.doc', '.pptx', '.ppt'}
 
         file_ext = Path(file.filename).suffix.lower()
@@ -306,7 +130,7 @@ async def upload_document(
                 detail=f'不支持的文件格式 {file_ext}，当前仅支持 PDF 和 Markdown 文件'
             )
 
-        if file_ext not in SUPPORTED_EXTENSIONS:
+        if file_ext not in UPLOAD_SUPPORTED_EXTENSIONS:
             raise HTTPException(
                 status_code=400,
                 detail=f'未知文件格式 {file_ext}，请上传 .pdf 或 .md 文件'
@@ -320,34 +144,51 @@ async def upload_document(
                 detail='label 仅支持字母/数字/.-_，不允许中文或空格'
             )
 
+        scheduler = get_ingestion_scheduler()
+        if not scheduler.has_capacity():
+            raise HTTPException(
+                status_code=429,
+                detail='摄取队列已满，请稍后重试',
+                headers={'Retry-After': '30'}
+            )
+
         # 保存文件
         from werkzeug.utils import secure_filename
         filename = secure_filename(file.filename)
-        documents_root = get_config_value('vector_store.documents', './data/documents')
-        processed_docs_root = get_config_value(
+        documents_root = config_snapshot.get('vector_store.documents', './data/documents')
+        processed_docs_root = config_snapshot.get(
             'vector_store.processed_docs', './data/processed_docs'
         )
         upload_root = processed_docs_root if file_ext == '.md' else documents_root
         upload_dir = os.path.join(upload_root, label)
-        os.makedirs(upload_dir, exist_ok=True)
-
-        filepath = os.path.join(upload_dir, filename)
-
-        # 写入文件
-        content = await file.read()
-        with open(filepath, 'wb') as f:
-            f.write(content)
+        await run_blocking('filesystem', os.makedirs, upload_dir, exist_ok=True)
+
+        # 流式写入文件（分块读取 + 临时文件 + 原子重命名）
+        max_size = int(config_snapshot.get('upload.max_file_size', UPLOAD_MAX_FILE_SIZE))
+        chunk_size = int(config_snapshot.get('upload.chunk_size', UPLOAD_CHUNK_SIZE))
+        saved = await save_upload_stream(file, upload_dir, filename, max_size, chunk_size)
+        filepath = saved['filepath']
+        await run_blocking(
+            'filesystem', catalog_file, 'processed_docs' if file_ext == '.md' else 'documents', filepath
+        )
 
-        logger.info(f"文件上传成功: {filename}")
+        throughput = saved['size'] / saved['elapsed'] if saved['elapsed'] > 0 else 0.0
+        logger.info(
+            f"文件上传成功: {filename} ({saved['size']} bytes, "
+            f"{throughput / 1024 / 1024:.2f} MB/s, sha256={saved['sha256'][:12]})"
+        )
 
         # 创建后台索引任务（新增字段）
         task_id = str(uuid.uuid4())
-        indexing_tasks[task_id] = {
+        store = get_task_store()
+        await run_blocking('filesystem', store.create, TASK_KIND_UPLOAD, task_id, {
             'status': 'pending',
             'stage': None,
             'filename': filename,
             'file_type': file_ext,
             'label': label,
+            'size': saved['size'],
+            'sha256': saved['sha256'],
             'needs_preprocessing': file_ext == '.pdf',
             'created_at': datetime.now().isoformat(),
             'progress': {
@@ -355,17 +196,30 @@ async def upload_document(
                 'indexing': None
             },
             'errors': []
-        }
+        })
 
-        # 添加后台任务
-        background_tasks.add_task(
-            index_document_background,
-            task_id,
-            filepath,
-            filename,
-            label,
-            processed_docs_root
-        )
+        # 提交到摄取调度器
+        try:
+            queue_position = scheduler.submit(
+                task_id,
+                index_document_background,
+                filepath,
+                filename,
+                label,
+                processed_docs_root
+            )
+        except IngestionQueueFullError as e:
+            task = await run_blocking('filesystem', store.get, TASK_KIND_UPLOAD, task_id)
+            task['status'] = 'failed'
+            task['stage'] = '摄取队列已满'
+            task['errors'].append({
+                'stage': 'queue',
+                'message': str(e),
+                'timestamp': datetime.now().isoformat()
+            })
+            await run_blocking('filesystem', store.save, TASK_KIND_UPLOAD, task_id, task)
+            await run_blocking('filesystem', os.remove, filepath)
+            raise HTTPException(status_code=429, detail=str(e), headers={'Retry-After': '30'})
 
         return {
             'success': True,
@@ -374,6 +228,7 @@ async def upload_document(
             'filename': filename,
             'file_type': file_ext,
             'label': label,
+            'queue_position': queue_position,
             'status_url': f'/api/upload/status/{task_id}'
         }
 
@@ -395,28 +250,236 @@ async def get_upload_status(task_id: str):
     返回:
         任务状态信息
     """
-    if task_id not in indexing_tasks:
+    task = await run_blocking('filesystem', get_task_store().get, TASK_KIND_UPLOAD, task_id)
+    if task is None:
         raise HTTPException(status_code=404, detail='任务不存在')
 
     return {
         'success': True,
         'task_id': task_id,
-        **indexing_tasks[task_id]
+        **task,
+        'queue_position': get_ingestion_scheduler().queue_position(task_id)
     }
 
 
+@router.post('/upload/bulk')
+async def upload_bulk(
+    files: List[UploadFile] = File(...),
+    label: str = Form('general')
+):
+    """
+    批量上传文档（多个文件，或单个 zip/tar 压缩包）
+
+    - 多个文件逐个分块流式写入磁盘；单个压缩包先流式落盘，再逐个成员解包
+    - 创建一个父任务（bulk_upload）和每个文件一个上传子任务（upload）
+    - 子任务并行处理（upload.bulk_parallelism），索引按批次提交
+    - 不支持或超限的文件不中断整批，记录在 skipped 中
+
+    配置项：
+    - upload.bulk_parallelism: 同一批量任务同时预处理的文件数（默认等于预处理进程数）
+    - upload.bulk_max_files: 单次批量上传最多文件数（默认 5000）
+    - upload.bulk_max_request_size: 请求体最大字节数，解析表单前检查（默认 4GB）
+    - upload.bulk_max_archive_size: 压缩包最大字节数（默认 4GB）
+    - upload.bulk_max_total_size: 解包后总字节数上限（默认 20GB）
+
+    返回:
+    - task_id: 父任务ID，使用 GET /api/upload/bulk/{task_id} 查询汇总进度
+    """
+    try:
+        if not files:
+            raise HTTPException(status_code=400, detail='未选择文件')
+        if not label:
+            label = 'general'
+        if not LABEL_PATTERN.fullmatch(label) or label in {'.', '..'}:
+            raise HTTPException(
+                status_code=400,
+                detail='label 仅支持字母/数字/.-_，不允许中文或空格'
+            )
+
+        max_files = int(config_snapshot.get('upload.bulk_max_files', BULK_MAX_FILES))
+        if len(files) > max_files:
+            raise HTTPException(status_code=400, detail=f'单次最多上传 {max_files} 个文件')
+
+        scheduler = get_ingestion_scheduler()
+        if not scheduler.has_capacity():
+            raise HTTPException(
+                status_code=429,
+                detail='摄取队列已满，请稍后重试',
+                headers={'Retry-After': '30'}
+            )
+
+        from werkzeug.utils import secure_filename
+        documents_root = config_snapshot.get('vector_store.documents', './data/documents')
+        processed_docs_root = config_snapshot.get(
+            'vector_store.processed_docs', './data/processed_docs'
+        )
+        max_size = int(config_snapshot.get('upload.max_file_size', UPLOAD_MAX_FILE_SIZE))
+        chunk_size = int(config_snapshot.get('upload.chunk_size', UPLOAD_CHUNK_SIZE))
+        saved, skipped = [], []
+        archive_name = None
+
+        if len(files) == 1 and files[0].filename and is_upload_archive(files[0].filename):
+            # 压缩包：先流式写入临时目录，再在线程池中逐个成员解包
+            archive_name = files[0].filename
+            suffix = next(s for s in UPLOAD_ARCHIVE_SUFFIXES if archive_name.lower().endswith(s))
+            archive = await save_upload_stream(
+                files[0],
+                tempfile.gettempdir(),
+                f'bulk-{uuid.uuid4().hex}{suffix}',
+                int(config_snapshot.get('upload.bulk_max_archive_size', BULK_MAX_ARCHIVE_SIZE)),
+                chunk_size
+            )
+            try:
+                saved, skipped = await run_blocking(
+                    'filesystem', extract_upload_archive,
+                    archive['filepath'], archive_name, label,
+                    documents_root, processed_docs_root,
+                    max_files, max_size,
+                    int(config_snapshot.get('upload.bulk_max_total_size', BULK_MAX_TOTAL_SIZE)),
+                    chunk_size
+                )
+            except (zipfile.BadZipFile, tarfile.TarError) as e:
+                raise HTTPException(status_code=400, detail=f'无法读取压缩包: {e}')
+            finally:
+                await run_blocking('filesystem', os.remove, archive['filepath'])
+        else:
+            used: set = set()
+            for file in files:
+                file_ext = Path(file.filename or '').suffix.lower()
+                if file_ext not in UPLOAD_SUPPORTED_EXTENSIONS:
+                    skipped.append({'name': file.filename, 'reason': f'不支持的文件格式 {file_ext}'})
+                    continue
+                filename = secure_filename(file.filename)
+                if not filename:
+                    skipped.append({'name': file.filename, 'reason': '文件名无效'})
+                    continue
+                filename = unique_upload_name(filename, used)
+                upload_root = processed_docs_root if file_ext == '.md' else documents_root
+                upload_dir = os.path.join(upload_root, label)
+                await run_blocking('filesystem', os.makedirs, upload_dir, exist_ok=True)
+                try:
+                    result = await save_upload_stream(file, upload_dir, filename, max_size, chunk_size)
+                except HTTPException as e:
+                    if e.status_code != 413:
+                        raise
+                    skipped.append({'name': file.filename, 'reason': e.detail})
+                    continue
+                await run_blocking(
+                    'filesystem', catalog_file,
+                    'processed_docs' if file_ext == '.md' else 'documents', result['filepath']
+                )
+                saved.append({
+                    'filename': filename,
+                    'file_type': file_ext,
+                    'source': file.filename,
+                    'filepath': result['filepath'],
+                    'size': result['size'],
+                    'sha256': result['sha256']
+                })
+
+        if not saved:
+            raise HTTPException(
+                status_code=400,
+                detail={'message': '没有可处理的文件', 'skipped': skipped}
+            )
+
+        parent_id = str(uuid.uuid4())
+        parent = {
+            'status': 'pending',
+            'stage': None,
+            'label': label,
+            'archive': archive_name,
+            'created_at': datetime.now().isoformat(),
+            'summary': {
+                'total': len(saved),
+                'completed': 0,
+                'failed': 0,
+                'in_progress': len(saved)
+            },
+            'doc_count': 0,
+            'doc_count_unattributed': 0,
+            'index_commits': 0,
+            'failures': [],
+            'skipped': skipped,
+            'errors': []
+        }
+        children = await run_blocking('filesystem', create_bulk_tasks, parent_id, parent, label, saved)
+        logger.info(
+            f"[{parent_id}] 批量上传: {len(saved)} 个文件"
+            f"{f'（来自 {archive_name}）' if archive_name else ''}，跳过 {len(skipped)} 个"
+        )
+
+        parallelism = int(config_snapshot.get('upload.bulk_parallelism', scheduler.preprocess_workers))
+        spawn_detached(get_bulk_coordinator().run(
+            parent_id, parent, children, processed_docs_root, max(1, parallelism)
+        ))
+
+        return {
+            'success': True,
+            'message': f'已接收 {len(saved)} 个文件，正在后台处理',
+            'task_id': parent_id,
+            'label': label,
+            'file_count': len(saved),
+            'skipped': skipped,
+            'files': [{'task_id': child['task_id'], 'filename': child['filename']} for child in children],
+            'status_url': f'/api/upload/bulk/{parent_id}'
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"批量上传错误: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get('/upload/bulk/{task_id}')
+async def get_bulk_upload_status(task_id: str, include_children: bool = Query(False)):
+    """
+    查询批量上传任务进度
+
+    Args:
+        task_id: 父任务ID
+        include_children: 是否附带每个子任务的当前状态
+
+    返回:
+        汇总进度（summary）、失败文件列表（failures）、跳过的文件（skipped）
+    """
+    store = get_task_store()
+    task = await run_blocking('filesystem', store.get, TASK_KIND_BULK, task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail='任务不存在')
+
+    response = {'success': True, 'task_id': task_id, **task}
+    if include_children:
+        def load_children() -> list:
+            children = []
+            for child in task.get('children', []):
+                child_task = store.get(TASK_KIND_UPLOAD, child['task_id']) or {}
+                children.append({
+                    'task_id': child['task_id'],
+                    'filename': child['filename'],
+                    'status': child_task.get('status'),
+                    'stage': child_task.get('stage')
+                })
+            return children
+
+        response['children'] = await run_blocking('filesystem', load_children)
+    return response
+
+
 # ========== 索引更新 ==========
 @router.post('/update_index')
-async def update_index(background_tasks: BackgroundTasks = None):
+async def update_index():
     """
-    检查并更新向量索引（后台任务）
+    检查并更新向量索引（后台任务，由摄取调度器执行）
     """
     try:
-        processed_docs_root = get_config_value(
+        processed_docs_root = config_snapshot.get(
             'vector_store.processed_docs', './data/processed_docs'
         )
         task_id = str(uuid.uuid4())
-        update_tasks[task_id] = {
+        store = get_task_store()
+        await run_blocking('filesystem', store.create, TASK_KIND_UPDATE, task_id, {
             'status': 'pending',
             'stage': None,
             'created_at': datetime.now().isoformat(),
@@ -427,11 +490,11 @@ async def update_index(background_tasks: BackgroundTasks = None):
             'documents_loaded': 0,
             'result': None,
             'errors': []
-        }
+        })
 
-        background_tasks.add_task(
-            update_index_background,
+        queue_position = get_ingestion_scheduler().submit(
             task_id,
+            update_index_background,
             processed_docs_root
         )
 
@@ -439,9 +502,18 @@ async def update_index(background_tasks: BackgroundTasks = None):
             'success': True,
             'message': '索引更新任务已提交',
             'task_id': task_id,
+            'queue_position': queue_position,
             'status_url': f'/api/update_index/status/{task_id}'
         }
 
+    except IngestionQueueFullError as e:
+        task = await run_blocking('filesystem', store.get, TASK_KIND_UPDATE, task_id)
+        await run_blocking('filesystem', store.save, TASK_KIND_UPDATE, task_id, {
+            **task,
+            'status': 'failed',
+            'stage': '摄取队列已满'
+        })
+        raise HTTPException(status_code=429, detail=str(e), headers={'Retry-After': '30'})
     except Exception as e:
         logger.error(f"更新索引失败: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
@@ -458,32 +530,153 @@ async def get_update_index_status(task_id: str):
     返回:
         任务状态信息
     """
-    if task_id not in update_tasks:
+    task = await run_blocking('filesystem', get_task_store().get, TASK_KIND_UPDATE, task_id)
+    if task is None:
         raise HTTPException(status_code=404, detail='任务不存在')
 
     return {
         'success': True,
         'task_id': task_id,
-        **update_tasks[task_id]
+        **task,
+        'queue_position': get_ingestion_scheduler().queue_position(task_id)
+    }
+
+
+@router.get('/tasks/events')
+async def stream_task_events(
+    http_request: Request,
+    task_ids: str = Query(..., description='逗号分隔的任务ID'),
+    kind: str = Query(TASK_KIND_UPLOAD)
+):
+    """
+    订阅任务进度（SSE）
+
+    连接建立时先推送各任务的当前状态，之后在任务阶段变化时推送 progress 事件；
+    所有任务进入终态后发送 done 事件并关闭连接。GET 状态查询接口保持不变。
+
+    Args:
+        task_ids: 逗号分隔的任务ID（最多 50 个）
+        kind: 任务类型（upload | update_index | bulk_upload）
+    """
+    if kind not in {TASK_KIND_UPLOAD, TASK_KIND_UPDATE, TASK_KIND_BULK}:
+        raise HTTPException(status_code=400, detail=f'未知任务类型 {kind}')
+    ids = list(dict.fromkeys(tid for tid in task_ids.split(',') if tid))[:50]
+    if not ids:
+        raise HTTPException(status_code=400, detail='task_ids 不能为空')
+
+    store = get_task_store()
+    poll_interval = float(config_snapshot.get('task_events.poll_interval', 5.0))
+
+    def format_event(event_type: str, payload: dict) -> str:
+        return f"event: {event_type}\ndata: {json.dumps(payload, ensure_ascii=False, default=str)}\n\n"
+
+    async def event_stream() -> AsyncIterator[str]:
+        events = task_event_bus.subscribe(kind, ids)
+        pending = set(ids)
+        last_sent: dict = {}
+
+        def progress(task_id: str, task: Optional[dict]) -> Optional[str]:
+            if task is None:
+                pending.discard(task_id)
+                return format_event('missing', {'task_id': task_id, 'kind': kind})
+            if task.get('status') in TASK_TERMINAL_STATUSES:
+                pending.discard(task_id)
+            event = format_event('progress', {'success': True, 'task_id': task_id, 'kind': kind, **task})
+            if last_sent.get(task_id) == event:
+                return None
+            last_sent[task_id] = event
+            return event
+
+        try:
+            # 连接时回放当前状态
+            for task_id in ids:
+                event = progress(task_id, await run_blocking('filesystem', store.get, kind, task_id))
+                if event:
+                    yield event
+
+            while pending:
+                if await http_request.is_disconnected():
+                    return
+                try:
+                    task_id, task = await asyncio.wait_for(events.get(), timeout=poll_interval)
+                except asyncio.TimeoutError:
+                    # 兜底：其他 worker 进程的更新（SQLite 后端）不会经过本进程事件总线
+                    for task_id in list(pending):
+                        event = progress(task_id, await run_blocking('filesystem', store.get, kind, task_id))
+                        if event:
+                            yield event
+                    yield ": ping\n\n"
+                    continue
+                if task_id in pending:
+                    event = progress(task_id, task)
+                    if event:
+                        yield event
+
+            yield format_event('done', {'task_ids': ids, 'kind': kind})
+        finally:
+            task_event_bus.unsubscribe(kind, ids, events)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+
+@router.get('/tasks')
+async def list_tasks(
+    kind: str = Query(TASK_KIND_UPLOAD),
+    status: Optional[str] = Query(None),
+    label: Optional[str] = Query(None),
+    limit: int = Query(50, ge=1, le=500)
+):
+    """
+    按状态/标签筛选任务列表
+
+    Args:
+        kind: 任务类型（upload | update_index | bulk_upload）
+        status: 可选，任务状态
+        label: 可选，文档标签
+        limit: 返回数量限制
+
+    返回:
+        任务列表（按创建时间倒序）
+    """
+    if kind not in {TASK_KIND_UPLOAD, TASK_KIND_UPDATE, TASK_KIND_BULK}:
+        raise HTTPException(status_code=400, detail=f'未知任务类型 {kind}')
+
+    tasks = await run_blocking(
+        'filesystem', get_task_store().list, kind, status=status, label=label, limit=limit
+    )
+    return {
+        'success': True,
+        'count': len(tasks),
+        'tasks': tasks
     }
 
 
 # ========== 聊天接口 ==========
 @router.post('/chat/debug')
-async def chat_with_context_debug(request: ChatWithContextRequest):
+async def chat_with_context_debug(
+    request: ChatWithContextRequest,
+    http_request: Request,
+    profile: bool = Query(False)
+):
     """
-    支持多轮对话的聊天接口（使用 Context 机制）
+    支持多轮对话的聊天接口（调试版：OpenTelemetry 分阶段 Span + 可选采样分析）
 
-    请求体:
-    - query: 用户问题
-    - session_id: 可选，会话ID（用于恢复历史对话）
-    - reset: 可选，true 时重置会话
+    请求体与 /chat 相同。
+
+    采样分析（默认关闭）：profile=true、请求头 X-Profile: 1，或按
+    profiling.sample_every 每 N 个请求自动开启。分析结果写入 profiling.output_dir
+    （collapsed-stack 与 speedscope 文件），摘要随响应返回。
 
     返回:
-    - success: 是否成功
-    - session_id: 会话ID（用于后续请求）
-    - answer: 回答内容
-    - raw: 原始响应（可选）
+    - /chat 的全部字段
+    - debug: timings（各阶段耗时）、trace_id（如有）、profile（开启分析时）
     """
     from opentelemetry import context, trace
     from opentelemetry.trace import Status, StatusCode
@@ -497,8 +690,15 @@ async def chat_with_context_debug(request: ChatWithContextRequest):
     span.set_attribute(SpanAttributes.INPUT_VALUE, request.query)
     logger.debug("===================== phoenix处理用户输入============================")
 
+    stages = ChatStageRecorder('chat_debug', tracer=tracer)
+    profiler, profile_info = None, None
+    if should_profile(http_request, profile):
+        profiler = start_profiler()
+        if profiler is None:
+            profile_info = {'skipped': '已有采样分析在进行'}
+
     try:
-        return await chat_with_context(request)
+        result = await process_chat(request, stages)
     except HTTPException as exc:
         span.record_exception(exc)
         span.set_status(Status(StatusCode.ERROR, str(exc.detail)))
@@ -509,9 +709,26 @@ async def chat_with_context_debug(request: ChatWithContextRequest):
         logger.error(f"Chat 接口错误: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
     finally:
+        if profiler is not None:
+            profiler.stop()
+            try:
+                profile_info = await run_blocking('filesystem', finish_profile, profiler)
+            except Exception as e:
+                logger.warning(f"写入采样分析结果失败: {e}")
+                profile_info = {'error': str(e)}
+            finally:
+                release_profiler()
         context.detach(ctx_token)
         span.end()
 
+    debug = {'timings': stages.timings}
+    trace_id = span.get_span_context().trace_id
+    if trace_id:
+        debug['trace_id'] = format(trace_id, '032x')
+    if profile_info is not None:
+        debug['profile'] = profile_info
+    return {**result, 'debug': debug}
+
 
 @router.post('/chat')
 async def chat_with_context(request: ChatWithContextRequest):
@@ -529,51 +746,93 @@ async def chat_with_context(request: ChatWithContextRequest):
     - answer: 回答内容
     - raw: 原始响应（可选）
     """
+    return await process_chat(request, ChatStageRecorder('chat'))
+
+
+async def process_chat(request: ChatWithContextRequest, stages: ChatStageRecorder) -> dict:
+    """执行一轮聊天，各阶段耗时记录到 stages"""
     try:
         agent = get_react_agent()
         chat_store_service = get_chat_store_service()
 
-        # 1. 处理 reset 或创建新会话
-        if request.reset:
-            if request.session_id:
-                archived = chat_store_service.archive_session(request.session_id, force=True)
-                if not archived:
-                    logger.warning(
-                        "历史会话归档失败或不存在: %s",
-                        request.session_id,
-                    )
-                # 清除 ChatStore 历史
-                chat_store_service.clear_session(request.session_id)
-            session_id = str(uuid.uuid4())
-            ctx = None  # 单轮 Context
-            logger.info(f"创建新会话: {session_id}")
-        else:
-            if not request.session_id:
-                raise HTTPException(
-                    status_code=400,
-                    detail='需要 session_id 或 reset=true 创建新会话'
-                )
-            session_id = request.session_id
-            ctx = None
-
-        # 2. 加载 ChatMemoryBuffer（用于对话历史，不包含当前问题）
-        config = load_config()
-        token_limit = config.get('chat_store', {}).get('token_limit', 3000)
-        chat_memory = chat_store_service.get_chat_memory(session_id, token_limit=token_limit)
-
-        # 3. 调用带 Context 和 ChatMemory 的查询方法（此时 ChatStore 中还没有当前问题）
-        result, _ = await agent.aquery_with_context(
-            request.query,
-            ctx,
-            chat_memory=chat_memory
-        )
+        # 1. 处理 reset 或创建新会话；同一会话的轮次串行执行：准备会话 → 读记忆 → Agent → 写入
+        governor = get_agent_governor()
+        started = time.perf_counter()
+        session_id = resolve_chat_session(request)
+        release_session = await lock_chat_session(request, chat_store_service, governor, session_id)
+        stages.mark('session', started)
+        ctx = None  # 单轮 Context
 
-        # 4. Agent 完成后，再添加用户消息和助手回答到 ChatStore
-        user_msg = ChatMessage(role="user", content=request.query)
-        chat_store_service.add_message(session_id, user_msg)
+        try:
+            # 2. 加载 ChatMemoryBuffer（用于对话历史，不包含当前问题）
+            token_limit = config_snapshot.get('chat_store.token_limit', 3000)
+            started = time.perf_counter()
+            chat_memory = await run_blocking(
+                'chat_store', get_memory_cache().get_memory, chat_store_service, session_id, token_limit
+            )
+            stages.mark('memory_load', started)
+
+            # 3. 无历史的首轮问题先查回答缓存（有历史时答案依赖上下文，不走缓存）
+            answer_cache = get_answer_cache()
+            use_cache = answer_cache is not None and not chat_memory.get_all()
+            result, cache_match, embedding, cache_version = None, None, None, None
+            if use_cache:
+                started = time.perf_counter()
+                result, cache_match, embedding, cache_version = await run_blocking(
+                    'vector_store', answer_cache.lookup, request.query
+                )
+                stages.mark('cache_lookup', started)
+
+            # 4. 调用带 Context 和 ChatMemory 的查询方法（此时 ChatStore 中还没有当前问题）
+            coalesced = False
+            if result is None:
+                async def call_agent() -> dict:
+                    async with governor.admit():
+                        stages.agent_started()
+                        succeeded = False
+                        try:
+                            agent_result, _ = await agent.aquery_with_context(
+                                request.query,
+                                ctx,
+                                chat_memory=chat_memory,
+                                on_event=stages.wrap()
+                            )
+                            succeeded = True
+                        finally:
+                            stages.agent_finished(succeeded)
+                    return agent_result
+
+                # 无历史时答案只取决于问题本身，相同问题合并为一次 Agent 调用
+                coalescer = get_query_coalescer()
+                if coalescer is not None and not chat_memory.get_all():
+                    started = time.perf_counter()
+                    result, coalesced = await coalescer.run(coalescer.make_key(request), call_agent)
+                    if coalesced:
+                        stages.mark('coalesce_wait', started)
+                else:
+                    result = await call_agent()
+                if use_cache and not coalesced and result.get('answer'):
+                    cached = {
+                        'answer': result.get('answer'),
+                        'raw_response': str(result.get('raw_response', '')),
+                        'enhancement_applied': result.get('enhancement_applied', False),
+                        'matched_entries': result.get('matched_entries', 0)
+                    }
+                    await run_blocking(
+                        'vector_store', answer_cache.store, request.query, cached, embedding, cache_version
+                    )
+            else:
+                logger.info(f"回答缓存命中（{cache_match}）: {session_id}")
 
-        assistant_msg = ChatMessage(role="assistant", content=result.get('answer', ''))
-        chat_store_service.add_message(session_id, assistant_msg)
+            # 5. 添加用户消息和助手回答到 ChatStore（同一事务，不阻塞事件循环）
+            started = time.perf_counter()
+            await run_blocking(
+                'chat_store', persist_chat_turn,
+                chat_store_service, session_id, request.query, result.get('answer', '')
+            )
+            stages.mark('persist', started)
+        finally:
+            release_session()
 
         return {
             'success': True,
@@ -581,7 +840,10 @@ async def chat_with_context(request: ChatWithContextRequest):
             'answer': result.get('answer'),
             'raw': str(result.get('raw_response', '')),
             'enhancement_applied': result.get('enhancement_applied', False),
-            'matched_entries': result.get('matched_entries', 0)
+            'matched_entries': result.get('matched_entries', 0),
+            'cached': cache_match is not None,
+            'cache_match': cache_match,
+            'coalesced': coalesced
         }
     except HTTPException:
         raise
@@ -590,41 +852,217 @@ async def chat_with_context(request: ChatWithContextRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post('/react_stream')
+async def chat_stream(request: ChatWithContextRequest, http_request: Request):
+    """
+    思考流聊天接口（SSE）
+
+    请求体与 /chat 相同（额外的 stream_thoughts 字段会被忽略）。
+
+    事件类型：meta.start、memory.inject、router.decision、thought、tool_call、
+    tool_result、fallback、final、error、heartbeat。Agent 的中间步骤通过
+    on_event 回调实时推送；客户端断开时取消 Agent 任务。final 事件发送时
+    ChatStore 持久化已在独立任务中启动，不受客户端断开影响。
+
+    同一会话的轮次串行执行；Agent 等待队列已满时直接返回 429。
+    """
+    agent = get_react_agent()
+    chat_store_service = get_chat_store_service()
+    governor = get_agent_governor()
+    governor.check_capacity()
+    session_id = resolve_chat_session(request)
+
+    heartbeat_interval = float(config_snapshot.get('stream.heartbeat_interval', STREAM_HEARTBEAT_INTERVAL))
+    buffer_size = int(config_snapshot.get('stream.buffer_size', STREAM_BUFFER_SIZE))
+    emitter = ThinkingEventEmitter(uuid.uuid4().hex, session_id, buffer_size)
+
+    async def run_agent() -> dict:
+        stages = ChatStageRecorder('react_stream')
+        release_session = await lock_chat_session(request, chat_store_service, governor, session_id)
+        try:
+            token_limit = config_snapshot.get('chat_store.token_limit', 3000)
+            started = time.perf_counter()
+            chat_memory = await run_blocking(
+                'chat_store', get_memory_cache().get_memory, chat_store_service, session_id, token_limit
+            )
+            stages.mark('memory_load', started)
+            await emitter.emit('memory.inject', '', {'memory_count': len(chat_memory.get_all())})
+
+            async with governor.admit():
+                stages.agent_started()
+                succeeded = False
+                try:
+                    result, _ = await agent.aquery_with_context(
+                        request.query,
+                        None,
+                        chat_memory=chat_memory,
+                        on_event=stages.wrap(emitter.emit)
+                    )
+                    succeeded = True
+                finally:
+                    stages.agent_finished(succeeded)
+        except BaseException:
+            release_session()
+            raise
+
+        # 持久化在独立任务中执行，final 发送后客户端断开也不会中断写入；
+        # 会话锁在写入完成后才释放，下一轮读到的记忆包含本轮
+        persist_started = time.perf_counter()
+
+        async def persist() -> None:
+            try:
+                await run_blocking(
+                    'chat_store', persist_chat_turn,
+                    chat_store_service, session_id, request.query, result.get('answer', '')
+                )
+            finally:
+                release_session()
+                chat_stage_duration.observe(
+                    time.perf_counter() - persist_started, endpoint='react_stream', stage='persist'
+                )
+
+        spawn_detached(persist())
+        return result
+
+    async def event_stream() -> AsyncIterator[str]:
+        yield emitter.format(emitter.build('meta.start', request.query, {'query': request.query}))
+        agent_task = asyncio.create_task(run_agent())
+        try:
+            while not (agent_task.done() and emitter.queue.empty()):
+                if await http_request.is_disconnected():
+                    logger.info(f"[{emitter.trace_id}] 客户端断开，取消 Agent 任务")
+                    return
+
+                get_event = asyncio.ensure_future(emitter.queue.get())
+                done, _ = await asyncio.wait(
+                    {get_event, agent_task},
+                    timeout=heartbeat_interval,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if get_event in done:
+                    yield emitter.format(get_event.result())
+                    continue
+                get_event.cancel()
+                if not done:
+                    yield emitter.heartbeat()
+
+            try:
+                result = agent_task.result()
+            except Exception as e:
+                logger.error(f"[{emitter.trace_id}] 思考流 Agent 错误: {e}", exc_info=True)
+                yield emitter.format(emitter.build('error', str(e), {'error_msg': str(e)}))
+                return
+
+            answer = result.get('answer', '')
+            yield emitter.format(emitter.build('final', answer, {
+                'turn_id': session_id,
+                'query_type': result.get('query_type'),
+                'engines_used': result.get('engines_used'),
+                'enhancement_applied': result.get('enhancement_applied', False),
+                'matched_entries': result.get('matched_entries', 0),
+                'fallback_triggered': result.get('fallback_triggered', False)
+            }))
+        finally:
+            if not agent_task.done():
+                agent_task.cancel()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+
 # ========== ChatStore 管理接口 ==========
 
 @router.get('/chat/{session_id}/history')
-async def get_chat_history(session_id: str, limit: int = Query(50, ge=1, le=100)):
+async def get_chat_history(
+    session_id: str,
+    request: Request,
+    response: Response,
+    limit: int = Query(50, ge=1, le=100),
+    before: Optional[int] = Query(None, ge=0),
+    after: Optional[int] = Query(None, ge=-1)
+):
     """
-    获取会话对话历史
+    获取会话对话历史（按消息位置分页，支持条件请求）
 
     Args:
         session_id: 会话ID
         limit: 返回消息数量限制（默认50，最多100）
+        before: 返回该位置之前的消息（向前懒加载，取上一页的 before_cursor）
+        after: 返回该位置之后的消息（增量拉取，取上一页的 after_cursor）
+        不传 before/after 时返回最新的 limit 条
 
     Returns:
-        对话历史列表
+        对话历史列表；每条消息带 index。响应带 ETag，
+        If-None-Match 命中时返回 304
+
+    index / total_count / 游标均以 ChatStore 中实际存在的消息为准：
+    写回失败时 SessionIndex 的 message_count 可能多于实际消息，只用于 ETag。
     """
+    if before is not None and after is not None:
+        raise HTTPException(status_code=400, detail='before 与 after 不能同时使用')
     try:
         chat_store_service = get_chat_store_service()
-        messages = chat_store_service.get_messages(session_id, limit=limit)
+        await run_blocking('chat_store', sync_pending_turns, session_id)
+
+        entry = await run_blocking('filesystem', get_session_index().get, session_id)
+        etag = None
+        if entry is not None:
+            etag = SessionIndex.etag(entry)
+            if request.headers.get('if-none-match') == etag:
+                return Response(status_code=304, headers={'ETag': etag})
+
+        # 只读取请求的切片
+        info = await run_blocking('chat_store', chat_store_service.get_session_info, session_id)
+        total = (info or {}).get('message_count', 0)
+        messages = await run_blocking(
+            'chat_store', chat_store_service.get_messages, session_id,
+            limit=limit, before=before, after=after
+        )
+        if after is not None:
+            start = after + 1
+        elif before is not None:
+            start = max(0, before - len(messages))
+        elif len(messages) < limit:
+            # 未取满一页即为全部消息
+            start = 0
+        else:
+            start = max(0, total - len(messages))
+        # 计数与读取之间可能有新消息写入，总数不小于已读到的最后位置
+        total = max(total, start + len(messages))
 
         # 转换为可序列化的格式
         history = [
             {
+                'index': start + offset,
                 'role': msg.role,
                 'content': msg.content,
-                'additional_kwargs': msg.additional_kwargs
+                'additional_kwargs': public_message_kwargs(msg)
             }
-            for msg in messages
+            for offset, msg in enumerate(messages)
         ]
 
+        if etag is not None:
+            response.headers['ETag'] = etag
+            response.headers['Cache-Control'] = 'private, no-cache'
+
         return {
             'success': True,
             'session_id': session_id,
             'message_count': len(history),
+            'total_count': total,
+            'before_cursor': start if start > 0 else None,
+            'after_cursor': history[-1]['index'] if history else (after if after is not None else start - 1),
             'history': history
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"获取对话历史失败: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
@@ -643,7 +1081,8 @@ async def get_session_info(session_id: str):
     """
     try:
         chat_store_service = get_chat_store_service()
-        info = chat_store_service.get_session_info(session_id)
+        await run_blocking('chat_store', sync_pending_turns, session_id)
+        info = await run_blocking('chat_store', chat_store_service.get_session_info, session_id)
 
         if info is None:
             raise HTTPException(status_code=404, detail='会话不存在')
@@ -673,7 +1112,11 @@ async def clear_chat_history(session_id: str):
     """
     try:
         chat_store_service = get_chat_store_service()
-        success = chat_store_service.clear_session(session_id)
+        await run_blocking('chat_store', sync_pending_turns, session_id)
+        success = await run_blocking('chat_store', chat_store_service.clear_session, session_id)
+        get_memory_cache().invalidate(session_id)
+        if success:
+            await run_blocking('filesystem', index_session, SessionIndex.reset_messages, session_id)
 
         if not success:
             logger.warning(f"清除会话历史失败: {session_id}")
@@ -690,20 +1133,36 @@ async def clear_chat_history(session_id: str):
 
 
 @router.post('/chat/cleanup-expired')
-async def cleanup_expired_chat_sessions():
+async def cleanup_expired_chat_sessions(full: bool = False):
     """
-    清理过期会话（管理员接口）
+    立即清理过期会话（管理员接口）
+
+    按会话索引分批删除过期会话。full=true 时再调用 ChatStore 自身的全量过期清理
+    兜底（处理索引中缺失的会话），并以 ChatStore 为准重建会话索引。
 
     Returns:
         清理的会话数量
     """
     try:
-        chat_store_service = get_chat_store_service()
-        cleaned_count = chat_store_service.cleanup_expired_sessions()
+        result = await get_session_sweeper().sweep()
+        cleaned_count = result['swept']
+
+        if full:
+            chat_store_service = get_chat_store_service()
+            scanned_count = await run_blocking('chat_store', chat_store_service.cleanup_expired_sessions)
+            if scanned_count:
+                get_memory_cache().invalidate()
+            cleaned_count += scanned_count
+
+            snapshot_at = time.time()
+            sessions = await run_blocking('chat_store', chat_store_service.get_all_sessions)
+            await run_blocking('filesystem', get_session_index().reconcile, sessions, snapshot_at)
 
         return {
             'success': True,
             'cleaned_count': cleaned_count,
+            'batches': result['batches'],
+            'duration': result['duration'],
             'message': f'已清理 {cleaned_count} 个过期会话'
         }
 
@@ -713,23 +1172,47 @@ async def cleanup_expired_chat_sessions():
 
 
 @router.get('/chat/sessions/list')
-async def list_all_sessions():
+async def list_all_sessions(
+    sort: str = Query('last_accessed'),
+    order: str = Query('desc', pattern='^(asc|desc)$'),
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    created_after: Optional[float] = None,
+    created_before: Optional[float] = None,
+    accessed_after: Optional[float] = None,
+    accessed_before: Optional[float] = None
+):
     """
-    获取所有会话列表（管理员接口）
+    分页获取会话列表（管理员接口）
+
+    Args:
+        sort: 排序字段 last_accessed（默认）| created_at
+        order: desc（默认）| asc
+        cursor: 上一页返回的 next_cursor
+        limit: 每页数量（默认50，最多500）
+        created_after / created_before: 创建时间范围（Unix 秒）
+        accessed_after / accessed_before: 最后访问时间范围（Unix 秒）
 
     Returns:
-        所有会话的元数据列表
+        当前页会话元数据、近似总数（total_count，超过上限时 count_capped=true）、next_cursor
     """
     try:
-        chat_store_service = get_chat_store_service()
-        sessions = chat_store_service.get_all_sessions()
+        result = await run_blocking(
+            'filesystem', get_session_index().query,
+            sort, order, cursor, limit,
+            created_after, created_before, accessed_after, accessed_before
+        )
 
         return {
             'success': True,
-            'total_count': len(sessions),
-            'sessions': sessions
+            'total_count': result['count'],
+            'count_capped': result['count_capped'],
+            'next_cursor': result['next_cursor'],
+            'sessions': result['sessions']
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"获取会话列表失败: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
@@ -737,17 +1220,37 @@ async def list_all_sessions():
 
 # ========== 统计信息 ==========
 
+@router.get('/metrics')
+async def prometheus_metrics():
+    """Prometheus 文本格式指标（进程内采集，无需外部依赖）"""
+    return Response(content=metrics.render(), media_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 @router.get('/stats')
 async def stats():
     """获取系统统计信息"""
     try:
         vector_service = VectorStoreService.get_instance()
-        vector_stats = vector_service.get_collection_stats()
+        vector_stats = await run_blocking('vector_store', vector_service.get_collection_stats)
+
+        answer_cache = get_answer_cache()
 
         return {
             'success': True,
             'stats': {
                 'vector_store': vector_stats,
+                'answer_cache': answer_cache.stats() if answer_cache else None,
+                'config': config_snapshot.stats(),
+                'chat_turn_writer': turn_writer_stats(),
+                'chat_memory_cache': get_memory_cache().stats(),
+                'session_index': session_index_stats(),
+                'session_sweeper': session_sweeper_stats(),
+                'database_engines': get_engine_registry().stats(),
+                'blocking_executors': get_blocking_executors().stats(),
+                'event_loop': loop_monitor_stats(),
+                'agent_governor': agent_governor_stats(),
+                'query_coalescer': query_coalescer_stats(),
+                'bulk_upload': bulk_upload_stats(),
                 'version': '1.0.0'
             }
         }
@@ -757,22 +1260,49 @@ async def stats():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get('/ready')
+async def readiness():
+    """就绪检查：启动预热完成后返回 200，否则返回 503"""
+    state = get_warmup_state()
+    if not state['ready']:
+        raise HTTPException(status_code=503, detail={
+            'ready': False,
+            **state
+        })
+    return {
+        'success': True,
+        **state
+    }
+
+
+@router.post('/config/reload')
+async def reload_config():
+    """重新加载配置文件（管理员接口）"""
+    try:
+        await asyncio.to_thread(config_snapshot.reload)
+        return {
+            'success': True,
+            'config': config_snapshot.stats()
+        }
+
+    except Exception as e:
+        logger.error(f"重新加载配置失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # ========== 数据库信息 ==========
 @router.get('/database/info')
 async def database_info(
     db_name: Optional[str] = Query(None),
-    db_source: Optional[str] = Query(None)
+    db_source: Optional[str] = Query(None),
+    refresh: bool = Query(False)
 ):
-    """获取数据库信息"""
+    """获取数据库信息（复用引擎实例，表结构按 TTL 缓存；refresh=true 强制重新查询）"""
     try:
-        if db_source == 'clickhouse':
-            from src.engines.clickhouse_engine import ClickHouseEngine
-            engine = ClickHouseEngine(db_name)
-        else:
-            from src.engines.sql_engine import SQLEngine
-            engine = SQLEngine(db_name)
-
-        info = engine.get_table_info()
+        registry = get_engine_registry()
+        if refresh:
+            registry.invalidate(db_source, db_name)
+        info = await registry.get_table_info(db_source, db_name)
 
         return {
             'success': True,
@@ -784,50 +1314,198 @@ async def database_info(
         raise HTTPException(status_code=500, detail=str(e))
 
 
-# ========== 文档列表 ==========
-@router.get('/documents')
-async def list_documents():
-    """列出已上传的文档"""
+@router.delete('/database/info/cache')
+async def invalidate_database_info(
+    db_name: Optional[str] = Query(None),
+    db_source: Optional[str] = Query(None)
+):
+    """失效表结构缓存（不指定参数时清空全部）"""
+    invalidated = get_engine_registry().invalidate(db_source, db_name)
+    return {
+        'success': True,
+        'invalidated': invalidated
+    }
+
+
+@router.post('/database/query')
+async def database_query(request: DatabaseQueryRequest, http_request: Request):
+    """
+    只读查询（流式返回，支持分页）
+
+    请求体:
+    - sql: 单条 SELECT / WITH 查询
+    - db_name / db_source: 与 /database/info 相同
+    - limit: 每页行数（不超过 database.query_max_rows）
+    - cursor: 上一页返回的 next_cursor
+    - format: ndjson（默认）| arrow（Arrow IPC 流，需要 pyarrow）
+    - timeout: 查询超时秒数（不超过 database.query_timeout）
+
+    NDJSON 每行一个对象：{"type": "meta", "columns": [...]}、
+    {"type": "row", "values": [...]}，最后一行为
+    {"type": "end", "row_count": n, "next_cursor": ...} 或 {"type": "error", ...}。
+
+    Arrow 格式为 Arrow IPC 流，每批行写成一个 record batch 立即发送；流的最后
+    是一个不含行的 record batch，其 custom_metadata 给出 row_count 与 next_cursor
+    （无下一页时为空字符串），查询中途失败时改为给出 error（超时另带 timed_out=1）。
+    读取端以该结尾 batch 判断结果是否完整。开始输出前失败的查询（如语法错误）
+    返回 500，超时返回 504。
+    """
+    if request.format not in ('ndjson', 'arrow'):
+        raise HTTPException(status_code=400, detail='format 仅支持 ndjson 或 arrow')
+    statement = validate_readonly_sql(request.sql)
+    offset = decode_query_cursor(statement, request.cursor)
+
+    max_rows = int(config_snapshot.get('database.query_max_rows', 10000))
+    limit = min(request.limit or max_rows, max_rows)
+    max_timeout = float(config_snapshot.get('database.query_timeout', 60))
+    timeout = min(request.timeout or max_timeout, max_timeout)
+    batch_size = int(config_snapshot.get('database.query_batch_size', 500))
+
+    if request.format == 'arrow':
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise HTTPException(status_code=400, detail='服务端未安装 pyarrow，请使用 ndjson 格式')
+
     try:
-        documents_root = get_config_value('vector_store.documents', './data/documents')
-        processed_docs_root = get_config_value(
-            'vector_store.processed_docs', './data/processed_docs'
+        engine = await run_blocking(
+            'database', get_engine_registry().get_engine, request.db_source, request.db_name
         )
-        supported_extensions = {'.pdf', '.md'}
-        files = []
+    except Exception as e:
+        logger.error(f"获取数据库引擎失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-        def collect_files(root_dir: str, storage: str) -> None:
-            if not os.path.exists(root_dir):
-                return
+    producer = QueryRowProducer(
+        engine, request.db_source, statement, offset, limit, batch_size, timeout
+    )
+    spawn_detached(run_blocking('database', producer.run))
+
+    def dumps(payload: dict) -> str:
+        return json.dumps(payload, ensure_ascii=False, default=str) + '\n'
 
-            for dirpath, _, filenames in os.walk(root_dir):
-                for filename in filenames:
-                    file_ext = Path(filename).suffix.lower()
-                    if file_ext not in supported_extensions:
-                        continue
-                    filepath = os.path.join(dirpath, filename)
-                    rel_path = os.path.relpath(filepath, root_dir)
-                    path_parts = rel_path.split(os.sep)
-                    label = path_parts[0] if len(path_parts) > 1 else 'general'
-                    files.append({
-                        'filename': filename,
-                        'label': label,
-                        'relative_path': rel_path,
-                        'storage': storage,
-                        'file_type': file_ext,
-                        'size': os.path.getsize(filepath),
-                        'modified': os.path.getmtime(filepath)
+    async def ndjson_stream() -> AsyncIterator[str]:
+        row_count = 0
+        try:
+            async for kind, payload in producer.batches():
+                if kind == 'columns':
+                    yield dumps({'type': 'meta', 'columns': payload})
+                elif kind == 'rows':
+                    row_count += len(payload)
+                    yield ''.join(dumps({'type': 'row', 'values': row}) for row in payload)
+                elif kind == 'end':
+                    yield dumps({
+                        'type': 'end',
+                        'row_count': row_count,
+                        'next_cursor': encode_query_cursor(statement, offset + row_count) if payload else None
                     })
+                else:
+                    yield dumps({'type': 'error', 'message': payload, 'row_count': row_count})
+                if await http_request.is_disconnected():
+                    return
+        finally:
+            producer.cancel()
+
+    def arrow_batch(columns: list, rows: list, schema=None):
+        arrays = [list(values) for values in zip(*rows)]
+        if schema is None:
+            return pa.RecordBatch.from_arrays([pa.array(values) for values in arrays], names=columns)
+        return pa.RecordBatch.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(arrays, schema)],
+            schema=schema
+        )
 
-        collect_files(documents_root, 'documents')
-        collect_files(processed_docs_root, 'processed_docs')
+    async def arrow_stream(events: AsyncIterator[tuple], columns: list) -> AsyncIterator[bytes]:
+        sink = ArrowChunkSink()
+        writer, schema, row_count = None, None, 0
+        try:
+            async for kind, payload in events:
+                if kind == 'rows':
+                    batch = arrow_batch(columns, payload, schema)
+                    if writer is None:
+                        schema = batch.schema
+                        writer = pa.ipc.new_stream(sink, schema)
+                    writer.write_batch(batch)
+                    row_count += len(payload)
+                    yield sink.take()
+                    if await http_request.is_disconnected():
+                        return
+                    continue
+                if kind == 'end':
+                    metadata = {
+                        'row_count': str(row_count),
+                        'next_cursor': encode_query_cursor(statement, offset + row_count) if payload else ''
+                    }
+                else:
+                    metadata = {'error': payload, 'timed_out': '1' if producer.timed_out else '0'}
+                if writer is None:
+                    schema = pa.schema([(name, pa.null()) for name in columns])
+                    writer = pa.ipc.new_stream(sink, schema)
+                writer.write_batch(pa.RecordBatch.from_pylist([], schema=schema), custom_metadata=metadata)
+                writer.close()
+                yield sink.take()
+                return
+        finally:
+            producer.cancel()
 
-        return {
-            'success': True,
-            'documents': files,
-            'count': len(files)
-        }
+    if request.format == 'arrow':
+        # 先读到列信息再开始响应，查询在输出前失败时仍可返回错误状态码
+        events = producer.batches()
+        try:
+            async for kind, payload in events:
+                if kind == 'columns':
+                    columns = payload
+                    break
+                if kind == 'error':
+                    raise HTTPException(status_code=504 if producer.timed_out else 500, detail=payload)
+            else:
+                raise HTTPException(status_code=500, detail='查询未返回列信息')
+        except BaseException:
+            producer.cancel()
+            raise
+        return StreamingResponse(
+            arrow_stream(events, columns), media_type='application/vnd.apache.arrow.stream'
+        )
+    return StreamingResponse(ndjson_stream(), media_type='application/x-ndjson')
+
+
+# ========== 文档列表 ==========
+@router.get('/documents')
+async def list_documents(
+    label: Optional[str] = Query(None),
+    storage: Optional[str] = Query(None),
+    file_type: Optional[str] = Query(None),
+    order: str = Query('desc', pattern='^(asc|desc)$'),
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(DOCUMENT_PAGE_SIZE, ge=1, le=1000),
+    include_labels: bool = Query(True)
+):
+    """
+    列出已上传的文档（查询文档目录，不遍历文件系统）
+
+    Args:
+        label: 可选，按标签筛选
+        storage: 可选，documents | processed_docs
+        file_type: 可选，按文件类型筛选（.pdf / .md）
+        order: 按修改时间排序方向（默认 desc）
+        cursor: 可选，上一页返回的 next_cursor
+        limit: 每页数量（默认 100，最多 1000）；更多数据通过 next_cursor 翻页
+        include_labels: 是否附带按标签汇总（翻页时可传 false 省略）
+
+    返回:
+        documents、count（筛选后总数）、next_cursor、labels（按标签汇总）
+    """
+    try:
+        catalog = get_document_catalog()
+        page = await run_blocking(
+            'filesystem', catalog.query, label, storage, file_type, order, cursor, limit
+        )
+        result = {'success': True, **page}
+        if include_labels:
+            result['labels'] = await run_blocking('filesystem', catalog.aggregates)
+        return result
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"列出文档失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -5,15 +5,21 @@
 import React from 'react';
 import { MessageList } from './MessageList';
 import { InputBox } from './InputBox';
-import { useChat } from '@/hooks';
+import { useChat, useSession } from '@/hooks';
 import styles from './ChatContainer.module.css';
 
 export const ChatContainer: React.FC = () => {
   const { messages, isLoading, streamStatus, sendMessage, stopStream } = useChat();
+  const { hasEarlierMessages, loadingEarlier, loadEarlierMessages } = useSession();
 
   return (
     <div className={styles.container}>
-      <MessageList messages={messages} />
+      <MessageList
+        messages={messages}
+        hasEarlier={hasEarlierMessages}
+        loadingEarlier={loadingEarlier}
+        onLoadEarlier={loadEarlierMessages}
+      />
       <InputBox
         onSend={sendMessage}
         onStop={stopStream}
@@ -3,7 +3,7 @@
  */
 
 import React from 'react';
-import { Empty } from 'antd';
+import { Button, Empty } from 'antd';
 import { MessageItem } from './MessageItem';
 import { useAutoScroll } from '@/hooks';
 import config from '@/config';
@@ -12,10 +12,19 @@ import styles from './MessageList.module.css';
 
 interface MessageListProps {
   messages: Message[];
+  hasEarlier?: boolean;
+  loadingEarlier?: boolean;
+  onLoadEarlier?: () => void;
 }
 
-export const MessageList: React.FC<MessageListProps> = ({ messages }) => {
-  const messagesEndRef = useAutoScroll(messages.length);
+export const MessageList: React.FC<MessageListProps> = ({
+  messages,
+  hasEarlier = false,
+  loadingEarlier = false,
+  onLoadEarlier,
+}) => {
+  // 以最后一条消息为依据滚动，向前加载历史时不跳到底部
+  const messagesEndRef = useAutoScroll(messages[messages.length - 1]?.id);
 
   if (messages.length === 0) {
     return (
@@ -34,6 +43,13 @@ export const MessageList: React.FC<MessageListProps> = ({ messages }) => {
         className={styles.messageList}
         style={{ maxWidth: config.ui.containerMaxWidth.message }}
       >
+        {hasEarlier && onLoadEarlier && (
+          <div className={styles.loadEarlier}>
+            <Button type="link" size="small" onClick={onLoadEarlier} loading={loadingEarlier}>
+              加载更早的消息
+            </Button>
+          </div>
+        )}
         {messages.map((message) => (
           <MessageItem key={message.id} message={message} />
         ))}
@@ -86,6 +86,10 @@ const getFileIcon = (fileType: string) => {
 export const DocumentManagement: React.FC = () => {
   const [documents, setDocuments] = useState<Document[]>([]);
   const [loading, setLoading] = useState(false);
+  // 分页游标：列表按需逐页加载，nextCursor 为空表示已加载完
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [totalCount, setTotalCount] = useState(0);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [uploadModalOpen, setUploadModalOpen] = useState(false);
 
   // 任务队列状态
@@ -98,6 +102,8 @@ export const DocumentManagement: React.FC = () => {
       const response = await documentApi.list();
       if (response.success) {
         setDocuments(response.documents);
+        setNextCursor(response.next_cursor ?? null);
+        setTotalCount(response.count);
       }
     } catch (error) {
       console.error('Failed to fetch documents:', error);
@@ -106,6 +112,25 @@ export const DocumentManagement: React.FC = () => {
     }
   }, []);
 
+  // 加载下一页（标签汇总只在第一页请求）
+  const loadMoreDocuments = useCallback(async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const response = await documentApi.list({ cursor: nextCursor, include_labels: false });
+      if (response.success) {
+        setDocuments(prev => [...prev, ...response.documents]);
+        setNextCursor(response.next_cursor ?? null);
+        setTotalCount(response.count);
+      }
+    } catch (error) {
+      message.error('加载更多文档失败');
+      console.error('Failed to load more documents:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  }, [nextCursor]);
+
   // 更新任务状态（通用）
   const updateTaskStatus = useCallback((taskId: string, updates: Partial<UnifiedTaskInfo>) => {
     setTasks(prev => {
@@ -351,7 +376,7 @@ export const DocumentManagement: React.FC = () => {
         <div className={styles.toolbarLeft}>
           <Text className={styles.title}>文档库</Text>
           <Text type="secondary" className={styles.count}>
-            {documents.length} 个文档
+            {totalCount} 个文档
           </Text>
         </div>
         <Space className={styles.actionButtons}>
@@ -401,7 +426,7 @@ export const DocumentManagement: React.FC = () => {
           pagination={{
             pageSize: 10,
             showSizeChanger: true,
-            showTotal: (total) => `共 ${total} 个文档`,
+            showTotal: (total) => `已加载 ${total} / 共 ${totalCount} 个文档`,
           }}
           locale={{
             emptyText: (
@@ -413,6 +438,13 @@ export const DocumentManagement: React.FC = () => {
           }}
           className={styles.table}
         />
+        {nextCursor && (
+          <div className={styles.loadMore}>
+            <Button onClick={loadMoreDocuments} loading={loadingMore}>
+              加载更多
+            </Button>
+          </div>
+        )}
       </div>
 
       {/* 上传弹窗 */}
@@ -22,6 +22,8 @@ export const config = {
     documentUpload: import.meta.env.VITE_DOCUMENT_UPLOAD_ENDPOINT || '/upload',
     documentList: import.meta.env.VITE_DOCUMENT_LIST_ENDPOINT || '/documents',
     uploadStatus: import.meta.env.VITE_UPLOAD_STATUS_ENDPOINT || '/upload/status',  // 会拼接 /{taskId}
+    bulkUpload: import.meta.env.VITE_BULK_UPLOAD_ENDPOINT || '/upload/bulk',  // 查询进度时拼接 /{taskId}
+    taskEvents: import.meta.env.VITE_TASK_EVENTS_ENDPOINT || '/tasks/events',  // SSE 任务进度推送
 
     // 向量库更新相关
     updateIndex: import.meta.env.VITE_UPDATE_INDEX_ENDPOINT || '/api/update_index',
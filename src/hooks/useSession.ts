@@ -2,14 +2,34 @@
  * 会话管理 Hook
  */
 
-import { useCallback, useEffect } from 'react';
+import { useCallback, useEffect, useState } from 'react';
 import { message as antdMessage } from 'antd';
 import { useSessionStore } from '@/stores/sessionStore';
 import { useChatStore } from '@/stores/chatStore';
 import { chatApi } from '@/services';
-import { Message } from '@/types';
+import { Message, SessionHistoryResponse } from '@/types';
 import logger from '@/utils/logger';
 
+// 使用时间戳+索引生成唯一ID，避免重新加载时ID冲突；更早的分页带上游标区分
+const toMessages = (
+  sessionId: string,
+  history: SessionHistoryResponse['history'],
+  before?: number
+): Message[] => {
+  const prefix = before === undefined ? sessionId : `${sessionId}-${before}`;
+  const fallbackTimestamp = Date.now();
+  return history.map((item, index) => {
+    const timestamp = item.timestamp ?? fallbackTimestamp;
+    return {
+      id: `${prefix}-${timestamp}-${index}`,
+      role: item.role as 'user' | 'assistant',
+      content: item.content,
+      timestamp,
+      metadata: item.metadata as Message['metadata'],
+    };
+  });
+};
+
 export function useSession() {
   const {
     sessions,
@@ -20,7 +40,8 @@ export function useSession() {
     updateSession,
   } = useSessionStore();
 
-  const { setMessages, clearMessages } = useChatStore();
+  const { setMessages, prependMessages, clearMessages, historyCursor, setHistoryCursor } = useChatStore();
+  const [loadingEarlier, setLoadingEarlier] = useState(false);
 
   // 初始化时加载会话列表
   useEffect(() => {
@@ -38,23 +59,11 @@ export function useSession() {
         setCurrentSession(sessionId);
         clearMessages();
 
-        // 加载会话历史
+        // 加载会话历史（最新一页，更早的消息由 loadEarlierMessages 按游标加载）
         const response = await chatApi.getSessionHistory(sessionId);
 
-        // 使用时间戳+索引生成唯一ID，避免重新加载时ID冲突
-        const fallbackTimestamp = Date.now();
-        const messages: Message[] = response.history.map((item, index) => {
-          const timestamp = item.timestamp ?? fallbackTimestamp;
-          return {
-            id: `${sessionId}-${timestamp}-${index}`,
-            role: item.role as 'user' | 'assistant',
-            content: item.content,
-            timestamp,
-            metadata: item.metadata as Message['metadata'],
-          };
-        });
-
-        setMessages(messages);
+        setMessages(toMessages(sessionId, response.history));
+        setHistoryCursor(response.before_cursor ?? null);
 
         // 更新最后访问时间
         updateSession(sessionId, { last_accessed: Date.now() });
@@ -65,9 +74,33 @@ export function useSession() {
         antdMessage.error('加载会话失败');
       }
     },
-    [currentSessionId, setCurrentSession, clearMessages, setMessages, updateSession]
+    [currentSessionId, setCurrentSession, clearMessages, setMessages, setHistoryCursor, updateSession]
   );
 
+  /**
+   * 加载当前会话更早的消息
+   */
+  const loadEarlierMessages = useCallback(async () => {
+    if (!currentSessionId || historyCursor === null || loadingEarlier) return;
+
+    const sessionId = currentSessionId;
+    const before = historyCursor;
+    setLoadingEarlier(true);
+    try {
+      const response = await chatApi.getSessionHistory(sessionId, undefined, before);
+      // 加载期间已切换会话时丢弃结果
+      if (useSessionStore.getState().currentSessionId !== sessionId) return;
+
+      prependMessages(toMessages(sessionId, response.history, before));
+      setHistoryCursor(response.before_cursor ?? null);
+    } catch (error) {
+      logger.error('Failed to load earlier messages', error);
+      antdMessage.error('加载更早的消息失败');
+    } finally {
+      setLoadingEarlier(false);
+    }
+  }, [currentSessionId, historyCursor, loadingEarlier, prependMessages, setHistoryCursor]);
+
   /**
    * 删除会话
    */
@@ -106,6 +139,9 @@ export function useSession() {
     switchSession,
     deleteSession,
     startNewChat,
+    hasEarlierMessages: historyCursor !== null,
+    loadingEarlier,
+    loadEarlierMessages,
   };
 }
 
@@ -123,12 +123,17 @@ export const chatApi = {
   /**
    * 获取会话历史
    */
-  async getSessionHistory(sessionId: string, limit?: number): Promise<SessionHistoryResponse> {
-    logger.debug('Fetching chat history', { sessionId, limit });
+  async getSessionHistory(
+    sessionId: string,
+    limit?: number,
+    before?: number
+  ): Promise<SessionHistoryResponse> {
+    logger.debug('Fetching chat history', { sessionId, limit, before });
+    // 服务端返回 ETag，浏览器缓存会自动带 If-None-Match 重新验证
     const response = await apiClient.get<ChatHistoryResponse>(
       `${config.endpoints.contextInfo}/${sessionId}/history`,
       {
-        params: { limit },
+        params: { limit, before },
       }
     );
 
@@ -153,6 +158,7 @@ export const chatApi = {
       history: messages,
       count: typeof response.message_count === 'number' ? response.message_count : messages.length,
       message_count: response.message_count,
+      before_cursor: response.before_cursor,
     };
   },
 
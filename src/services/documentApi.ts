@@ -5,13 +5,73 @@
 import apiClient from './apiClient';
 import {
   UploadDocumentResponse,
+  ListDocumentsParams,
   ListDocumentsResponse,
   UploadTaskStatus,
+  BulkUploadResponse,
+  BulkUploadTaskStatus,
   UpdateIndexResponse,
   UpdateTaskStatus,
 } from '@/types';
 import config from '@/config';
 import logger from '@/utils/logger';
+import { joinUrl } from '@/utils/urlHelper';
+
+type TaskKind = 'upload' | 'update_index' | 'bulk_upload';
+
+const isTerminalStatus = (status: string): boolean =>
+  status === 'completed' || status === 'failed';
+
+/**
+ * 通过 SSE 订阅任务进度（服务端推送，替代定时轮询）
+ * 连接失败或中途断开时 reject，由调用方降级为轮询
+ */
+function watchTaskEvents<T extends { status: string }>(
+  kind: TaskKind,
+  taskId: string,
+  onProgress?: (status: T) => void
+): Promise<T> {
+  return new Promise((resolve, reject) => {
+    const query = new URLSearchParams({ kind, task_ids: taskId });
+    const url = `${joinUrl(config.apiBaseUrl, config.endpoints.taskEvents)}?${query}`;
+    const source = new EventSource(url);
+    let lastStatus: T | null = null;
+
+    source.addEventListener('progress', (event) => {
+      try {
+        const status = JSON.parse((event as MessageEvent<string>).data) as T;
+        lastStatus = status;
+        onProgress?.(status);
+
+        if (isTerminalStatus(status.status)) {
+          source.close();
+          resolve(status);
+        }
+      } catch (error) {
+        logger.error('Failed to parse task event', error);
+      }
+    });
+
+    source.addEventListener('missing', () => {
+      source.close();
+      reject(new Error(`Task ${taskId} not found`));
+    });
+
+    source.addEventListener('done', () => {
+      source.close();
+      if (lastStatus) {
+        resolve(lastStatus);
+      } else {
+        reject(new Error('Task event stream closed without status'));
+      }
+    });
+
+    source.onerror = () => {
+      source.close();
+      reject(new Error('Task event stream disconnected'));
+    };
+  });
+}
 
 export const documentApi = {
   /**
@@ -39,11 +99,57 @@ export const documentApi = {
   },
 
   /**
-   * 获取文档列表
+   * 批量上传文档
+   * @param files 多个文件，或单个 zip/tar 压缩包
+   * @param label 文档标签，默认为 'general'
    */
-  async list(): Promise<ListDocumentsResponse> {
-    logger.debug('Fetching document list');
-    return apiClient.get<ListDocumentsResponse>(config.endpoints.documentList);
+  async uploadBulk(files: File[], label: string = 'general'): Promise<BulkUploadResponse> {
+    logger.info('Uploading documents in bulk', { count: files.length, label });
+
+    const formData = new FormData();
+    files.forEach((file) => formData.append('files', file));
+    formData.append('label', label);
+
+    return apiClient.post<BulkUploadResponse>(
+      config.endpoints.bulkUpload,
+      formData,
+      {
+        headers: {
+          'Content-Type': 'multipart/form-data',
+        },
+        timeout: config.timeout.upload,
+      }
+    );
+  },
+
+  /**
+   * 查询批量上传任务汇总进度
+   * @param includeChildren 是否附带每个文件的当前状态
+   */
+  async getBulkUploadStatus(taskId: string, includeChildren: boolean = false): Promise<BulkUploadTaskStatus> {
+    logger.debug('Fetching bulk upload status', { taskId });
+    return apiClient.get<BulkUploadTaskStatus>(`${config.endpoints.bulkUpload}/${taskId}`, {
+      params: { include_children: includeChildren },
+    });
+  },
+
+  /**
+   * 跟踪批量上传进度（SSE 推送父任务汇总）
+   */
+  async watchBulkUpload(
+    taskId: string,
+    onProgress?: (status: BulkUploadTaskStatus) => void
+  ): Promise<BulkUploadTaskStatus> {
+    return watchTaskEvents<BulkUploadTaskStatus>('bulk_upload', taskId, onProgress);
+  },
+
+  /**
+   * 获取文档列表（单页）
+   * @param params 可选的筛选/分页参数，不传 limit 时返回第一页（100 条）
+   */
+  async list(params?: ListDocumentsParams): Promise<ListDocumentsResponse> {
+    logger.debug('Fetching document list', params);
+    return apiClient.get<ListDocumentsResponse>(config.endpoints.documentList, { params });
   },
 
   /**
@@ -55,7 +161,8 @@ export const documentApi = {
   },
 
   /**
-   * 轮询上传状态（工具方法）
+   * 跟踪上传状态（工具方法）
+   * 优先使用 SSE 推送，不支持或连接失败时降级为轮询
    * @param taskId 任务ID
    * @param onProgress 进度回调
    * @param interval 轮询间隔(ms)，默认 2000
@@ -65,6 +172,15 @@ export const documentApi = {
     onProgress?: (status: UploadTaskStatus) => void,
     interval: number = 2000
   ): Promise<UploadTaskStatus> {
+    if (typeof EventSource !== 'undefined') {
+      try {
+        logger.info('Subscribing to upload task events', { taskId });
+        return await watchTaskEvents<UploadTaskStatus>('upload', taskId, onProgress);
+      } catch (error) {
+        logger.warn('Upload task events unavailable, falling back to polling', error);
+      }
+    }
+
     logger.info('Starting upload status polling', { taskId });
 
     return new Promise((resolve, reject) => {
@@ -115,7 +231,8 @@ export const documentApi = {
   },
 
   /**
-   * 轮询更新任务状态
+   * 跟踪更新任务状态
+   * 优先使用 SSE 推送，不支持或连接失败时降级为轮询
    * @param taskId 任务ID
    * @param onProgress 进度回调
    * @param interval 轮询间隔(ms)，默认 2000
@@ -125,6 +242,15 @@ export const documentApi = {
     onProgress?: (status: UpdateTaskStatus) => void,
     interval: number = 2000
   ): Promise<UpdateTaskStatus> {
+    if (typeof EventSource !== 'undefined') {
+      try {
+        logger.info('Subscribing to update task events', { taskId });
+        return await watchTaskEvents<UpdateTaskStatus>('update_index', taskId, onProgress);
+      } catch (error) {
+        logger.warn('Update task events unavailable, falling back to polling', error);
+      }
+    }
+
     logger.info('Starting update status polling', { taskId });
 
     return new Promise((resolve, reject) => {
@@ -10,6 +10,7 @@ import { generateId } from '@/utils/helpers';
 interface ChatState {
   messages: Message[];
   isLoading: boolean;
+  historyCursor: number | null;               // 加载更早消息的游标（null 表示已到开头）
 
   // 流式状态
   streamingMessageId: string | null;          // 当前流式消息ID
@@ -23,6 +24,8 @@ interface ChatState {
   removeMessage: (id: string) => void;
   clearMessages: () => void;
   setMessages: (messages: Message[]) => void;
+  prependMessages: (messages: Message[]) => void;
+  setHistoryCursor: (cursor: number | null) => void;
   setLoading: (loading: boolean) => void;
 
   // 流式方法
@@ -37,6 +40,7 @@ interface ChatState {
 export const useChatStore = create<ChatState>((set, get) => ({
   messages: [],
   isLoading: false,
+  historyCursor: null,
 
   // 流式状态初始化
   streamingMessageId: null,
@@ -73,13 +77,23 @@ export const useChatStore = create<ChatState>((set, get) => ({
   },
 
   clearMessages: () => {
-    set({ messages: [] });
+    set({ messages: [], historyCursor: null });
   },
 
   setMessages: (messages) => {
     set({ messages });
   },
 
+  prependMessages: (messages) => {
+    set((state) => ({
+      messages: [...messages, ...state.messages],
+    }));
+  },
+
+  setHistoryCursor: (cursor) => {
+    set({ historyCursor: cursor });
+  },
+
   setLoading: (loading) => {
     set({ isLoading: loading });
   },
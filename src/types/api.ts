@@ -22,6 +22,9 @@ export interface ChatResponse {
   enhancement_applied?: boolean;
   matched_entries?: number;
   raw?: string;
+  cached?: boolean;                          // 是否命中回答缓存
+  cache_match?: 'exact' | 'semantic' | null; // 缓存匹配方式
+  coalesced?: boolean;                       // 是否复用了同一问题正在进行的执行结果
   error?: string;
 }
 
@@ -47,10 +50,28 @@ export interface Document {
   modified: number;
 }
 
+export interface ListDocumentsParams {
+  label?: string;
+  storage?: Document['storage'];
+  file_type?: string;
+  order?: 'asc' | 'desc';   // 按修改时间排序
+  cursor?: string;          // 上一页返回的 next_cursor
+  limit?: number;           // 每页数量（默认 100，最多 1000）
+  include_labels?: boolean; // 是否附带按标签汇总（默认 true）
+}
+
+export interface DocumentLabelSummary {
+  label: string;
+  count: number;
+  size: number;
+}
+
 export interface ListDocumentsResponse {
   success: boolean;
   documents: Document[];
-  count: number;
+  count: number;                     // 筛选后的总数
+  next_cursor?: string | null;       // 下一页游标（无更多数据时为 null）
+  labels?: DocumentLabelSummary[];   // 按标签汇总
 }
 
 export interface HealthResponse {
@@ -85,6 +106,7 @@ export interface SessionHistoryResponse {
   }>;
   count?: number;
   message_count?: number;
+  before_cursor?: number | null;
 }
 
 // /chat/{session_id}/history 接口
@@ -92,7 +114,11 @@ export interface ChatHistoryResponse {
   success: boolean;
   session_id: string;
   message_count: number;
+  total_count?: number;            // 会话消息总数
+  before_cursor?: number | null;   // 加载更早消息时作为 before 传入（null 表示已到开头）
+  after_cursor?: number;           // 增量拉取新消息时作为 after 传入
   history: Array<{
+    index?: number;
     role: string;
     content: string;
     additional_kwargs?: Record<string, unknown>;
@@ -119,10 +145,57 @@ export interface UploadTaskStatus {
     message: string;
     timestamp: string;
   }>;
-  doc_count?: number;
+  doc_count?: number | null;       // 多文件索引批次中无法得知单个文件的文档数时为 null
   total_count?: number;
   mode?: string;
+  parent_id?: string;      // 批量上传子任务所属的父任务ID
+  completed_at?: string;
+}
+
+// /upload/bulk 接口
+export interface BulkUploadResponse {
+  success: boolean;
+  message?: string;
+  task_id: string;                 // 父任务ID
+  label: string;
+  file_count: number;
+  skipped: Array<{ name: string; reason: string }>;
+  files: Array<{ task_id: string; filename: string }>;  // 每个文件的上传子任务
+  status_url?: string;
+}
+
+// /upload/bulk/{task_id} 接口
+export interface BulkUploadTaskStatus {
+  success: boolean;
+  task_id: string;
+  status: 'pending' | 'processing' | 'completed' | 'failed';
+  stage: string | null;
+  label: string;
+  archive?: string | null;
+  created_at: string;
   completed_at?: string;
+  summary: {
+    total: number;
+    completed: number;
+    failed: number;
+    in_progress: number;
+  };
+  doc_count: number;               // 已知文档数的文件之和
+  doc_count_unattributed: number;  // 文档数只有批次总数、未计入 doc_count 的文件数
+  index_commits: number;           // 索引提交批次数
+  failures: Array<{
+    task_id: string;
+    filename: string;
+    stage: string | null;
+    message: string | null;
+  }>;
+  skipped: Array<{ name: string; reason: string }>;
+  children: Array<{
+    task_id: string;
+    filename: string;
+    status?: UploadTaskStatus['status'] | null;  // include_children=true 时返回
+    stage?: string | null;
+  }>;
 }
 
 // /context/{session_id}/info 接口